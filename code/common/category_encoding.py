@@ -0,0 +1,58 @@
+"""Integer codes of the categorical features, learned at training time and shared with serving.
+
+The encoder keeps one list of values per column. The code of a value is its position in the list, so the model sees
+dense int32 columns instead of one-hot frames, and the same lists are saved next to the model and applied in batch
+prediction and in the online service. Nulls, values rarer than min_count in the training data and values unseen at
+training time all get UNKNOWN_CODE.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+UNKNOWN_CODE = -1
+# File name of the saved encoder, in the artifacts of the training runs
+ENCODER_FILE = "category_encoder.json"
+
+
+class CategoryEncoder:
+    def __init__(self, categories: dict = None) -> None:
+        self.categories = {column: pd.Index(values, dtype=object) for column, values in (categories or {}).items()}
+
+    def fit(self, df: pd.DataFrame, columns: list, min_count: int = 1) -> "CategoryEncoder":
+        """Learn the values of columns in df.
+
+        The most frequent values get the smallest codes, ties are broken by value, so fitting the same data always
+        gives the same codes.
+        """
+        for column in columns:
+            counts = df[column].value_counts(dropna=True)
+            counts = counts.loc[counts >= min_count]
+            values = pd.DataFrame({"value": counts.index.astype(str), "count": counts.to_numpy()})
+            values = values.sort_values(["count", "value"], ascending=[False, True], kind="stable")
+            self.categories[column] = pd.Index(values["value"], dtype=object)
+        return self
+
+    def encode(self, column: str, values) -> np.ndarray:
+        # Hash the distinct values of the column once, then look their codes up in bulk
+        codes, uniques = pd.factorize(values)
+        unique_codes = self.categories[column].get_indexer(np.asarray(uniques, dtype=object))
+        # factorize gives -1 to nulls, which picks the appended UNKNOWN_CODE
+        return np.append(unique_codes, UNKNOWN_CODE).astype(np.int32)[codes]
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Replace the encoded columns of df by their int32 codes, the other columns are left as they are."""
+        codes = {column: self.encode(column, df[column]) for column in self.categories if column in df.columns}
+        return df.assign(**codes)
+
+    def to_dict(self) -> dict:
+        return {column: values.tolist() for column, values in self.categories.items()}
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=4, ensure_ascii=False)
+
+    @staticmethod
+    def load(path) -> "CategoryEncoder":
+        with open(path, "r", encoding="utf-8") as f:
+            return CategoryEncoder(json.load(f))
@@ -0,0 +1,248 @@
+"""Declarative data contracts, checked in one vectorized pass over the data, chunk by chunk.
+
+A contract is a list of rules, each a dict with the column, the check and its thresholds:
+
+    {"column": "area", "check": "range", "min": 0, "max": 10000, "max_rate": 0.01}
+    {"column": "area", "check": "null_rate", "max": 0.05}
+    {"column": "district", "check": "cardinality", "min": 1, "max": 1000}
+    {"column": "area", "check": "psi", "max": 0.25, "blocking": False}
+
+- range: share of the non-null values outside [min, max], at most max_rate (0 by default). Either bound can be omitted.
+- null_rate: share of null values, at most max
+- cardinality: number of distinct non-null values, between min and max
+- psi: population stability index of the column against a reference profile, see build_reference, at most max
+
+Every chunk is reduced to a few counts per column: nulls, values out of range, distinct values and histogram counts.
+The counts of the numeric columns come from one float matrix of the chunk, and the rules are decided on the counts,
+so a larger contract adds no pass over the data. Rules are blocking unless "blocking" is False. When the total number
+of rows is known, the evaluation stops after the first chunk that makes a blocking range, null-rate or maximum
+cardinality rule fail, whatever the rows left.
+"""
+import numpy as np
+import pandas as pd
+
+CHECKS = ("range", "null_rate", "cardinality", "psi")
+# Floor of the bin shares in the PSI, so that an empty bin does not make it infinite
+PSI_EPSILON = 1e-4
+
+
+def _is_numeric(series: pd.Series) -> bool:
+    # Categorical columns are counted by value, even with numeric categories
+    return pd.api.types.is_numeric_dtype(series.dtype)
+
+
+def iter_chunks(df: pd.DataFrame, chunk_rows: int):
+    """Slices of chunk_rows rows of df, without copying it."""
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def build_reference(df: pd.DataFrame, columns: list, num_bins: int = 10) -> dict:
+    """Profile of the distribution of columns, the reference of the psi rules of a later evaluation.
+
+    Numeric columns are cut into num_bins bins at their quantiles, the other columns are profiled by value. Nulls are
+    left out, the null-rate rules cover them.
+    """
+    reference = {}
+    for column in columns:
+        values = df[column].dropna()
+        if _is_numeric(df[column]):
+            values = values.to_numpy(dtype=np.float64)
+            edges = np.array([])
+            if len(values) > 0:
+                edges = np.unique(np.quantile(values, np.linspace(0, 1, num_bins + 1)[1:-1]))
+            counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+            shares = counts / max(len(values), 1)
+            reference[column] = {"edges": edges.tolist(), "shares": shares.tolist()}
+        else:
+            shares = values.astype(str).value_counts(normalize=True)
+            reference[column] = {"values": shares.index.tolist(), "shares": shares.tolist()}
+    return reference
+
+
+def population_stability_index(expected, actual) -> float:
+    expected = np.maximum(np.asarray(expected, dtype=np.float64), PSI_EPSILON)
+    actual = np.maximum(np.asarray(actual, dtype=np.float64), PSI_EPSILON)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+class _Counts:
+    """The counts of the rules of a contract, accumulated over the chunks."""
+
+    def __init__(self, chunk: pd.DataFrame, rules: list, reference: dict) -> None:
+        columns = list(dict.fromkeys(rule["column"] for rule in rules if rule["column"] in chunk.columns))
+        self.missing = {rule["column"] for rule in rules} - set(columns)
+        self.numeric = [column for column in columns if _is_numeric(chunk[column])]
+        self.other = [column for column in columns if column not in self.numeric]
+        numeric_index = {column: i for i, column in enumerate(self.numeric)}
+
+        for rule in rules:
+            if rule["check"] == "range" and rule["column"] in self.other:
+                raise ValueError(f"Range rule of the non-numeric column {rule['column']!r}")
+
+        self.rows = 0
+        self.nulls = dict.fromkeys(columns, 0)
+
+        # One column of the matrix of range checks per range rule
+        range_rules = [rule for rule in rules if rule["check"] == "range" and rule["column"] in numeric_index]
+        self.range_index = np.array([numeric_index[rule["column"]] for rule in range_rules], dtype=np.intp)
+        self.range_low = np.array([rule.get("min", -np.inf) for rule in range_rules], dtype=np.float64)
+        self.range_high = np.array([rule.get("max", np.inf) for rule in range_rules], dtype=np.float64)
+        self.out_of_range = np.zeros(len(range_rules), dtype=np.int64)
+        self.range_position = {id(rule): i for i, rule in enumerate(range_rules)}
+
+        distinct = {rule["column"] for rule in rules if rule["check"] == "cardinality"}
+        binned = {rule["column"] for rule in rules if rule["check"] == "psi" and rule["column"] in reference}
+        # Numeric columns: sorted distinct values and counts per reference bin
+        self.distinct = {column: np.array([]) for column in self.numeric if column in distinct}
+        self.edges = {column: np.asarray(reference[column]["edges"], dtype=np.float64)
+                      for column in self.numeric if column in binned}
+        self.bins = {column: np.zeros(len(edges) + 1, dtype=np.int64) for column, edges in self.edges.items()}
+        # Other columns: counts per value, which give both the cardinality and the PSI
+        self.value_counts = {column: pd.Series(dtype=np.int64) for column in self.other
+                             if column in distinct or column in binned}
+
+    def update(self, chunk: pd.DataFrame):
+        self.rows += len(chunk)
+
+        if self.numeric:
+            values = chunk[self.numeric].to_numpy(dtype=np.float64, na_value=np.nan)
+            for column, nulls in zip(self.numeric, np.isnan(values).sum(axis=0)):
+                self.nulls[column] += int(nulls)
+            # NaN compares False, so nulls are never out of range
+            checked = values[:, self.range_index]
+            self.out_of_range += ((checked < self.range_low) | (checked > self.range_high)).sum(axis=0)
+
+            for column in self.distinct.keys() | self.edges.keys():
+                column_values = values[:, self.numeric.index(column)]
+                column_values = column_values[~np.isnan(column_values)]
+                if column in self.distinct:
+                    self.distinct[column] = np.union1d(self.distinct[column], column_values)
+                if column in self.edges:
+                    bins = np.searchsorted(self.edges[column], column_values, side="right")
+                    self.bins[column] += np.bincount(bins, minlength=len(self.bins[column]))
+
+        if self.other:
+            for column, nulls in chunk[self.other].isna().sum().items():
+                self.nulls[column] += int(nulls)
+            for column in self.value_counts:
+                # Categorical columns are counted on their codes
+                counts = chunk[column].value_counts(sort=False)
+                counts.index = counts.index.astype(str)
+                self.value_counts[column] = self.value_counts[column].add(counts, fill_value=0)
+
+    def cardinality(self, column: str) -> int:
+        if column in self.distinct:
+            return len(self.distinct[column])
+        return int((self.value_counts[column] > 0).sum())
+
+    def shares(self, column: str, reference: dict) -> tuple:
+        """Reference and actual shares of the bins of column, unseen values of other columns in a last bin."""
+        if column in self.bins:
+            counts = self.bins[column]
+            expected = np.asarray(reference["shares"])
+        else:
+            counts = self.value_counts[column].reindex(reference["values"], fill_value=0).to_numpy()
+            counts = np.append(counts, self.value_counts[column].sum() - counts.sum())
+            expected = np.append(reference["shares"], 0)
+        return expected, counts / max(counts.sum(), 1)
+
+
+class DataContract:
+    def __init__(self, rules: list, reference: dict = None) -> None:
+        """
+        Args:
+            rules (list): Rule dicts, see the module docstring
+            reference (dict, optional): Profile of the reference data of the psi rules, see build_reference. Without
+                a profile of their column, psi rules are skipped.
+        """
+        for rule in rules:
+            if rule.get("check") not in CHECKS:
+                raise ValueError(f"Unknown check of rule {rule}, expected one of {CHECKS}")
+        self.rules = rules
+        self.reference = reference or {}
+
+    def evaluate(self, chunks, total_rows: int = None) -> dict:
+        """Check the rules on the chunks, an iterable of dataframes with the same columns.
+
+        Args:
+            chunks: Dataframes, e.g. from iter_chunks
+            total_rows (int, optional): Number of rows of all the chunks, which allows stopping early
+
+        Returns:
+            dict: The JSON-serializable report, with the status "passed" or "failed", the number of rows checked,
+                whether all the chunks were checked and the result of every rule
+        """
+        counts = None
+        complete = True
+        for chunk in chunks:
+            if counts is None:
+                counts = _Counts(chunk, self.rules, self.reference)
+                if any(self._blocking(rule) and rule["column"] in counts.missing for rule in self.rules):
+                    complete = False
+                    break
+            counts.update(chunk)
+            if total_rows is not None and counts.rows < total_rows and self._fails_early(counts, total_rows):
+                complete = False
+                break
+
+        results = [self._result(rule, counts, complete) for rule in self.rules]
+        failures = [result for result in results if result["status"] == "failed" and result["blocking"]]
+        return {
+            "status": "failed" if failures else "passed",
+            "rows": counts.rows if counts is not None else 0,
+            "complete": complete,
+            "failures": failures,
+            "warnings": [result for result in results if result["status"] == "failed" and not result["blocking"]],
+            "rules": results,
+        }
+
+    @staticmethod
+    def _blocking(rule: dict) -> bool:
+        return rule.get("blocking", True)
+
+    def _fails_early(self, counts: _Counts, total_rows: int) -> bool:
+        # Whatever the rows left, these rules fail once their counts are this high
+        for rule in self.rules:
+            if not self._blocking(rule) or rule["column"] in counts.missing:
+                continue
+            column, check = rule["column"], rule["check"]
+            if check == "null_rate" and counts.nulls[column] > rule["max"] * total_rows:
+                return True
+            if check == "range":
+                out_of_range = counts.out_of_range[counts.range_position[id(rule)]]
+                if out_of_range > rule.get("max_rate", 0) * (total_rows - counts.nulls[column]):
+                    return True
+            if check == "cardinality" and "max" in rule and counts.cardinality(column) > rule["max"]:
+                return True
+        return False
+
+    def _result(self, rule: dict, counts: _Counts, complete: bool) -> dict:
+        result = dict(rule, blocking=self._blocking(rule), value=None)
+        column, check = rule["column"], rule["check"]
+        if counts is None:
+            return dict(result, status="skipped", reason="no data")
+        if column in counts.missing:
+            return dict(result, status="failed", reason="column not found")
+
+        if check == "null_rate":
+            value = counts.nulls[column] / max(counts.rows, 1)
+            passed = value <= rule["max"]
+        elif check == "range":
+            non_null = counts.rows - counts.nulls[column]
+            value = counts.out_of_range[counts.range_position[id(rule)]] / max(non_null, 1)
+            passed = value <= rule.get("max_rate", 0)
+        elif check == "cardinality":
+            value = counts.cardinality(column)
+            passed = rule.get("min", 0) <= value <= rule.get("max", np.inf)
+        else:
+            if column not in self.reference:
+                return dict(result, status="skipped", reason="no reference profile")
+            value = population_stability_index(*counts.shares(column, self.reference[column]))
+            passed = value <= rule["max"]
+
+        result["value"] = float(value) if check != "cardinality" else int(value)
+        # After stopping early, only the failures are final
+        if not complete and passed:
+            return dict(result, status="skipped", reason="stopped early")
+        return dict(result, status="passed" if passed else "failed")
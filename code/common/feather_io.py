@@ -0,0 +1,64 @@
+"""Arrow IPC (Feather V2) reads and writes, for intermediate artifacts that are written once and read right after.
+
+Unlike Parquet pages, which are decoded into new buffers on every read, the columns of an uncompressed Feather file
+are used as they are: the file is memory-mapped and the Arrow arrays point into the page cache. LZ4 files are
+smaller but have to be decompressed, so they are read into memory.
+"""
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+
+# "uncompressed" or "lz4"
+COMPRESSION = os.getenv("FEATHER_COMPRESSION", "uncompressed")
+
+
+def read_table(path, columns=None, memory_map=True) -> pa.Table:
+    return feather.read_table(path, columns=columns, memory_map=memory_map)
+
+
+def read_feather(path, columns=None, memory_map=True) -> pd.DataFrame:
+    # split_blocks gives every column its own block instead of copying the columns of a dtype into one 2D block
+    return read_table(path, columns=columns, memory_map=memory_map).to_pandas(split_blocks=True)
+
+
+def read_schema(path) -> pa.Schema:
+    """Arrow schema of a Feather file, with the pandas metadata that restores its dtypes, read from the footer."""
+    return pa.ipc.open_file(pa.memory_map(str(path))).schema
+
+
+def num_rows(path) -> int:
+    # Counted from the record batch headers, without decoding the columns
+    return ds.dataset(path, format="feather").count_rows()
+
+
+def _select(batches: list, columns) -> pa.Table:
+    table = pa.Table.from_batches(batches)
+    return table.select(columns) if columns is not None else table
+
+
+def iter_batches(path, batch_rows: int, columns=None):
+    """Tables of batch_rows rows of a Feather file, the last one shorter, decoded one record batch at a time.
+
+    The file is read rather than memory-mapped, so the pages of the batches already read do not stay mapped.
+    """
+    reader = pa.ipc.open_file(pa.OSFile(str(path)))
+    pending, rows = [], 0
+    for index in range(reader.num_record_batches):
+        batch = reader.get_batch(index)
+        while batch.num_rows > 0:
+            take = min(batch_rows - rows, batch.num_rows)
+            pending.append(batch.slice(0, take))
+            rows += take
+            batch = batch.slice(take)
+            if rows == batch_rows:
+                yield _select(pending, columns)
+                pending, rows = [], 0
+    if pending:
+        yield _select(pending, columns)
+
+
+def to_feather(df: pd.DataFrame, path, compression: str = None):
+    feather.write_feather(df, path, compression=compression or COMPRESSION)
@@ -0,0 +1,109 @@
+"""Parquet reads and writes shared by every subsystem.
+
+Reads go through pyarrow, so only the requested columns are decoded and row groups whose statistics rule out the
+filters are skipped. A path can be a single file or a directory of Parquet files with Hive-style partitions.
+"""
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+COMPRESSION = os.getenv("PARQUET_COMPRESSION", "snappy")
+ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", 128 * 1024))
+# Directory name of the rows whose partition column is null
+HIVE_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def arrow_types_mapper(arrow_type: pa.DataType):
+    # Keep strings in Arrow memory and nullable integers as integers instead of object and float64 columns
+    if arrow_type == pa.string():
+        return pd.StringDtype("pyarrow")
+    if arrow_type == pa.int32():
+        return pd.Int32Dtype()
+    return None
+
+
+def read_table(path, columns=None, filters=None, memory_map=True) -> pa.Table:
+    """Read a Parquet file or dataset directory into an Arrow table.
+
+    Args:
+        path: Parquet file or directory of Parquet files
+        columns (list, optional): Columns to read, all of them by default
+        filters (optional): Row filter, either a pyarrow.compute expression or a list of (column, op, value)
+            tuples such as [("date_posted", ">=", pd.Timestamp("2023-01-01"))]
+        memory_map (bool, optional): Map local files into memory instead of reading them into buffers
+
+    Returns:
+        pa.Table: The matching rows of the selected columns
+    """
+    return pq.read_table(path, columns=columns, filters=filters, memory_map=memory_map, partitioning="hive")
+
+
+def read_parquet(path, columns=None, filters=None, memory_map=True, arrow_strings=False) -> pd.DataFrame:
+    """Read a Parquet file or dataset directory into a DataFrame, see read_table.
+
+    With arrow_strings, string columns stay in Arrow memory and int32 columns become nullable integers.
+    """
+    table = read_table(path, columns=columns, filters=filters, memory_map=memory_map)
+    return table.to_pandas(types_mapper=arrow_types_mapper if arrow_strings else None)
+
+
+def read_schema(path) -> pa.Schema:
+    """Arrow schema of a Parquet file, with the pandas metadata that restores its dtypes, read from the footer."""
+    return pq.read_schema(path)
+
+
+def num_rows(path) -> int:
+    return pq.ParquetFile(path).metadata.num_rows
+
+
+def iter_batches(path, batch_rows: int, columns=None):
+    """Record batches of at most batch_rows rows of a Parquet file, decoded one at a time."""
+    with pq.ParquetFile(path, memory_map=True) as parquet_file:
+        yield from parquet_file.iter_batches(batch_size=batch_rows, columns=columns)
+
+
+def to_parquet(df: pd.DataFrame, path, schema: pa.Schema = None, compression: str = None, row_group_size: int = None,
+               preserve_index=None):
+    """Write a DataFrame to a Parquet file.
+
+    Args:
+        df (pd.DataFrame): Data to write
+        path: Parquet file
+        schema (pa.Schema, optional): Types to cast the columns to, inferred from df by default
+        compression (str, optional): Codec such as "snappy", "zstd", "lz4" or "none", PARQUET_COMPRESSION by default
+        row_group_size (int, optional): Maximum rows per row group, PARQUET_ROW_GROUP_SIZE by default
+        preserve_index (optional): Whether to store the index, as in pa.Table.from_pandas
+    """
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=preserve_index)
+    pq.write_table(table, path, compression=compression or COMPRESSION, row_group_size=row_group_size or ROW_GROUP_SIZE)
+
+
+def write_dataset(table: pa.Table, path, partition_col: str, basename: str = "part-0.parquet", compression: str = None,
+                  row_group_size: int = None):
+    """Write an Arrow table into a directory of Parquet files with Hive-style partitions, one file named basename per
+    value of partition_col, e.g. path/month=2023-01/part-0.parquet. The partition column is stored in the directory
+    names only, and rows where it is null go to the partition pyarrow reads back as null.
+
+    Files already in path are kept unless they have the same name, so a table can be written in several calls with
+    different basenames.
+
+    Args:
+        table (pa.Table): Data to write
+        path: Dataset directory
+        partition_col (str): Column to partition by
+        basename (str, optional): Name of the file written to every partition
+        compression (str, optional): Codec, PARQUET_COMPRESSION by default
+        row_group_size (int, optional): Maximum rows per row group, PARQUET_ROW_GROUP_SIZE by default
+    """
+    values = table.column(partition_col)
+    data = table.drop([partition_col])
+    for value in values.unique().to_pylist():
+        is_in_partition = pc.is_null(values) if value is None else pc.equal(values, value)
+        directory = Path(path, f"{partition_col}={HIVE_NULL_PARTITION if value is None else value}")
+        directory.mkdir(parents=True, exist_ok=True)
+        pq.write_table(data.filter(is_in_partition), Path(directory, basename), compression=compression or COMPRESSION,
+                       row_group_size=row_group_size or ROW_GROUP_SIZE)
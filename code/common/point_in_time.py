@@ -0,0 +1,169 @@
+"""Point-in-time joins of offline features onto entity rows, computed locally with pandas.merge_asof.
+
+The join follows the semantics of the Feast offline stores: every entity row gets the features of the latest
+feature row with the same join keys whose timestamp is at or before the entity timestamp, and not older than the
+feature view TTL. Rows without such a feature row get nulls. Unlike the Feast file offline store, which reads and
+joins the whole source through dask, only the columns of the requested features and the partitions that can hold a
+match are read, and the rows come back in the order of the entity dataframe.
+"""
+import os
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+from common import parquet_io
+
+# Month partitions, as written by the data pipeline, e.g. features/month=2023-01
+PARTITION_MONTH_FORMAT = "%Y-%m"
+
+
+def _naive_utc(timestamps: pd.Series) -> pd.Series:
+    # Feast compares timestamps in UTC
+    timestamps = pd.to_datetime(timestamps)
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_convert("UTC").dt.tz_localize(None)
+    return timestamps
+
+
+def _join_codes(entity_keys: pd.DataFrame, feature_keys: pd.DataFrame) -> tuple:
+    # One integer per combination of join key values, -1 where any key is null
+    keys = pd.concat([entity_keys, feature_keys], ignore_index=True)
+    if len(keys.columns) == 1:
+        codes, _ = pd.factorize(keys.iloc[:, 0])
+    else:
+        codes = keys.groupby(list(keys.columns), sort=False, dropna=False).ngroup().to_numpy()
+        codes[keys.isna().any(axis=1).to_numpy()] = -1
+    return codes[:len(entity_keys)], codes[len(entity_keys):]
+
+
+def join_features(entity_df: pd.DataFrame, features_df: pd.DataFrame, join_keys: list, timestamp_field: str,
+                  feature_names: list, ttl: timedelta = None, entity_timestamp_field: str = None) -> pd.DataFrame:
+    """Join the latest features at or before every entity timestamp onto entity_df.
+
+    Args:
+        entity_df (pd.DataFrame): Entity rows with the join keys and an event timestamp
+        features_df (pd.DataFrame): Feature rows with the join keys, timestamp_field and feature_names
+        join_keys (list): Columns identifying an entity
+        timestamp_field (str): Event timestamp of the feature rows
+        feature_names (list): Feature columns to join
+        ttl (timedelta, optional): Maximum age of a feature row, unlimited when None or zero as in Feast
+        entity_timestamp_field (str, optional): Event timestamp of the entity rows, timestamp_field by default
+
+    Returns:
+        pd.DataFrame: entity_df with the feature columns appended, in the same row order
+    """
+    entity_timestamp_field = entity_timestamp_field or timestamp_field
+    entity_codes, feature_codes = _join_codes(entity_df[join_keys], features_df[join_keys])
+
+    left = pd.DataFrame({
+        "key": entity_codes,
+        "timestamp": _naive_utc(entity_df[entity_timestamp_field]).to_numpy(),
+        "entity_row": np.arange(len(entity_df)),
+    })
+    right = pd.DataFrame({
+        "key": feature_codes,
+        "timestamp": _naive_utc(features_df[timestamp_field]).to_numpy(),
+        "feature_row": np.arange(len(features_df)),
+    })
+
+    # merge_asof needs non-null keys sorted on the timestamp. The stable sort keeps the feature rows with equal
+    # timestamps in source order, and the last of them wins, as with Feast's deduplication.
+    left = left.loc[(left["key"] >= 0) & left["timestamp"].notna()].sort_values("timestamp", kind="stable")
+    right = right.loc[(right["key"] >= 0) & right["timestamp"].notna()].sort_values("timestamp", kind="stable")
+    joined = pd.merge_asof(left, right, on="timestamp", by="key", direction="backward", allow_exact_matches=True,
+                           tolerance=pd.Timedelta(ttl) if ttl else None)
+
+    # Position of the matched feature row of every entity row, -1 where there is none
+    positions = np.full(len(entity_df), -1)
+    matched = joined.loc[joined["feature_row"].notna()]
+    positions[matched["entity_row"].to_numpy()] = matched["feature_row"].to_numpy(dtype=np.int64)
+
+    result = entity_df.copy()
+    for name in feature_names:
+        result[name] = pd.api.extensions.take(features_df[name].array, positions, allow_fill=True)
+    return result
+
+
+def read_features(path, join_keys: list, timestamp_field: str, feature_names: list, start=None, end=None,
+                  partition_col: str = None) -> pd.DataFrame:
+    """Read the feature rows with a timestamp between start and end, both included and both optional.
+
+    Only the needed columns are read. With partition_col, the month partition column of the dataset, the months
+    outside [start, end] are skipped without opening their files.
+    """
+    filters = ds.scalar(True)
+    if start is not None and not pd.isna(start):
+        filters &= ds.field(timestamp_field) >= start
+        if partition_col is not None:
+            filters &= ds.field(partition_col) >= start.strftime(PARTITION_MONTH_FORMAT)
+    if end is not None and not pd.isna(end):
+        filters &= ds.field(timestamp_field) <= end
+        if partition_col is not None:
+            filters &= ds.field(partition_col) <= end.strftime(PARTITION_MONTH_FORMAT)
+    columns = list(dict.fromkeys(join_keys + [timestamp_field] + feature_names))
+    table = parquet_io.read_table(path, columns=columns, filters=filters)
+    return table.to_pandas(types_mapper=parquet_io.arrow_types_mapper)
+
+
+def view_source(store, view_name: str) -> dict:
+    """Join keys, timestamp field, TTL, feature names and source path of a feature view in the registry of store."""
+    view = store.get_feature_view(view_name)
+    path = view.batch_source.path
+    if not os.path.isabs(path):
+        path = Path(store.repo_path, path).resolve()
+    return {
+        "join_keys": [column.name for column in view.entity_columns],
+        "timestamp_field": view.batch_source.timestamp_field,
+        "ttl": view.ttl,
+        "feature_names": [feature.name for feature in view.features],
+        "path": path,
+    }
+
+
+def get_historical_features(store, entity_df: pd.DataFrame, features: list, partition_col: str = None,
+                            entity_timestamp_field: str = None, lookback: timedelta = None) -> pd.DataFrame:
+    """Drop-in for FeatureStore.get_historical_features(...).to_df() on file sources.
+
+    The join keys, timestamp field, TTL and source path of every feature view are taken from the registry of store,
+    so the definitions in the feature repository stay the single source of truth.
+
+    Args:
+        store (feast.FeatureStore): Feature store with the registered feature views
+        entity_df (pd.DataFrame): Entity rows with the join keys and an event timestamp
+        features (list): Feature references such as "properties_fv:area"
+        partition_col (str, optional): Month partition column of the feature sources
+        entity_timestamp_field (str, optional): Event timestamp of the entity rows, the first datetime column of
+            entity_df by default, as in Feast
+        lookback (timedelta, optional): Maximum age of a feature row on top of the TTL of the views, unlimited when
+            None or zero. The months older than the lookback before the earliest entity row are not read, which a
+            long TTL alone does not allow.
+
+    Returns:
+        pd.DataFrame: entity_df with the features appended, in the same row order
+    """
+    if entity_timestamp_field is None:
+        entity_timestamp_field = next(column for column in entity_df.columns
+                                      if pd.api.types.is_datetime64_any_dtype(entity_df[column]))
+    timestamps = _naive_utc(entity_df[entity_timestamp_field])
+
+    views = {}
+    for reference in features:
+        view_name, feature_name = reference.split(":")
+        views.setdefault(view_name, []).append(feature_name)
+
+    result = entity_df
+    for view_name, feature_names in views.items():
+        source = view_source(store, view_name)
+        join_keys, timestamp_field = source["join_keys"], source["timestamp_field"]
+        max_age = min((age for age in (source["ttl"], lookback) if age), default=None)
+
+        # A match is not newer than the latest entity row, and at most max_age older than the earliest one
+        start = timestamps.min() - max_age if max_age else None
+        features_df = read_features(source["path"], join_keys, timestamp_field, feature_names, start=start,
+                                    end=timestamps.max(), partition_col=partition_col)
+        result = join_features(result, features_df, join_keys, timestamp_field, feature_names, ttl=max_age,
+                               entity_timestamp_field=entity_timestamp_field)
+    return result
@@ -0,0 +1,145 @@
+"""Skip pipeline stages whose inputs have not changed since their last successful run.
+
+A stage declares the files it reads, the files it writes, the code it runs and the environment variables it is
+configured with. The sha256 of all of them is the key of a run. After a successful run the key is saved with the
+digests of the outputs, and the next run with the same key is skipped as long as the outputs are still the ones it
+wrote.
+
+Usage from a subsystem: python stages.py [--force] <stage> <command...>
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+COMMON_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Stage:
+    def __init__(self, name: str, inputs=(), outputs=(), code=(), env=(), verify_outputs: bool = True) -> None:
+        """
+        Args:
+            name (str): Stage name, the key of its cache entry
+            inputs (optional): Files and directories the stage reads
+            outputs (optional): Files and directories the stage writes, they must exist for a cache hit
+            code (optional): Source files and directories of the stage
+            env (optional): Names of the environment variables that configure the stage
+            verify_outputs (bool, optional): Whether a cache hit also requires the outputs to be unchanged since the
+                last run, rather than only to exist. Disable it for outputs that other stages update.
+        """
+        self.name = name
+        self.inputs = [Path(path) for path in inputs]
+        self.outputs = [Path(path) for path in outputs]
+        self.code = [Path(path) for path in code]
+        self.env = list(env)
+        self.verify_outputs = verify_outputs
+
+
+class StageCache:
+    def __init__(self, cache_dir) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Digests of unchanged files are reused, so that large inputs are only read when they change
+        self.digests_file = Path(self.cache_dir, "file_digests.json")
+        self.digests = self._load(self.digests_file)
+
+    @staticmethod
+    def _load(path: Path) -> dict:
+        if path.is_file():
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    @staticmethod
+    def _dump(obj: dict, path: Path):
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=4)
+        os.replace(temp_path, path)
+
+    def file_digest(self, path: Path) -> str:
+        stat = path.stat()
+        key = path.absolute().as_posix()
+        cached = self.digests.get(key)
+        if cached is not None and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(block)
+        self.digests[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256.hexdigest()}
+        return sha256.hexdigest()
+
+    def path_digest(self, path: Path) -> str:
+        # Missing paths hash to a constant, so that creating them changes the key
+        if path.is_file():
+            return self.file_digest(path)
+        if not path.is_dir():
+            return "missing"
+
+        sha256 = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+            for file in sorted(files):
+                file_path = Path(root, file)
+                sha256.update(file_path.relative_to(path).as_posix().encode())
+                sha256.update(self.file_digest(file_path).encode())
+        return sha256.hexdigest()
+
+    def stage_key(self, stage: Stage) -> str:
+        sha256 = hashlib.sha256(stage.name.encode())
+        for kind, paths in (("input", stage.inputs), ("code", stage.code)):
+            for path in paths:
+                sha256.update(f"{kind}:{path.as_posix()}:{self.path_digest(path)}".encode())
+        for name in stage.env:
+            sha256.update(f"env:{name}={os.getenv(name)}".encode())
+        return sha256.hexdigest()
+
+    def output_digests(self, stage: Stage) -> dict:
+        return {path.as_posix(): self.path_digest(path) for path in stage.outputs}
+
+    def is_fresh(self, stage: Stage, key: str) -> bool:
+        entry = self._load(Path(self.cache_dir, f"{stage.name}.json"))
+        if entry.get("key") != key or not all(path.exists() for path in stage.outputs):
+            return False
+        return not stage.verify_outputs or entry.get("outputs") == self.output_digests(stage)
+
+    def save(self, stage: Stage, key: str):
+        self._dump({"key": key, "outputs": self.output_digests(stage)}, Path(self.cache_dir, f"{stage.name}.json"))
+        self._dump(self.digests, self.digests_file)
+
+
+def run_stage(stage: Stage, command: list, cache_dir, logger, force: bool = False) -> int:
+    """Run command unless the cache holds the outputs of stage for its current inputs.
+
+    Returns:
+        int: 0 on a cache hit, otherwise the exit code of command
+    """
+    cache = StageCache(cache_dir)
+    key = cache.stage_key(stage)
+    if not force and cache.is_fresh(stage, key):
+        logger.info(f"Stage {stage.name} is up to date, skipped")
+        return 0
+
+    logger.info(f"Running stage {stage.name}: {' '.join(command)}")
+    returncode = subprocess.run(command).returncode
+    if returncode == 0:
+        # The key is computed before the run, so inputs changed in the meantime invalidate the entry
+        cache.save(stage, key)
+    else:
+        logger.error(f"Stage {stage.name} failed with exit code {returncode}")
+    return returncode
+
+
+def main(stages: dict, cache_dir, logger):
+    parser = argparse.ArgumentParser(description="Run a pipeline stage unless its cached outputs are up to date")
+    parser.add_argument("--force", action="store_true", help="run the stage even on a cache hit")
+    parser.add_argument("stage", choices=list(stages))
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    sys.exit(run_stage(stages[args.stage], args.command, cache_dir, logger, force=args.force))
@@ -0,0 +1,84 @@
+"""Compare the vectorized address parser with the previous row-wise implementation.
+
+Usage: python benchmarks/address_benchmark.py [num_rows]
+"""
+import sys
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(BASE_DIR, "src"))
+
+from address_parser import parse_address
+
+
+def make_addresses(num_rows: int, seed: int = 12) -> pd.Series:
+    rng = np.random.default_rng(seed)
+    streets = np.array([f"Đường số {i}" for i in range(1, 200)])
+    wards = np.array([f"Phường {i}" for i in range(1, 30)])
+    districts = np.array([f"Quận {i}" for i in range(1, 13)] + ["Bình Thạnh", "Gò Vấp", "Thủ Đức"])
+    cities = np.array(["TP.HCM", "Hà Nội", "Đà Nẵng", "Bình Dương", "Cần Thơ"])
+
+    street = rng.choice(streets, num_rows).astype(object)
+    ward = rng.choice(wards, num_rows).astype(object)
+    district = rng.choice(districts, num_rows).astype(object)
+    city = rng.choice(cities, num_rows).astype(object)
+    has_ward = rng.random(num_rows) < 0.5
+
+    location = np.where(has_ward, ward + ", " + district, district)
+    return pd.Series(street + ", " + location + ", " + city)
+
+
+def legacy_reformat_address(df: pd.DataFrame, len_address: int) -> pd.DataFrame:
+    indexes = df.loc[df['len_address_split'] == len_address].index
+
+    if len_address == 3:
+        columns = ['street', 'district', 'city']
+    else:
+        columns = ['street', 'ward', 'district', 'city']
+
+    address_df = pd.DataFrame(df.loc[df['len_address_split'] == len_address, 'address_split'].to_list(),
+                              columns=columns, index=indexes)
+    address_df = address_df.applymap(lambda x: x.strip())
+
+    return address_df
+
+
+def legacy_parse_address(address: pd.Series) -> pd.DataFrame:
+    df = address.to_frame('address')
+    df['address_split'] = df['address'].apply(lambda x: x.split(','))
+    df['len_address_split'] = df['address_split'].apply(lambda x: len(x))
+    address_df = pd.concat([legacy_reformat_address(df, 3), legacy_reformat_address(df, 4)])
+    address_df['city'] = address_df['city'].apply(lambda x: 'TPHCM' if x == 'TP.HCM' else x)
+    return address_df
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    address = make_addresses(num_rows)
+
+    legacy_df, legacy_time = timed(legacy_parse_address, address)
+    vectorized_df, vectorized_time = timed(parse_address, address)
+
+    # Both implementations must agree on every component. The legacy one returns object columns, the parser keeps
+    # the strings in Arrow memory.
+    expected = legacy_df.reindex(index=address.index, columns=vectorized_df.columns).astype(vectorized_df.dtypes)
+    pd.testing.assert_frame_equal(vectorized_df, expected)
+
+    print(f"rows:       {num_rows}")
+    print(f"legacy:     {legacy_time:.2f}s ({num_rows / legacy_time:,.0f} rows/s)")
+    print(f"vectorized: {vectorized_time:.2f}s ({num_rows / vectorized_time:,.0f} rows/s)")
+    print(f"speedup:    {legacy_time / vectorized_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
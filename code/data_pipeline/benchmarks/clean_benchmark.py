@@ -0,0 +1,153 @@
+"""Measure the throughput and peak memory of every cleaning step on synthetic listings.
+
+Every step runs in a fresh process, so its peak RSS is not inflated by the steps before it. With --baseline, the
+run fails when a step is slower than the baseline by more than --tolerance.
+
+Usage: python benchmarks/clean_benchmark.py --num-rows 1000000 [--output result.json] [--baseline result.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(BASE_DIR, "src"))
+sys.path.append(os.path.join(BASE_DIR, "benchmarks"))
+
+from generate_listings import generate_listings
+from utils import AppConst, parquet_io
+from address_parser import parse_address
+from info_parser import parse_additional_info
+from price_parser import parse_price
+from dedup import listing_keys
+import clean
+
+
+class NullLogger:
+    def warning(self, msg):
+        pass
+
+
+def parse_and_dedup(df):
+    return clean.drop_invalid_prices(clean.drop_duplicates(clean.parse_listings(df)), NullLogger())
+
+
+def remove_outliers(df):
+    for column, remove_end in clean.OUTLIERS_DICT.items():
+        df = clean.remove_outliers_from_column(df, column, remove_end)
+    return df
+
+
+# Step name -> (preparation that is not measured, measured step)
+STEPS = {
+    "address": (None, lambda df: parse_address(df["address"])),
+    "additional_info": (None, lambda df: parse_additional_info(df["additional_info"])),
+    "price": (None, lambda df: parse_price(df["price"])),
+    "parse_listings": (None, clean.parse_listings),
+    "drop_duplicates": (clean.parse_listings, clean.drop_duplicates),
+    "remove_outliers": (parse_and_dedup, remove_outliers),
+}
+
+
+def reset_peak_rss():
+    # Linux resets VmHWM, the peak RSS of the process, to its current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_step(name: str, data_path: str, queue: multiprocessing.Queue):
+    prepare, step = STEPS[name]
+    df = parquet_io.read_parquet(data_path, arrow_strings=True)
+    if prepare is not None:
+        df = prepare(df)
+    reset_peak_rss()
+    rss_before = peak_rss_mb()
+
+    start = time.perf_counter()
+    step(df)
+    elapsed = time.perf_counter() - start
+
+    queue.put({"seconds": elapsed, "rows_per_sec": len(df) / elapsed, "peak_rss_mb": peak_rss_mb(),
+               "step_rss_mb": peak_rss_mb() - rss_before})
+
+
+def run_benchmark(num_rows: int, seed: int, steps: list) -> dict:
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_path = os.path.join(temp_dir, "listings.parquet")
+        df = generate_listings(num_rows, seed=seed)
+        table = pa.Table.from_pandas(df, schema=AppConst.RAW_JSON_SCHEMA, preserve_index=False)
+        table = table.append_column("listing_key", pa.array(listing_keys(table), type=pa.uint64()))
+        pq.write_table(table, data_path)
+        del df
+
+        for name in steps:
+            queue = context.Queue()
+            process = context.Process(target=run_step, args=(name, data_path, queue))
+            process.start()
+            results[name] = queue.get()
+            process.join()
+            print(f"{name:<18} {results[name]['rows_per_sec']:>14,.0f} rows/s "
+                  f"{results[name]['peak_rss_mb']:>10,.0f} MB peak RSS "
+                  f"{results[name]['step_rss_mb']:>+10,.0f} MB in step")
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result["rows_per_sec"] < baseline[name]["rows_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['rows_per_sec']:,.0f} rows/s, "
+                               f"baseline {baseline[name]['rows_per_sec']:,.0f} rows/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=12)
+    parser.add_argument("--steps", nargs="+", default=list(STEPS), choices=list(STEPS))
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run_benchmark(args.num_rows, args.seed, args.steps)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"num_rows": args.num_rows, "steps": results}, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["steps"]
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
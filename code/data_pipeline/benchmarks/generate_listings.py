@@ -0,0 +1,196 @@
+"""Generate synthetic mogi.vn listings shaped like the crawler's MogiVnItem JSON lines.
+
+Usage: python benchmarks/generate_listings.py --num-rows 1000000 --output ../../data_sources/data
+
+The listings are generated and written one file of --rows-per-file rows at a time, so 10M rows take no more memory
+than 10k.
+"""
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+CITIES = np.array(["TP.HCM", "TPHCM", "Hà Nội", "Đà Nẵng", "Bình Dương", "Đồng Nai", "Cần Thơ", "Hải Phòng",
+                   "Khánh Hòa", "Bà Rịa - Vũng Tàu", "Long An", "Lâm Đồng"])
+CITY_WEIGHTS = np.array([30, 5, 25, 8, 8, 5, 4, 4, 3, 3, 3, 2], dtype=float)
+DISTRICTS = np.array([f"Quận {i}" for i in range(1, 13)] + ["Bình Thạnh", "Gò Vấp", "Thủ Đức", "Tân Bình",
+                                                             "Cầu Giấy", "Đống Đa", "Hải Châu", "Dĩ An"])
+WARDS = np.array([f"Phường {i}" for i in range(1, 30)] + ["Phường Tân Định", "Phường Bến Nghé"])
+STREETS = np.array([f"Đường số {i}" for i in range(1, 60)] + ["Nguyễn Trãi", "Lê Lợi", "Phan Văn Trị",
+                                                              "Cách Mạng Tháng 8", "Hoàng Văn Thụ"])
+LEGAL_DOCUMENTS = np.array(["Sổ hồng", "Sổ đỏ", "Giấy tờ hợp lệ", "Hợp đồng mua bán", "Không xác định",
+                            "Giấy tờ viết tay"])
+PROPERTY_TYPES = np.array(["Bán nhà", "Bán nhà mặt tiền", "Bán căn hộ", "Bán đất", "Bán nhà hẻm"])
+# Property ids are START + index * STEP modulo RANGE, distinct for the first RANGE listings since STEP and RANGE are
+# coprime
+PROPERTY_ID_START = 10_000_000
+PROPERTY_ID_RANGE = 30_000_000
+PROPERTY_ID_STEP = 7_919_993
+JSON_ROWS_PER_WRITE = 10_000
+
+
+def concat(*parts) -> pa.Array:
+    # Element-wise concatenation of string arrays and scalars
+    return pc.binary_join_element_wise(*parts, "")
+
+
+def to_text(values: np.ndarray) -> pa.Array:
+    # Whole floats are written without a decimal part, e.g. "12" for 12.0
+    return pc.cast(pa.array(values), pa.string())
+
+
+def format_decimal(values: np.ndarray) -> pa.Array:
+    # Vietnamese decimal comma, without a trailing ",0"
+    return pc.replace_substring(to_text(np.round(values, 1)), ".", ",")
+
+
+def generate_prices(rng: np.random.Generator, num_rows: int) -> pa.Array:
+    billions = rng.lognormal(1.2, 0.8, num_rows)
+    whole = np.floor(billions).astype(int)
+    millions = (np.round((billions - whole) * 10) * 100).astype(int)
+
+    kind = rng.choice(4, num_rows, p=[0.45, 0.35, 0.17, 0.03])
+    only_billions = concat(format_decimal(billions), " tỷ")
+    mixed = concat(to_text(whole), " tỷ ", to_text(millions), " triệu")
+    only_millions = concat(to_text((np.round(billions * 10) * 100).astype(int)), " triệu")
+
+    prices = pc.if_else(kind == 0, only_billions, pc.if_else(kind == 1, mixed, only_millions))
+    return pc.if_else((kind == 3) | (whole == 0) & (kind == 1), "Thỏa thuận", prices)
+
+
+def generate_addresses(rng: np.random.Generator, num_rows: int) -> pa.Array:
+    street = pa.array(rng.choice(STREETS, num_rows))
+    ward = pa.array(rng.choice(WARDS, num_rows))
+    district = pa.array(rng.choice(DISTRICTS, num_rows))
+    city = pa.array(rng.choice(CITIES, num_rows, p=CITY_WEIGHTS / CITY_WEIGHTS.sum()))
+    has_ward = rng.random(num_rows) < 0.6
+
+    location = pc.if_else(has_ward, concat(ward, ", ", district), district)
+    return concat(street, ", ", location, ", ", city)
+
+
+def generate_additional_info(rng: np.random.Generator, num_rows: int, property_ids: pa.Array) -> pa.ListArray:
+    width = np.round(rng.uniform(3, 10, num_rows) * 2) / 2
+    length = np.round(rng.uniform(8, 30, num_rows))
+    area = concat(format_decimal(width * length * rng.uniform(0.9, 1.1, num_rows)), " m")
+    usable_area = concat(format_decimal(width * length * rng.integers(1, 5, num_rows)), " m")
+    size = concat("(", format_decimal(width), "x", to_text(length), ")")
+    bedrooms = to_text(rng.integers(1, 8, num_rows))
+    bathrooms = to_text(rng.integers(1, 6, num_rows))
+    legal = pa.array(rng.choice(LEGAL_DOCUMENTS, num_rows, p=[0.4, 0.25, 0.15, 0.1, 0.05, 0.05]))
+    days = rng.integers(0, 3 * 365, num_rows).astype("timedelta64[D]") + np.datetime64("2021-01-01")
+    date_posted = pc.strftime(pa.array(days), format="%d/%m/%Y")
+
+    always = np.ones(num_rows, dtype=bool)
+    has_size = rng.random(num_rows) < 0.7
+    has_usable_area = rng.random(num_rows) < 0.6
+    has_rooms = rng.random(num_rows) < 0.85
+
+    # One column per token, the tokens a row does not have are masked out
+    columns = [
+        ("Diện tích đất", always), (area, always),
+        (size, has_size),
+        ("Diện tích sử dụng", has_usable_area), (usable_area, has_usable_area),
+        ("Phòng ngủ", has_rooms), (bedrooms, has_rooms), ("Nhà tắm", has_rooms), (bathrooms, has_rooms),
+        ("Pháp lý", always), (legal, always), ("Ngày đăng", always), (date_posted, always),
+        ("Mã BĐS", always), (property_ids, always),
+    ]
+    tokens = pa.concat_arrays([pa.repeat(values, num_rows) if isinstance(values, str) else values
+                               for values, _ in columns])
+    present = np.column_stack([mask for _, mask in columns])
+
+    # The tokens are stored column after column, the row-major positions of the present ones keep every row in order
+    positions = np.arange(len(columns)) * num_rows + np.arange(num_rows)[:, None]
+    offsets = np.zeros(num_rows + 1, dtype=np.int32)
+    np.cumsum(present.sum(axis=1), out=offsets[1:])
+    return pa.ListArray.from_arrays(pa.array(offsets), tokens.take(pa.array(positions[present])))
+
+
+def generate_unique(rng: np.random.Generator, num_rows: int, first_index: int) -> pa.Table:
+    # Distinct property ids for the listings first_index onwards, scattered over the id range by a bijection
+    index = np.arange(first_index, first_index + num_rows, dtype=np.int64)
+    property_ids = to_text(PROPERTY_ID_START + index * PROPERTY_ID_STEP % PROPERTY_ID_RANGE)
+    address = generate_addresses(rng, num_rows)
+    property_type = pa.array(rng.choice(PROPERTY_TYPES, num_rows))
+
+    return pa.table({
+        "title": concat(property_type, " ", address),
+        "price": generate_prices(rng, num_rows),
+        "additional_info": generate_additional_info(rng, num_rows, property_ids),
+        "content": concat(property_type, " chính chủ, ", address, ".\nLiên hệ xem nhà, mã ", property_ids),
+        "address": address,
+    })
+
+
+def generate_chunks(num_rows: int, rows_per_chunk: int, duplicate_rate: float = 0.05, seed: int = 12,
+                    pool_size: int = 100_000):
+    """Yield listings with the columns of MogiVnItem as Arrow tables of rows_per_chunk rows, num_rows in total.
+
+    Every chunk is generated from its own child of the seed, so memory does not grow with num_rows. A duplicate_rate
+    share of the rows are exact copies of rows of the same or an earlier chunk, as produced when a listing is crawled
+    more than once. The copies are drawn from a pool of at most pool_size rows, a uniform sample of the rows so far.
+    """
+    num_chunks = max(1, -(-num_rows // rows_per_chunk))
+    pool = None
+    first_index = 0
+    for chunk_index, child in enumerate(np.random.SeedSequence(seed).spawn(num_chunks)):
+        rng = np.random.default_rng(child)
+        chunk_rows = min(rows_per_chunk, num_rows - chunk_index * rows_per_chunk)
+        num_unique = max(1, round(chunk_rows * (1 - duplicate_rate)))
+
+        unique = generate_unique(rng, num_unique, first_index)
+        first_index += num_unique
+        pool = unique if pool is None else pa.concat_tables([pool, unique])
+        duplicates = pool.take(rng.integers(0, pool.num_rows, chunk_rows - num_unique))
+        if pool.num_rows > pool_size:
+            pool = pool.take(np.sort(rng.choice(pool.num_rows, pool_size, replace=False)))
+
+        chunk = pa.concat_tables([unique, duplicates])
+        yield chunk.take(rng.permutation(chunk.num_rows))
+
+
+def generate_listings(num_rows: int, duplicate_rate: float = 0.05, seed: int = 12,
+                      rows_per_chunk: int = 100_000) -> pd.DataFrame:
+    """Generate listings with the columns of MogiVnItem into one DataFrame, see generate_chunks."""
+    table = pa.concat_tables(generate_chunks(num_rows, rows_per_chunk, duplicate_rate, seed))
+    return table.to_pandas()
+
+
+def write_crawls(output_dir, num_rows: int, num_crawls: int, rows_per_file: int, duplicate_rate: float = 0.05,
+                 seed: int = 12):
+    # <output_dir>/<crawl date>/items_<n>.jsonl, the layout ingest.py reads, written one file at a time
+    num_files = max(1, -(-num_rows // rows_per_file))
+    crawl_dates = pd.date_range("2023-01-01", periods=num_crawls, freq="7D").strftime("%Y-%m-%d")
+    file_counts = {}
+    chunks = generate_chunks(num_rows, rows_per_file, duplicate_rate, seed)
+    for file_number, chunk in enumerate(chunks):
+        crawl = crawl_dates[file_number * num_crawls // num_files]
+        crawl_dir = Path(output_dir, crawl)
+        crawl_dir.mkdir(parents=True, exist_ok=True)
+        file_index = file_counts[crawl] = file_counts.get(crawl, -1) + 1
+        with open(Path(crawl_dir, f"items_{file_index}.jsonl"), "w", encoding="utf-8") as f:
+            # to_json builds the whole text in memory, so it is given a slice at a time
+            for batch in chunk.to_batches(JSON_ROWS_PER_WRITE):
+                f.write(batch.to_pandas().to_json(orient="records", lines=True, force_ascii=False) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-rows", type=int, default=10_000)
+    parser.add_argument("--num-crawls", type=int, default=4)
+    parser.add_argument("--rows-per-file", type=int, default=100_000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=12)
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    args = parser.parse_args()
+
+    write_crawls(args.output, args.num_rows, args.num_crawls, args.rows_per_file, args.duplicate_rate, args.seed)
+    print(f"Wrote {args.num_rows} listings to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Compare a full and an incremental materialization of synthetic features into a SQLite online store.
+
+The stand-in store has the layout of the Feast SQLite online store, one row per entity and feature upserted in a
+transaction per batch. The first run writes the whole history, then a batch of listings ingested later is appended,
+posted during the last week of the history and the day after it, and the second run only writes the entities of the
+rows ingested after the watermark of the first one.
+
+Usage: python benchmarks/materialize_benchmark.py --num-rows 1000000 [--batch-size 50000] [--output result.json]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(BASE_DIR, "src"))
+
+from utils import parquet_io
+from schema import FEATURES_PARTITION_KEY
+from common import point_in_time
+import materialize
+
+FEATURE_NAMES = ["area", "width", "length", "num_bedrooms", "num_bathrooms", "district"]
+DISTRICTS = [f"Quận {i}" for i in range(1, 13)]
+
+
+class SqliteOnlineStore:
+    def __init__(self, path: str) -> None:
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS properties_fv (entity_key BLOB, feature_name TEXT, value BLOB, "
+            "event_ts TIMESTAMP, PRIMARY KEY (entity_key, feature_name))"
+        )
+
+    def write_batch(self, df: pd.DataFrame):
+        rows = []
+        for name in FEATURE_NAMES:
+            values = df[name].astype(object).where(df[name].notna(), None).astype(str)
+            rows.extend(zip(df["property_id"].astype(str), [name] * len(df), values,
+                            df["date_posted"].astype(str)))
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO properties_fv (entity_key, feature_name, value, event_ts) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def num_entities(self) -> int:
+        return self.connection.execute("SELECT COUNT(DISTINCT entity_key) FROM properties_fv").fetchone()[0]
+
+    def event_timestamps(self) -> pd.Series:
+        rows = self.connection.execute("SELECT entity_key, event_ts FROM properties_fv WHERE feature_name = 'area'")
+        entity_keys, timestamps = zip(*rows.fetchall())
+        return pd.Series(pd.to_datetime(timestamps), index=entity_keys).sort_index()
+
+
+def generate_features(num_rows: int, num_properties: int, start: pd.Timestamp, num_days: int, ingested_at: pd.Timestamp,
+                      rng: np.random.Generator) -> pd.DataFrame:
+    date_posted = start + pd.to_timedelta(rng.integers(0, num_days * 86400, num_rows), unit="s")
+    return pd.DataFrame({
+        "property_id": rng.integers(0, num_properties, num_rows).astype(str),
+        "date_posted": date_posted,
+        "area": rng.lognormal(4, 0.5, num_rows).astype(np.float32),
+        "width": rng.uniform(3, 10, num_rows).astype(np.float32),
+        "length": rng.uniform(8, 30, num_rows).astype(np.float32),
+        "num_bedrooms": pd.array(rng.integers(1, 7, num_rows), dtype=pd.Int32Dtype()),
+        "num_bathrooms": pd.array(rng.integers(1, 6, num_rows), dtype=pd.Int32Dtype()),
+        "district": pd.Categorical(rng.choice(DISTRICTS, num_rows), categories=DISTRICTS),
+        "ingested_at": pd.Timestamp(ingested_at),
+    })
+
+
+def write_features(df: pd.DataFrame, path, basename: str):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    month = pa.array(df["date_posted"].dt.strftime(point_in_time.PARTITION_MONTH_FORMAT))
+    parquet_io.write_dataset(table.append_column(FEATURES_PARTITION_KEY, month), path, FEATURES_PARTITION_KEY,
+                             basename=basename)
+
+
+def report(name: str, stats: dict):
+    print(f"{name:<12} {stats['rows_read']:>10,} rows read {stats['rows_written']:>10,} rows written "
+          f"{stats['num_batches']:>5} batches {stats['seconds']:>8.2f} s")
+
+
+def run_benchmark(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    start = pd.Timestamp("2021-01-01")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = {
+            "join_keys": ["property_id"],
+            "timestamp_field": "date_posted",
+            "feature_names": FEATURE_NAMES,
+            "path": os.path.join(temp_dir, "features"),
+        }
+        end = start + pd.Timedelta(days=args.num_days)
+        write_features(generate_features(args.num_rows, args.num_properties, start, args.num_days, end, rng),
+                       source["path"], "part-0.parquet")
+        store = SqliteOnlineStore(os.path.join(temp_dir, "online_store.db"))
+
+        full = materialize.materialize_increment(source, None, store.write_batch, args.batch_size)
+        report("full", full)
+
+        # Listings ingested after the first run, most of them posted before its watermark
+        new_rows = generate_features(args.new_rows, args.num_properties, end - pd.Timedelta(days=7), 8,
+                                     end + pd.Timedelta(days=1), rng)
+        write_features(new_rows, source["path"], "part-1.parquet")
+        incremental = materialize.materialize_increment(source, pd.Timestamp(full["watermark"]), store.write_batch,
+                                                        args.batch_size)
+        report("incremental", incremental)
+
+        # The online store holds the latest row of every entity
+        expected = pd.concat([
+            materialize.read_increment(source, month) for month in materialize.list_months(source["path"])
+        ]).groupby("property_id")["date_posted"].max().sort_index()
+        if store.num_entities() != len(expected):
+            raise AssertionError(f"the online store holds {store.num_entities()} entities, expected {len(expected)}")
+        stale = store.event_timestamps().to_numpy() != expected.to_numpy()
+        if stale.any():
+            raise AssertionError(f"the online store holds a stale row of {stale.sum()} entities")
+    return {"full": full, "incremental": incremental}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-rows", type=int, default=1_000_000)
+    parser.add_argument("--num-properties", type=int, default=300_000)
+    parser.add_argument("--num-days", type=int, default=3 * 365)
+    parser.add_argument("--new-rows", type=int, default=5_000)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=12)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
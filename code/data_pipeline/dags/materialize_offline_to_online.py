@@ -15,13 +15,23 @@ from utils import *
 with DAG(
     dag_id="materialize_offline_to_online",
     default_args=DefaultConfig.DEFAULT_DAG_ARGS,
-    schedule_interval="@once",
+    # Every run only writes the entities with rows ingested after the watermark of the last one, so it can run often
+    schedule_interval="@hourly",
     start_date=pendulum.datetime(2022, 1, 1, tz="UTC"),
     catchup=False,
     tags=["data_pipeline"],
 ) as dag:
+    # Materialization reads the feature views from the registry, so the definitions are applied first
+    feature_store_init_task = DockerOperator(
+        task_id="feature_store_init_task",
+        **DefaultConfig.DEFAULT_DOCKER_OPERATORS_ARGS,
+        command="/bin/bash -c 'cd src/ && python stages.py feast_apply feast -c ../../../feature_repo apply'",
+    )
+
     materialize_task = DockerOperator(
         task_id="materialize_task",
         **DefaultConfig.DEFAULT_DOCKER_OPERATORS_ARGS,
-        command="/bin/bash ./scripts/feast_helper.sh materialize",
+        command="/bin/bash -c 'cd src/ && python materialize.py'",
     )
+
+    feature_store_init_task >> materialize_task
@@ -34,6 +34,12 @@ class DefaultConfig:
         "api_version": "auto",
         "auto_remove": True,
         "mounts": [
+            # Feature repo, with the registry and the online store
+            Mount(
+                source=AppPath.FEATURE_REPO.absolute().as_posix(),
+                target="/real_estate/feature_repo",
+                type="bind"
+            ),
             # Data source
             Mount(
                 source=AppPath.DATA_SOURCE_DIR.absolute().as_posix(),
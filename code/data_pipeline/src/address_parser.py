@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Position of each component in "street, district, city" and "street, ward, district, city" addresses
+ADDRESS_LAYOUTS = {
+    3: {'street': 0, 'district': 1, 'city': 2},
+    4: {'street': 0, 'ward': 1, 'district': 2, 'city': 3},
+}
+ADDRESS_COLUMNS = ['street', 'ward', 'district', 'city']
+
+# Spellings of the same city used across listings
+CITY_ALIASES = {
+    'TP.HCM': 'TPHCM',
+    'TP. HCM': 'TPHCM',
+    'TP HCM': 'TPHCM',
+    'Tp.HCM': 'TPHCM',
+    'Tp. Hồ Chí Minh': 'TPHCM',
+    'Hồ Chí Minh': 'TPHCM',
+}
+
+
+def parse_address(address: pd.Series) -> pd.DataFrame:
+    """Split addresses into their components with Arrow string kernels.
+
+    Every address is split and trimmed in a single pass over the flattened parts, then each component is gathered
+    by its position in the 3- or 4-part layout. Addresses with any other number of parts get missing values in
+    every component.
+
+    Args:
+        address (pd.Series): Comma-separated addresses
+
+    Returns:
+        pd.DataFrame: The street, ward, district and city columns as Arrow strings, indexed like the input
+    """
+    address_array = pa.array(address, type=pa.string(), from_pandas=True)
+    if isinstance(address_array, pa.ChunkedArray):
+        # Arrow-backed string columns are converted without a copy, as chunked arrays
+        address_array = address_array.combine_chunks()
+    parts = pc.split_pattern(address_array, ',')
+    num_parts = pc.list_value_length(parts).fill_null(0).to_numpy()
+    row_offsets = parts.offsets.to_numpy()[:-1]
+    flat_parts = pc.utf8_trim_whitespace(parts.flatten())
+
+    address_df = pd.DataFrame(index=address.index)
+    for column in ADDRESS_COLUMNS:
+        positions = np.full(len(address), -1)
+        for len_address, layout in ADDRESS_LAYOUTS.items():
+            if column in layout:
+                positions = np.where(num_parts == len_address, row_offsets + layout[column], positions)
+        values = flat_parts.take(pa.array(positions, mask=positions < 0))
+        if column == 'city':
+            values = normalize_city(values)
+        address_df[column] = pd.arrays.ArrowStringArray(values)
+
+    return address_df
+
+
+def normalize_city(city: pa.Array) -> pa.Array:
+    # Cities have few distinct values, so aliases are resolved on the dictionary instead of on every row
+    encoded = city.dictionary_encode()
+    dictionary = pa.array([CITY_ALIASES.get(value, value) for value in encoded.dictionary.to_pylist()],
+                          type=pa.string())
+    return dictionary.take(encoded.indices)
@@ -1,186 +1,270 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import re
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from utils import *
+from address_parser import parse_address
+from info_parser import parse_additional_info
+from price_parser import parse_price
+from quantile_sketch import QuantileSketch
+from schema import *
 
 AppPath()
 
+# Columns to remove outliers from, and which end of their distribution to cut
+OUTLIERS_DICT = {'price': 'upper', 'area': 'both', 'width': 'both', 'length': 'both', 'num_bedrooms': 'upper',
+                 'num_bathrooms': 'upper'}
+NUM_TOP_CITIES = 10
 
-def reformat_address(df: pd.DataFrame, len_address: int) -> pd.DataFrame:
-    indexes = df.loc[df['len_address_split'] == len_address].index
 
-    if len_address == 3:
-        columns = ['street', 'district', 'city']
-    elif len_address == 4:
-        columns = ['street', 'ward', 'district', 'city']
-    else:
-        raise ValueError("The len_address value should be either 3 or 4")
+def iqr_bounds(q1: float, q3: float) -> tuple:
+    IQR = q3 - q1
+    lower = q1 - 1.5 * IQR
+    upper = q3 + 1.5 * IQR
+    return lower, upper
 
-    address_df = pd.DataFrame(df.loc[df['len_address_split'] == len_address, 'address_split'].to_list(),
-                              columns=columns, index=indexes)
-    address_df = address_df.applymap(lambda x: x.strip())
 
-    return address_df
+def outlier_mask(values: pd.Series, lower: float, upper: float, remove_end: str = 'both') -> pd.Series:
+    # True for the values to keep
+    if remove_end == 'both':
+        mask = (values <= upper) & (values >= lower)
+    elif remove_end == 'lower':
+        mask = values >= lower
+    elif remove_end == 'upper':
+        mask = values <= upper
+    else:
+        return pd.Series(True, index=values.index)
+    # Missing values compare as NA in nullable integer columns, they are dropped like NaN
+    return mask.fillna(False)
 
 
-def split_size(size: str) -> list[int, int]:
-    size = size.replace(',', '.')
+def remove_outliers_from_column(dataframe: pd.DataFrame, column: str, remove_end: str = 'both'):
+    lower, upper = iqr_bounds(dataframe[column].quantile(0.25), dataframe[column].quantile(0.75))
+    return dataframe.loc[outlier_mask(dataframe[column], lower, upper, remove_end)]
 
-    pattern = r"\(([\d.\d]+)x([\d.\d]+)\)"
-    matches = re.search(pattern, size)
 
-    if matches:
-        value1 = float(matches.group(1))
-        value2 = float(matches.group(2))
+def within_bounds(df: pd.DataFrame, bounds: dict) -> pd.Series:
+    mask = pd.Series(True, index=df.index)
+    for column, remove_end in OUTLIERS_DICT.items():
+        mask &= outlier_mask(df[column], *bounds[column], remove_end)
+    return mask
 
-        if value1 > value2:
-            length = value1
-            width = value2
-        else:
-            length = value2
-            width = value1
 
-        return width, length
+def parse_listings(df: pd.DataFrame) -> pd.DataFrame:
+    # Row-wise parsing only, so that any split of the rows can be parsed independently
+    df = df.dropna()
+    df = df.reset_index(drop=True)
 
+    # Clean "address" column
+    df = df.join(parse_address(df['address']))
 
-def list_to_dict(words: list) -> dict:
-    columns_dict = {'Diện tích đất': 'area', 'Diện tích sử dụng': 'usable_area', 'Phòng ngủ': 'num_bedrooms',
-                    'Nhà tắm': 'num_bathrooms', 'Pháp lý': 'legal_document', 'Ngày đăng': 'date_posted',
-                    'Mã BĐS': 'property_id'}
+    # Clean "additional_info" column
+    df = df.join(parse_additional_info(df['additional_info']))
+    df = df.drop(columns=['additional_info'])
 
-    result_dict = dict()
-    for key, value in columns_dict.items():
-        try:
-            result_dict[value] = words[words.index(key) + 1]
-        except ValueError:
-            pass
+    # Clean "price" column
+    df['price'], _ = parse_price(df['price'])
 
-    if len(words) % 2 == 1:
-        size = words[words.index('Diện tích đất') + 2]
-        width, length = split_size(size)
-        result_dict['width'] = width
-        result_dict['length'] = length
+    return compact(df)
 
-    return result_dict
 
+def parse_shard(files: list) -> pd.DataFrame:
+    table = ds.dataset(files, format="parquet").to_table(columns=AppConst.RAW_SCHEMA.names)
+    return parse_listings(table.to_pandas(types_mapper=parquet_io.arrow_types_mapper))
 
-def word_to_price(words: str):
-    words = words.split()
 
-    if len(words) == 2:
-        return {words[-1]: float(words[0])}
-    else:
-        return {words[1]: float(words[0]), words[3]: float(words[2])}
+def drop_duplicates(df: pd.DataFrame) -> pd.DataFrame:
+    # Listings are keyed at ingest by their property id and content fingerprint
+    return df.drop_duplicates(subset=['listing_key']).drop(columns=['listing_key'])
 
 
-def remove_outliers_from_column(dataframe: pd.DataFrame, column: str, remove_end: str = 'both'):
-    q1 = dataframe[column].quantile(0.25)
-    q3 = dataframe[column].quantile(0.75)
-    IQR = q3 - q1
-    lower = q1 - 1.5 * IQR
-    upper = q3 + 1.5 * IQR
+def drop_invalid_prices(df: pd.DataFrame, logger) -> pd.DataFrame:
+    invalid_price = df['price'].isna()
+    if invalid_price.any():
+        logger.warning(f"Dropped {invalid_price.sum()} data points with an unparseable price")
+        df = df.loc[~invalid_price]
+    return df
 
-    if remove_end == 'both':
-        dataframe = dataframe.loc[(dataframe[column] <= upper) & (dataframe[column] >= lower)]
-    elif remove_end == 'lower':
-        dataframe = dataframe.loc[dataframe[column] >= lower]
-    elif remove_end == 'upper':
-        dataframe = dataframe.loc[dataframe[column] <= upper]
 
-    return dataframe
+def list_shards() -> list:
+    # One shard per crawl partition, in the order the whole dataset is read in
+    shards = []
+    for partition in sorted(os.listdir(AppPath.RAW_DATASET_DIR)):
+        partition_dir = Path(AppPath.RAW_DATASET_DIR, partition)
+        shards.append([Path(partition_dir, file).as_posix() for file in sorted(os.listdir(partition_dir))])
+    return shards
 
 
-def main():
-    # Start
-    logger = Log(AppConst.CLEAN).log
-    logger.info("Started: Cleaning...")
+def load_categories() -> dict:
+    if AppPath.CATEGORIES_JSON.is_file():
+        return load_json(AppPath.CATEGORIES_JSON)
+    return {}
 
-    # Load data
-    inspect_dir(AppPath.DATA_SOURCE_DIR)
-    try:
-        df = read_parquet(AppPath.DATA_PQ)
-    except FileNotFoundError:
-        logger.error(f"Couldn't find {AppPath.DATA_PQ} to read!")
-        return
-    else:
-        logger.info(f"Successfully loaded {len(df)} data points from {AppPath.DATA_PQ}")
 
-    # Cleaning process
-    df = df.dropna()
-    df = df.reset_index(drop=True)
-
-    # Clean "address" column
-    df['address_split'] = df['address'].apply(lambda x: x.split(','))
-    df['len_address_split'] = df['address_split'].apply(lambda x: len(x))
-    address_df_1 = reformat_address(df, 3)
-    address_df_2 = reformat_address(df, 4)
-    address_df = pd.concat([address_df_1, address_df_2])
-    df = df.join(address_df)
-    df = df.drop(columns=['len_address_split', 'address_split'])
-    df['city'] = df['city'].apply(lambda x: 'TPHCM' if x == 'TP.HCM' else x)
-
-    # Clean "additional_info" column
-    columns_dict = {'Diện tích đất': 'area', 'Diện tích sử dụng': 'usable_area', 'Phòng ngủ': 'num_bedrooms',
-                    'Nhà tắm': 'num_bathrooms', 'Pháp lý': 'legal_document', 'Ngày đăng': 'date_posted',
-                    'Mã BĐS': 'property_id'}
-    df['additional_info_dict'] = df['additional_info'].apply(list_to_dict)
-    info_temp_df = pd.json_normalize(df['additional_info_dict'])
-    info_temp_df = info_temp_df.rename(columns=columns_dict)
-
-    for col in ['area', 'usable_area']:
-        info_temp_df[col] = info_temp_df[col].str.replace('m', '')
-        info_temp_df[col] = info_temp_df[col].str.replace(',', '.')
-        info_temp_df[col] = info_temp_df[col].str.strip()
-        info_temp_df[col] = info_temp_df[col].astype('float')
+def save_categories(df: pd.DataFrame) -> dict:
+    categories = update_categories(load_categories(), df)
+    dump_json(categories, AppPath.CATEGORIES_JSON)
+    return categories
 
-    for col in ['num_bedrooms', 'num_bathrooms']:
-        info_temp_df[col] = info_temp_df[col].astype('float')
 
-    info_temp_df['legal_document'] = info_temp_df['legal_document'].astype('category')
-    info_temp_df['date_posted'] = pd.to_datetime(info_temp_df['date_posted'], dayfirst=True)
-
-    df = pd.concat([df, info_temp_df], axis='columns')
-    df = df.drop(columns=['additional_info', 'additional_info_dict'])
-
-    # Drop duplicates
-    df = df.drop_duplicates()
+def finalize(df: pd.DataFrame, logger):
+    # Steps that need all the parsed rows at once, starting with dropping duplicates
+    df = drop_duplicates(df)
 
     # Clean "price" column
-    price_temp_df = pd.DataFrame.from_records(df['price'].apply(word_to_price), index=df.index)
-    price_temp_df = price_temp_df.fillna(0)
-    price_temp_df['price'] = price_temp_df['tỷ'] * 1e9 + price_temp_df['triệu'] * 1e6 + price_temp_df['nghìn'] * 1e3 + \
-                             price_temp_df['đ']
-    price_temp_df['price'] = price_temp_df['price'] / 1e9  # Price (in billion of VND)
-    df['price'] = price_temp_df['price']
+    df = drop_invalid_prices(df, logger)
 
     # Take properties with price greater than 01.
     # df = df.loc[df['price'] > 0.1]
 
     # Remove outliers using IQR
-    outliers_dict = {'price': 'upper', 'area': 'both', 'width': 'both', 'length': 'both', 'num_bedrooms': 'upper',
-                     'num_bathrooms': 'upper'}
-    for column, remove_end in outliers_dict.items():
+    for column, remove_end in OUTLIERS_DICT.items():
         df = remove_outliers_from_column(df, column, remove_end)
 
     # Take properties in the top 10 city
-    df = df.loc[df['city'].isin(df['city'].value_counts().iloc[:10].index)]
+    df = df.loc[df['city'].isin(df['city'].value_counts().iloc[:NUM_TOP_CITIES].index)]
 
     # Drop unnecessary columns
     df = df.drop(columns=['ward', 'usable_area'])
 
-    # Save features
-    features_column = ['title', 'address', 'content', 'street', 'district', 'city', 'num_bedrooms', 'num_bathrooms',
-                       'legal_document', 'date_posted', 'property_id', 'area', 'width', 'length']
-    features_df = df.loc[:, features_column]
-    to_parquet(features_df, AppPath.FEATURES_PQ)
+    # Encode the category columns with the categories of every run so far
+    df = categorize(df, save_categories(df))
+
+    # Save features, partitioned by month
+    shutil.rmtree(AppPath.FEATURES_STAGING_DIR, ignore_errors=True)
+    AppPath.FEATURES_STAGING_DIR.mkdir(parents=True)
+    write_dataset(features_table(df), AppPath.FEATURES_STAGING_DIR, FEATURES_PARTITION_KEY)
+    replace_dir(AppPath.FEATURES_STAGING_DIR, AppPath.FEATURES_DIR)
 
     # Save entity dataframe
-    entity_df = df.loc[:, ['property_id', 'date_posted', 'price']]
-    to_parquet(entity_df, AppPath.ENTITY_PQ)
+    entity_df = df.loc[:, ENTITY_COLUMNS]
+    write_table(entity_df, AppPath.ENTITY_PQ, ENTITY_SCHEMA)
+
+
+def clean_in_memory(logger, config: Config):
+    # Load data
+    try:
+        df = load_raw_data(config)
+    except FileNotFoundError:
+        logger.error(f"Couldn't find the raw data to read!")
+        return
+    else:
+        logger.info(f"Successfully loaded {len(df)} data points")
+
+    # Cleaning process
+    df = parse_listings(df)
+    finalize(df, logger)
+
+
+def clean_parallel(logger, config: Config):
+    """Parse every crawl partition of the raw dataset on a process pool, then run the global steps (deduplication,
+    outlier removal, top cities) on the concatenated result. The partitions are concatenated in the order the
+    in-memory mode reads them, so both modes write the same files.
+    """
+    shards = list_shards()
+    logger.info(f"Parsing {len(shards)} partitions with {config.num_workers} workers...")
+    with ProcessPoolExecutor(max_workers=config.num_workers) as executor:
+        parsed = list(executor.map(parse_shard, shards))
+    df = pd.concat(parsed, ignore_index=True)
+    logger.info(f"Parsed {len(df)} data points")
+
+    finalize(df, logger)
+
+
+def clean_chunked(logger, config: Config):
+    """Clean the raw dataset in batches, so that only one batch is held in memory at a time.
+
+    1. Parse every batch, write the parsed rows to a staging file and feed the outlier columns into mergeable
+       quantile sketches. The parallel ingest already dropped every listing whose key it had ingested before, from
+       any file and run, so the raw dataset holds each key once and no keys are kept here.
+    2. Compute the IQR bounds from the sketches, then count the cities of the rows within bounds, reading only
+       the columns needed for that.
+    3. Filter the staging file with the bounds and the top cities and stream the features and entities out.
+
+    Unlike the in-memory mode, which cuts the outliers one column after another, the quartiles of every column are
+    estimated on the deduplicated data before any outlier is removed.
+    """
+    if config.ingest_mode != "parallel":
+        raise ValueError(f"CLEAN_MODE=chunked reads the deduplicated raw dataset written by INGEST_MODE=parallel, "
+                         f"it can not clean the output of INGEST_MODE={config.ingest_mode}")
+
+    dataset = ds.dataset(AppPath.RAW_DATASET_DIR, format="parquet", partitioning="hive")
+    sketches = {column: QuantileSketch() for column in OUTLIERS_DICT}
+
+    # Pass 1: parse, deduplicate and sketch
+    num_rows = 0
+    with pq.ParquetWriter(AppPath.CLEAN_STAGING_PQ, PARSED_SCHEMA, compression=parquet_io.COMPRESSION) as writer:
+        for batch in dataset.to_batches(columns=AppConst.RAW_SCHEMA.names, batch_size=config.batch_size):
+            df = parse_listings(batch.to_pandas(types_mapper=parquet_io.arrow_types_mapper))
+            df = df.drop(columns=['listing_key'])
+            df = drop_invalid_prices(df, logger)
+
+            batch_sketches = {column: QuantileSketch() for column in OUTLIERS_DICT}
+            for column, sketch in batch_sketches.items():
+                sketch.update(df[column].to_numpy(dtype='float64', na_value=np.nan))
+                sketches[column].merge(sketch)
+
+            writer.write_table(pa.Table.from_pandas(df, schema=PARSED_SCHEMA, preserve_index=False))
+            num_rows += len(df)
+    logger.info(f"Parsed {num_rows} unique data points into {AppPath.CLEAN_STAGING_PQ}")
+
+    # Pass 2: outlier bounds, top cities and categories
+    bounds = {column: iqr_bounds(sketch.quantile(0.25), sketch.quantile(0.75)) for column, sketch in sketches.items()}
+    logger.info(f"Outlier bounds: {bounds}")
+
+    staging = ds.dataset(AppPath.CLEAN_STAGING_PQ, format="parquet")
+    city_counts = pd.Series(dtype='int64')
+    categories = load_categories()
+    for batch in staging.to_batches(columns=list(OUTLIERS_DICT) + CATEGORY_COLUMNS, batch_size=config.batch_size):
+        df = batch.to_pandas(types_mapper=parquet_io.arrow_types_mapper)
+        df = df.loc[within_bounds(df, bounds)]
+        city_counts = city_counts.add(df['city'].value_counts(), fill_value=0)
+        categories = update_categories(categories, df)
+    top_cities = city_counts.sort_values(ascending=False, kind='stable').iloc[:NUM_TOP_CITIES].index
+    dump_json(categories, AppPath.CATEGORIES_JSON)
+
+    # Pass 3: filter and save, every batch adds one file to each month partition it has rows in
+    num_rows = 0
+    shutil.rmtree(AppPath.FEATURES_STAGING_DIR, ignore_errors=True)
+    AppPath.FEATURES_STAGING_DIR.mkdir(parents=True)
+    with pq.ParquetWriter(AppPath.ENTITY_PQ, ENTITY_SCHEMA, compression=parquet_io.COMPRESSION) as entity_writer:
+        for index, batch in enumerate(staging.to_batches(batch_size=config.batch_size)):
+            df = batch.to_pandas(types_mapper=parquet_io.arrow_types_mapper)
+            df = categorize(df.loc[within_bounds(df, bounds) & df['city'].isin(top_cities)], categories)
+            parquet_io.write_dataset(features_table(df), AppPath.FEATURES_STAGING_DIR, FEATURES_PARTITION_KEY,
+                                     basename=f"part-{index}.parquet")
+            entity_writer.write_table(pa.Table.from_pandas(df, schema=ENTITY_SCHEMA, preserve_index=False))
+            num_rows += len(df)
+    replace_dir(AppPath.FEATURES_STAGING_DIR, AppPath.FEATURES_DIR)
+    logger.info(f"Saved {num_rows} cleaned data points")
+
+    os.remove(AppPath.CLEAN_STAGING_PQ)
+
+
+def main():
+    # Start
+    logger = Log(AppConst.CLEAN).log
+    logger.info("Started: Cleaning...")
+
+    # Load config
+    config = Config()
+    logger.info(f"Loaded config: {config.__dict__}")
+    inspect_dir(AppPath.DATA_SOURCE_DIR)
+
+    # Cleaning process
+    if config.clean_mode == "chunked":
+        clean_chunked(logger, config)
+    elif config.clean_mode == "parallel":
+        clean_parallel(logger, config)
+    else:
+        clean_in_memory(logger, config)
 
     # End
-    if AppPath.FEATURES_PQ.is_file() and AppPath.ENTITY_PQ.is_file():
+    if AppPath.FEATURES_DIR.is_dir() and AppPath.ENTITY_PQ.is_file():
         logger.info("Finished!")
     else:
         logger.error("Failed to save data files!")
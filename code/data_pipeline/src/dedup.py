@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+PROPERTY_ID_LABEL = 'Mã BĐS'
+FINGERPRINT_COLUMNS = ['title', 'price', 'additional_info', 'content', 'address']
+# Joins the elements of "additional_info", the separator does not occur in the crawled text
+LIST_SEPARATOR = '\x1f'
+
+
+def label_values(lists: pa.ListArray, label: str) -> pa.Array:
+    # Value after the first occurrence of label in every list, null where there is none
+    words = lists.flatten()
+    row_ends = np.repeat(lists.offsets.to_numpy()[1:], np.diff(lists.offsets.to_numpy()))
+    positions = np.flatnonzero(pc.equal(words, label).fill_null(False).to_numpy(zero_copy_only=False))
+    positions = positions[positions + 1 < row_ends[positions]]
+    rows = pc.list_parent_indices(lists).to_numpy()[positions]
+    rows, first = np.unique(rows, return_index=True)
+
+    value_positions = np.full(len(lists), -1)
+    value_positions[rows] = positions[first] + 1
+    return words.take(pa.array(value_positions, mask=value_positions < 0))
+
+
+def listing_keys(table: pa.Table) -> np.ndarray:
+    """Key every listing by its property id and a 64-bit fingerprint of its crawled content.
+
+    Re-crawls of an unchanged listing get the same key, while a listing whose price or description changed gets a
+    new one. The long text columns are only hashed here, once per ingested row.
+
+    Args:
+        table (pa.Table): Raw listings with the FINGERPRINT_COLUMNS
+
+    Returns:
+        np.ndarray: uint64 key of every row
+    """
+    additional_info = table.column('additional_info').combine_chunks()
+    columns = {
+        column: table.column(column).combine_chunks() for column in FINGERPRINT_COLUMNS if column != 'additional_info'
+    }
+    columns['additional_info'] = pc.binary_join(additional_info, LIST_SEPARATOR)
+    content = pd.DataFrame({column: pd.arrays.ArrowStringArray(values) for column, values in columns.items()})
+    fingerprint = pd.util.hash_pandas_object(content, index=False).to_numpy()
+
+    property_id = pd.arrays.ArrowStringArray(label_values(additional_info, PROPERTY_ID_LABEL))
+    keys = pd.DataFrame({'property_id': property_id, 'fingerprint': fingerprint})
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def is_member(keys: np.ndarray, sorted_keys: np.ndarray) -> np.ndarray:
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return sorted_keys[positions] == keys
+
+
+def first_occurrence(keys: np.ndarray) -> np.ndarray:
+    return ~pd.Series(keys).duplicated().to_numpy()
+
+
+def load_keys(path, mmap: bool = False) -> np.ndarray:
+    # Sorted keys, memory-mapped so that workers share the pages of one file
+    return np.load(path, mmap_mode='r' if mmap else None)
+
+
+def save_keys(path, keys: np.ndarray):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        np.save(f, np.sort(keys.astype(np.uint64)))
+    os.replace(temp_path, path)
@@ -1,4 +1,5 @@
 from utils import *
+from profiler import profile_dataset
 
 pd.set_option("display.max_columns", None)
 AppPath()
@@ -8,37 +9,37 @@ def main():
     # Start
     logger = Log(AppConst.EXPLORATION).log
     logger.info("Started: Exploring...")
-    
+
+    # Load config
+    config = Config()
+    logger.info(f"Loaded config: {config.__dict__}")
+
     # Inspect data source directory
     inspect_dir(AppPath.DATA_SOURCE_DIR)
 
-    # Read entity data
-    entity_df = read_parquet(AppPath.ENTITY_PQ)
-
-    # Retrieve feature data
-    feature_df = read_parquet(AppPath.FEATURES_PQ)
-    
-    # Join data
-    df = entity_df.join(feature_df, rsuffix="_feature")
-    df.drop(columns=["property_id_feature", "date_posted_feature"])
-    
-    # Inspect data shape
-    logger.info(f"The dataset contains {df.shape[0]} rows and {df.shape[1]} columns")
-    
-    # Inspect data info
-    logger.info("Data info:")
-    logger.info(f"\n{df.info()}")
-    
-    # Inspect missing values
-    logger.info("Missing values:")
-    missing_df = df.isna().sum().to_frame('count')
-    missing_df['proportion'] = round(missing_df['count'] / df.shape[0], 3)
-    logger.info(f"\n{missing_df}")
-    
-    # Inspect data statistics
-    logger.info("Data statistics")
-    logger.info(f"\n{df.describe()}")
-    
-    
+    # Profile entity and feature data, each in a single pass over its row groups
+    profile = {}
+    for name, path in [("entity", AppPath.ENTITY_PQ), ("features", AppPath.FEATURES_DIR)]:
+        profile[name] = profile_dataset(path, config.num_workers)
+        columns_df = pd.DataFrame(profile[name]["columns"]).T
+
+        # Inspect data shape
+        logger.info(f"The {name} data contains {profile[name]['num_rows']} rows and {len(columns_df)} columns")
+
+        # Inspect missing values
+        logger.info("Missing values:")
+        logger.info(f"\n{columns_df[['null_count', 'null_proportion']]}")
+
+        # Inspect data statistics
+        logger.info("Data statistics")
+        statistics = ['kind', 'approx_distinct'] + [column for column in ['min', 'max', 'mean', 'std']
+                                                     if column in columns_df.columns]
+        logger.info(f"\n{columns_df[statistics]}")
+
+    # Save profile
+    dump_json(profile, AppPath.PROFILE_JSON)
+    logger.info(f"Saved the data profile to {AppPath.PROFILE_JSON}")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+
+class HyperLogLog:
+    """Mergeable distinct count estimate (HyperLogLog).
+
+    Every value is hashed to 64 bits. The first p bits pick one of 2^p registers, which keeps the highest rank, the
+    position of the first set bit, among the remaining bits of its values. The harmonic mean of 2^-rank over the
+    registers estimates the number of distinct values with a relative error of about 1.04 / sqrt(2^p), and two
+    sketches are merged by taking the maximum of every register.
+    """
+
+    def __init__(self, p: int = 14) -> None:
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, values: pd.Series) -> None:
+        values = values.dropna()
+        if len(values) == 0:
+            return
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        indices = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        # The remaining bits have at most 64 - p <= 53 bits, so they convert to float64 exactly
+        remaining = (hashes & np.uint64((1 << (64 - self.p)) - 1)).astype(np.float64)
+        bit_length = np.where(remaining > 0, np.frexp(remaining)[1], 0)
+        ranks = (64 - self.p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, indices, ranks)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        num_zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and num_zeros > 0:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * np.log(m / num_zeros)
+        return float(estimate)
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Labels of the "additional_info" attribute list, each one is followed by its value
+INFO_LABELS = {
+    'Diện tích đất': 'area',
+    'Diện tích sử dụng': 'usable_area',
+    'Phòng ngủ': 'num_bedrooms',
+    'Nhà tắm': 'num_bathrooms',
+    'Pháp lý': 'legal_document',
+    'Ngày đăng': 'date_posted',
+    'Mã BĐS': 'property_id',
+}
+AREA_LABEL = 'Diện tích đất'
+
+# Extractors shared by every call, e.g. "60,5 m" -> 60.5, "3" -> 3, "(4,5x15)" -> 4.5, 15
+AREA_PATTERN = r'^\s*(?P<value>\d+(?:[.,]\d+)?)'
+COUNT_PATTERN = r'(?P<value>\d+)'
+SIZE_PATTERN = r'\((?P<first>\d+(?:\.\d+)?)x(?P<second>\d+(?:\.\d+)?)\)'
+DATE_FORMAT = '%d/%m/%Y'
+
+
+def decode(parsed: pa.Array, encoded: pa.DictionaryArray) -> np.ndarray:
+    return parsed.take(encoded.indices).to_numpy(zero_copy_only=False)
+
+
+def extract_number(values: pa.Array, pattern: str) -> np.ndarray:
+    # Attribute values repeat a lot, so they are parsed once per distinct value
+    encoded = values.dictionary_encode()
+    number = pc.struct_field(pc.extract_regex(encoded.dictionary, pattern), [0])
+    number = pc.replace_substring(number, ',', '.')
+    return decode(pc.cast(number, pa.float64()), encoded)
+
+
+def parse_size(size: pa.Array) -> tuple:
+    # The larger side of "(a x b)" is the length, the smaller one the width
+    encoded = size.dictionary_encode()
+    size = pc.extract_regex(pc.replace_substring(encoded.dictionary, ',', '.'), SIZE_PATTERN)
+    first = pc.cast(pc.struct_field(size, [0]), pa.float64())
+    second = pc.cast(pc.struct_field(size, [1]), pa.float64())
+    width = pc.min_element_wise(first, second, skip_nulls=False)
+    length = pc.max_element_wise(first, second, skip_nulls=False)
+    return decode(width, encoded), decode(length, encoded)
+
+
+def parse_date(values: pa.Array) -> np.ndarray:
+    encoded = values.dictionary_encode()
+    dates = pd.to_datetime(encoded.dictionary.to_pandas(), format=DATE_FORMAT, errors='coerce')
+    return decode(pa.array(dates, type=pa.timestamp('ns')), encoded)
+
+
+def take_values(values: pa.Array, positions: np.ndarray) -> pa.Array:
+    return values.take(pa.array(positions, mask=positions < 0))
+
+
+def parse_additional_info(additional_info: pd.Series) -> pd.DataFrame:
+    """Parse the "additional_info" attribute lists into typed columns in one vectorized pass.
+
+    The lists are flattened into a long (row, label, value) table, where the value of a label is the element right
+    after it. The first occurrence of every label in a row is then pivoted into a (rows x labels) table of value
+    positions, from which every column is gathered at once. When a list has an odd length, the element after the
+    land area value is the "(width x length)" size of the property.
+
+    Args:
+        additional_info (pd.Series): Lists alternating between labels and values
+
+    Returns:
+        pd.DataFrame: One column per label plus "width" and "length", indexed like the input
+    """
+    lists = pa.array(additional_info, type=pa.list_(pa.string()), from_pandas=True)
+    words = lists.flatten()
+    row_offsets = lists.offsets.to_numpy()
+    row_ends = np.repeat(row_offsets[1:], np.diff(row_offsets))
+    num_rows = len(lists)
+    num_labels = len(INFO_LABELS)
+
+    # Long table of (row, label, value position) for every label followed by a value in the same row
+    label_codes = pc.index_in(words, value_set=pa.array(list(INFO_LABELS))).to_numpy(zero_copy_only=False)
+    label_positions = np.flatnonzero(~np.isnan(label_codes) & (np.arange(len(words)) + 1 < row_ends))
+    rows = pc.list_parent_indices(lists).to_numpy()[label_positions]
+    labels = label_codes[label_positions].astype(np.int64)
+
+    # Pivot, keeping the first occurrence of a label in a row
+    _, first = np.unique(rows * num_labels + labels, return_index=True)
+    label_table = np.full((num_rows, num_labels), -1, dtype=np.int64)
+    label_table[rows[first], labels[first]] = label_positions[first]
+
+    value_table = np.where(label_table >= 0, label_table + 1, -1)
+    info_df = pd.DataFrame(index=additional_info.index)
+    for code, column in enumerate(INFO_LABELS.values()):
+        values = take_values(words, value_table[:, code])
+        if column in ('area', 'usable_area'):
+            info_df[column] = extract_number(values, AREA_PATTERN)
+        elif column in ('num_bedrooms', 'num_bathrooms'):
+            info_df[column] = extract_number(values, COUNT_PATTERN)
+        elif column == 'date_posted':
+            info_df[column] = parse_date(values)
+        else:
+            info_df[column] = pd.arrays.ArrowStringArray(values)
+
+    area_code = list(INFO_LABELS).index(AREA_LABEL)
+    has_size = (label_table[:, area_code] >= 0) & (np.diff(row_offsets) % 2 == 1)
+    size_positions = np.where(has_size, label_table[:, area_code] + 2, -1)
+    size_positions = np.where(size_positions < row_offsets[1:], size_positions, -1)
+    info_df['width'], info_df['length'] = parse_size(take_values(words, size_positions))
+
+    return info_df
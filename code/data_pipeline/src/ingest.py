@@ -1,37 +1,257 @@
 import os
+import hashlib
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
 from utils import *
+from dedup import first_occurrence, is_member, listing_keys, load_keys, save_keys
 
 AppPath()
 
 
+def list_source_files() -> list:
+    source_files = []
+    for directory in sorted(os.listdir(AppPath.DATA_DIR)):
+        for file in sorted(os.listdir(Path(AppPath.DATA_DIR, directory))):
+            source_files.append(Path(AppPath.DATA_DIR, directory, file))
+    return source_files
+
+
+def partition_path(source_file: Path) -> Path:
+    # data/<crawl>/<file> -> raw_dataset/crawl=<crawl>/<file>.parquet
+    partition = f"{AppConst.RAW_PARTITION_KEY}={source_file.parent.name}"
+    return Path(AppPath.RAW_DATASET_DIR, partition, f"{source_file.stem}.parquet")
+
+
+def keys_path(source_file: Path) -> Path:
+    # data/<crawl>/<file> -> ingest_keys/crawl=<crawl>/<file>.npy, the keys of the listings kept from the file
+    partition = f"{AppConst.RAW_PARTITION_KEY}={source_file.parent.name}"
+    return Path(AppPath.INGEST_KEYS_DIR, partition, f"{source_file.stem}.npy")
+
+
+def file_hash(path: Path, chunk_size: int = 1 << 20) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def manifest_key(source_file: Path) -> str:
+    return Path(source_file).relative_to(AppPath.DATA_DIR).as_posix()
+
+
+def load_manifest(config: Config) -> dict:
+    if config.full_refresh or not AppPath.INGEST_MANIFEST.is_file():
+        return {}
+    return load_json(AppPath.INGEST_MANIFEST)
+
+
+def save_manifest(manifest: dict):
+    temp_file = AppPath.INGEST_MANIFEST.with_suffix(".tmp")
+    dump_json(manifest, temp_file)
+    os.replace(temp_file, AppPath.INGEST_MANIFEST)
+
+
+def is_unchanged(source_file: Path, entry: dict) -> bool:
+    stat = source_file.stat()
+    return (
+        entry is not None
+        and entry["size"] == stat.st_size
+        and entry["mtime"] == stat.st_mtime
+        and partition_path(source_file).is_file()
+        and keys_path(source_file).is_file()
+    )
+
+
+def write_partition(table: pa.Table, target_file: Path, batch_size: int):
+    target_file.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = target_file.with_suffix(".tmp")
+    with pq.ParquetWriter(temp_file, AppConst.RAW_SCHEMA) as writer:
+        for batch in table.to_batches(max_chunksize=batch_size):
+            writer.write_batch(batch)
+    os.replace(temp_file, target_file)
+
+
+def ingest_file(source_file: Path, entry: dict, batch_size: int, ingested_at: pd.Timestamp) -> tuple:
+    """Convert one JSON lines file into a Parquet file of the raw dataset. Runs in a worker process, so only one
+    file per worker is held in memory at a time. A file whose content hash matches its manifest entry is not
+    rewritten.
+
+    Listings already in the file, or ingested from other files by previous runs, are dropped by their key. The keys
+    of the kept listings are saved next to the manifest. Every listing written is stamped with ingested_at, which
+    tells materialization which listings are new.
+
+    Args:
+        source_file (Path): JSON lines file written by the crawler
+        entry (dict): Manifest entry from the previous run, None if the file is new
+        batch_size (int): Maximum number of rows per record batch / row group
+        ingested_at (pd.Timestamp): Start time of the ingest run
+
+    Returns:
+        tuple: Number of rows written, number of duplicates dropped and the new manifest entry
+    """
+    stat = source_file.stat()
+    content_hash = file_hash(source_file)
+    target_file = partition_path(source_file)
+    new_entry = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": content_hash}
+    if (entry is not None and entry["sha256"] == content_hash and target_file.is_file()
+            and keys_path(source_file).is_file()):
+        new_entry["num_rows"] = entry["num_rows"]
+        return 0, 0, new_entry
+
+    parse_options = pa_json.ParseOptions(explicit_schema=AppConst.RAW_JSON_SCHEMA, unexpected_field_behavior="ignore")
+    table = pa_json.read_json(source_file, parse_options=parse_options)
+    table = table.select(AppConst.RAW_JSON_SCHEMA.names)
+
+    keys = listing_keys(table)
+    keep = first_occurrence(keys) & ~is_member(keys, load_keys(AppPath.SEEN_KEYS_NPY, mmap=True))
+    table = table.filter(pa.array(keep)).append_column("listing_key", pa.array(keys[keep], type=pa.uint64()))
+    table = table.append_column("ingested_at", pa.array(np.full(table.num_rows, np.datetime64(ingested_at, "us"))))
+    write_partition(table, target_file, batch_size)
+
+    keys_path(source_file).parent.mkdir(parents=True, exist_ok=True)
+    save_keys(keys_path(source_file), keys[keep])
+
+    new_entry["num_rows"] = table.num_rows
+    return table.num_rows, int(np.count_nonzero(~keep)), new_entry
+
+
+def save_seen_keys(source_files: list):
+    # Keys kept by previous runs, from files that are not ingested again
+    keys = [load_keys(keys_path(source_file)) for source_file in source_files]
+    AppPath.INGEST_KEYS_DIR.mkdir(parents=True, exist_ok=True)
+    save_keys(AppPath.SEEN_KEYS_NPY, np.concatenate(keys) if keys else np.empty(0, dtype=np.uint64))
+
+
+def drop_cross_file_duplicates(ingested_files: list, manifest: dict, batch_size: int) -> int:
+    """Drop the listings that files ingested by the same run have in common, keeping the first one in source file
+    order. Only the keys are read, and only the files with duplicates are rewritten.
+
+    Returns:
+        int: Number of duplicates dropped
+    """
+    keys = [load_keys(keys_path(source_file)) for source_file in ingested_files]
+    is_duplicate = ~first_occurrence(np.concatenate(keys)) if keys else np.empty(0, dtype=bool)
+    file_ends = np.cumsum([len(file_keys) for file_keys in keys])
+
+    num_duplicates = 0
+    for source_file, file_keys, duplicate in zip(ingested_files, keys, np.split(is_duplicate, file_ends[:-1])):
+        if not duplicate.any():
+            continue
+        table = pq.read_table(partition_path(source_file))
+        is_kept = pc.invert(pc.is_in(table.column("listing_key"), value_set=pa.array(file_keys[duplicate])))
+        table = table.filter(is_kept)
+        write_partition(table, partition_path(source_file), batch_size)
+        save_keys(keys_path(source_file), file_keys[~duplicate])
+        manifest[manifest_key(source_file)]["num_rows"] = table.num_rows
+        num_duplicates += int(np.count_nonzero(duplicate))
+    return num_duplicates
+
+
+def remove_stale_partitions(manifest: dict, source_files: list, logger):
+    source_keys = {manifest_key(source_file) for source_file in source_files}
+    for key in sorted(set(manifest) - source_keys):
+        stale_file = partition_path(Path(AppPath.DATA_DIR, key))
+        stale_file.unlink(missing_ok=True)
+        keys_path(Path(AppPath.DATA_DIR, key)).unlink(missing_ok=True)
+        del manifest[key]
+        logger.info(f"Removed {stale_file}, its source file no longer exists")
+
+
+def ingest_time() -> pd.Timestamp:
+    # Naive UTC, like the other timestamps of the data
+    return pd.Timestamp.utcnow().tz_localize(None)
+
+
+def ingest_parallel(config: Config, logger) -> int:
+    ingested_at = ingest_time()
+    source_files = list_source_files()
+    manifest = load_manifest(config)
+    if not manifest:
+        shutil.rmtree(AppPath.RAW_DATASET_DIR, ignore_errors=True)
+        shutil.rmtree(AppPath.INGEST_KEYS_DIR, ignore_errors=True)
+    remove_stale_partitions(manifest, source_files, logger)
+
+    # Files with the same size and mtime as in the manifest are skipped without reading them
+    pending_files = [f for f in source_files if not is_unchanged(f, manifest.get(manifest_key(f)))]
+    logger.info(f"Found {len(source_files)} files, {len(pending_files)} new or modified, "
+                f"ingesting with {config.num_workers} workers...")
+    save_seen_keys([f for f in source_files if f not in pending_files])
+
+    num_rows = 0
+    num_duplicates = 0
+    entries = [manifest.get(manifest_key(f)) for f in pending_files]
+    with ProcessPoolExecutor(max_workers=config.num_workers) as executor:
+        results = executor.map(ingest_file, pending_files, entries, [config.batch_size] * len(pending_files),
+                               [ingested_at] * len(pending_files))
+        for source_file, (file_rows, file_duplicates, entry) in zip(pending_files, results):
+            if file_rows > 0:
+                logger.info(f"Ingested {file_rows} rows from {source_file}, dropped {file_duplicates} duplicates")
+            manifest[manifest_key(source_file)] = entry
+            num_rows += file_rows
+            num_duplicates += file_duplicates
+
+    cross_file_duplicates = drop_cross_file_duplicates(pending_files, manifest, config.batch_size)
+    num_rows -= cross_file_duplicates
+    logger.info(f"Dropped {num_duplicates + cross_file_duplicates} duplicate listings")
+
+    save_manifest(manifest)
+    total_rows = sum(entry["num_rows"] for entry in manifest.values())
+    logger.info(f"Raw dataset holds {total_rows} data points")
+
+    return num_rows
+
+
+def ingest_serial(logger) -> int:
+    data = []
+    for source_file in list_source_files():
+        df = pd.read_json(source_file, orient='records', lines=True)
+        data.append(df)
+    data = pd.concat(data)
+    table = pa.Table.from_pandas(data, schema=AppConst.RAW_JSON_SCHEMA, preserve_index=False)
+    data["listing_key"] = listing_keys(table)
+    # Every run rewrites all the listings, so they all count as new to materialization
+    data["ingested_at"] = ingest_time()
+
+    logger.info("Writing to parquet file...")
+    to_parquet(data, AppPath.DATA_PQ)
+
+    return len(data)
+
+
 def main():
     # Start
     logger = Log(AppConst.INGEST).log
     logger.info("Started: Ingesting...")
     inspect_dir(AppPath.DATA_SOURCE_DIR)
 
-    # Read data
-    data = []
-    for directory in os.listdir(AppPath.DATA_DIR):
-        for file in os.listdir(Path(AppPath.DATA_DIR, directory)):
-            df = pd.read_json(Path(AppPath.DATA_DIR, directory, file), orient='records', lines=True)
-            data.append(df)
-    data = pd.concat(data)
-    logger.info(f"Loaded {len(data)} data points")
-    
-    # Store as parquet file
-    logger.info("Writing to parquet file...")
-    to_parquet(data, AppPath.DATA_PQ)
-    
+    # Load config
+    config = Config()
+    logger.info(f"Loaded config: {config.__dict__}")
+
+    # Read data and store as parquet
+    if config.ingest_mode == "parallel":
+        num_rows = ingest_parallel(config, logger)
+        output_path = AppPath.RAW_DATASET_DIR
+    else:
+        num_rows = ingest_serial(logger)
+        output_path = AppPath.DATA_PQ
+    logger.info(f"Ingested {num_rows} data points")
+
     # End
-    if Path(AppPath.DATA_PQ).is_file():
-        logger.info(f"Successfully created {AppPath.DATA_PQ}")
+    if Path(output_path).exists():
+        logger.info(f"Successfully created {output_path}")
     else:
         logger.error(f"Failed creating the data file")
     inspect_dir(AppPath.DATA_SOURCE_DIR)
 
-    
+
 if __name__ == "__main__":
     main()
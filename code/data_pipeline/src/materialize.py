@@ -0,0 +1,164 @@
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from utils import *
+from common import point_in_time
+from schema import FEATURES_PARTITION_KEY, INGESTED_AT
+
+AppPath()
+
+
+def load_watermarks() -> dict:
+    if AppPath.MATERIALIZE_WATERMARKS_JSON.is_file():
+        return load_json(AppPath.MATERIALIZE_WATERMARKS_JSON)
+    return {}
+
+
+def save_watermark(view_name: str, watermark: pd.Timestamp, stats: dict = None):
+    watermarks = load_watermarks()
+    entry = watermarks.setdefault(view_name, {})
+    entry["watermark"] = watermark.isoformat()
+    if stats is not None:
+        entry["last_run"] = stats
+    dump_json(watermarks, AppPath.MATERIALIZE_WATERMARKS_JSON)
+
+
+def list_months(path) -> list:
+    # Month partitions of the features dataset, oldest first
+    prefix = f"{FEATURES_PARTITION_KEY}="
+    months = [directory.name[len(prefix):] for directory in Path(path).glob(f"{prefix}*") if directory.is_dir()]
+    return sorted(month for month in months if month != parquet_io.HIVE_NULL_PARTITION)
+
+
+def changed_entities(source: dict, watermark: pd.Timestamp) -> pa.Table:
+    # Join keys and ingest time of the rows ingested after the watermark, in any month partition
+    filters = ds.field(INGESTED_AT) > watermark
+    return parquet_io.read_table(source["path"], columns=source["join_keys"] + [INGESTED_AT], filters=filters)
+
+
+def read_increment(source: dict, month: str, entities: pa.Table = None) -> pd.DataFrame:
+    # Rows of one month partition, only the ones of entities if given
+    filters = ds.field(FEATURES_PARTITION_KEY) == month
+    if entities is not None:
+        for key in source["join_keys"]:
+            filters &= ds.field(key).isin(pc.unique(entities.column(key)))
+    columns = source["join_keys"] + [source["timestamp_field"]] + source["feature_names"]
+    df = parquet_io.read_table(source["path"], columns=columns, filters=filters).to_pandas(
+        types_mapper=parquet_io.arrow_types_mapper)
+
+    # Feast converts the rows value by value, so categories are written as plain strings
+    categorical = [column for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)]
+    return df.astype({column: object for column in categorical})
+
+
+def latest_rows(df: pd.DataFrame, join_keys: list, timestamp_field: str) -> pd.DataFrame:
+    # The online store holds the latest row of every entity only
+    df = df.sort_values(timestamp_field, kind="stable")
+    return df.drop_duplicates(subset=join_keys, keep="last")
+
+
+def materialize_increment(source: dict, watermark, write_batch, batch_size: int) -> dict:
+    """Write the latest feature row of every entity with rows ingested after watermark to the online store.
+
+    The watermark is the ingest time of the rows rather than their date_posted, so listings ingested late, or posted
+    on the day of the last run, are not missed. Such a row can be older than the row of its entity that the online
+    store already holds, so the rows of the changed entities are read from every month partition and only the latest
+    row of each is written. A full refresh reads the months one at a time instead, oldest first, and writes the latest
+    row of every entity in each, so newer rows overwrite older ones. Rows are written in batches of batch_size rows.
+    Writes are upserts, so a run that fails halfway is simply run again from the same watermark.
+
+    Args:
+        source (dict): Feature view source, see point_in_time.view_source
+        watermark (pd.Timestamp): Latest ingest time written by previous runs, None to write the whole history
+        write_batch (callable): Writes a DataFrame of rows to the online store
+        batch_size (int): Maximum number of rows per write
+
+    Returns:
+        dict: Throughput statistics of the run and the new watermark
+    """
+    start = time.perf_counter()
+    stats = {"rows_read": 0, "rows_written": 0, "num_batches": 0, "write_seconds": 0.0}
+
+    # Entities with rows ingested after the watermark, every entity on a full refresh
+    entities = None
+    if watermark is None:
+        ingested_at = parquet_io.read_table(source["path"], columns=[INGESTED_AT]).column(INGESTED_AT).to_pandas()
+    else:
+        entities = changed_entities(source, watermark)
+        ingested_at = entities.column(INGESTED_AT).to_pandas()
+        stats["num_entities"] = entities.group_by(source["join_keys"]).aggregate([]).num_rows
+    months = list_months(source["path"]) if len(ingested_at) > 0 else []
+
+    def write(df: pd.DataFrame):
+        for batch_start in range(0, len(df), batch_size):
+            write_start = time.perf_counter()
+            write_batch(df.iloc[batch_start:batch_start + batch_size])
+            stats["write_seconds"] += time.perf_counter() - write_start
+            stats["num_batches"] += 1
+        stats["rows_written"] += len(df)
+
+    increment = []
+    for month in months:
+        df = read_increment(source, month, entities)
+        stats["rows_read"] += len(df)
+        if len(df) == 0:
+            continue
+
+        df = latest_rows(df, source["join_keys"], source["timestamp_field"])
+        if entities is None:
+            write(df)
+        else:
+            # The rows of the changed entities are few, so they are reduced over all the months before writing
+            increment.append(df)
+    if increment:
+        write(latest_rows(pd.concat(increment), source["join_keys"], source["timestamp_field"]))
+
+    # Every row ingested up to the latest ingest time read above is written now
+    watermark = ingested_at.max() if len(ingested_at) > 0 else watermark
+    stats["seconds"] = time.perf_counter() - start
+    stats["write_rows_per_sec"] = stats["rows_written"] / stats["write_seconds"] if stats["write_seconds"] > 0 else None
+    stats["watermark"] = watermark.isoformat() if watermark is not None else None
+    return stats
+
+
+def main():
+    # Start
+    logger = Log(AppConst.MATERIALIZE).log
+    logger.info("Started: Materializing offline features to the online store...")
+
+    # Load config
+    config = Config()
+    logger.info(f"Loaded config: {config.__dict__}")
+
+    # Resolve the feature view source from the registry
+    from feast import FeatureStore
+    store = FeatureStore(repo_path=AppPath.FEATURE_STORE_REPO)
+    view_name = AppConst.FEATURE_VIEW
+    source = point_in_time.view_source(store, view_name)
+
+    # Continue after the watermark of the last successful run
+    watermark = None
+    if not config.full_refresh and view_name in load_watermarks():
+        watermark = pd.Timestamp(load_watermarks()[view_name]["watermark"])
+    logger.info(f"Materializing the {view_name} entities with rows ingested after {watermark}")
+
+    stats = materialize_increment(
+        source,
+        watermark,
+        lambda batch: store.write_to_online_store(view_name, batch),
+        config.batch_size,
+    )
+
+    # End
+    if stats["watermark"] is not None:
+        save_watermark(view_name, pd.Timestamp(stats["watermark"]), stats)
+    logger.info(f"Wrote {stats['rows_written']} of {stats['rows_read']} rows read in {stats['num_batches']} "
+                f"batches, {stats['seconds']:.2f} s in total")
+    logger.info(f"Run statistics: {stats}")
+
+
+if __name__ == "__main__":
+    main()
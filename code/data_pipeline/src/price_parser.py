@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+# Value of each Vietnamese price unit in VND
+PRICE_UNITS = {
+    'tỷ': 1e9,
+    'triệu': 1e6,
+    'nghìn': 1e3,
+    'đ': 1.0,
+}
+PRICE_PATTERN = r'(?P<amount>\d+(?:[.,]\d+)?)\s*(?P<unit>' + '|'.join(PRICE_UNITS) + r')(?!\w)'
+
+
+def parse_price(price: pd.Series) -> tuple:
+    """Convert Vietnamese price strings such as "2 tỷ 500 triệu" into billions of VND.
+
+    Listings share a small set of distinct price strings, so the prices are factorized first and only the distinct
+    strings are parsed: every (amount, unit) pair is extracted at once, multiplied by the value of its unit and
+    summed per string. The result is then gathered back to the rows by their codes. A price is unparseable when it
+    contains no pair or when anything besides the pairs is left in it, e.g. "Thỏa thuận".
+
+    Args:
+        price (pd.Series): Price strings
+
+    Returns:
+        tuple: Prices in billions of VND with NaN for unparseable prices, and the boolean mask of unparseable rows
+    """
+    codes, uniques = pd.factorize(price)
+    uniques = pd.Series(uniques, dtype='object')
+
+    matches = uniques.str.extractall(PRICE_PATTERN)
+    amounts = matches['amount'].str.replace(',', '.', regex=False).astype('float')
+    multipliers = matches['unit'].map(PRICE_UNITS)
+    values = (amounts * multipliers).groupby(level=0).sum().reindex(uniques.index)
+
+    leftover = uniques.str.replace(PRICE_PATTERN, '', regex=True).str.strip()
+    values[leftover.ne('') | values.isna()] = np.nan
+
+    # Missing prices get the code -1, which picks the trailing NaN
+    unique_prices = np.append(values.to_numpy() / 1e9, np.nan)
+    price_billion = pd.Series(unique_prices[codes], index=price.index)
+
+    return price_billion, price_billion.isna()
@@ -0,0 +1,157 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from utils import *
+from hyperloglog import HyperLogLog
+from quantile_sketch import QuantileSketch
+
+PROFILE_QUANTILES = [0.01, 0.25, 0.5, 0.75, 0.99]
+
+
+class ColumnProfile:
+    """Statistics of one column, updated batch by batch and mergeable across workers.
+
+    Every column gets its null and approximate distinct counts. Numeric and datetime columns also get their min, max,
+    mean and variance, merged with the parallel formula of Chan et al., and approximate quantiles. Datetimes are
+    profiled as nanoseconds and converted back on output.
+    """
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.count = 0
+        self.null_count = 0
+        self.distinct = HyperLogLog()
+        self.num_values = 0
+        self.min = np.nan
+        self.max = np.nan
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sketch = QuantileSketch() if kind != "other" else None
+
+    @staticmethod
+    def column_kind(values: pd.Series) -> str:
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return "datetime"
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            return "numeric"
+        return "other"
+
+    def update(self, values: pd.Series) -> None:
+        self.count += len(values)
+        self.null_count += int(values.isna().sum())
+        self.distinct.update(values)
+        if self.sketch is None:
+            return
+
+        if self.kind == "datetime":
+            numbers = values.dropna().to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+        else:
+            numbers = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            numbers = numbers[~np.isnan(numbers)]
+        if len(numbers) == 0:
+            return
+        self.sketch.update(numbers)
+        self._merge_moments(len(numbers), numbers.mean(), ((numbers - numbers.mean()) ** 2).sum(),
+                            numbers.min(), numbers.max())
+
+    def _merge_moments(self, n: int, mean: float, m2: float, minimum: float, maximum: float) -> None:
+        total = self.num_values + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.num_values * n / total
+        self.num_values = total
+        self.min = np.fmin(self.min, minimum)
+        self.max = np.fmax(self.max, maximum)
+
+    def merge(self, other: "ColumnProfile") -> None:
+        self.count += other.count
+        self.null_count += other.null_count
+        self.distinct.merge(other.distinct)
+        if self.sketch is None:
+            return
+        self.sketch.merge(other.sketch)
+        if other.num_values > 0:
+            self._merge_moments(other.num_values, other.mean, other.m2, other.min, other.max)
+
+    def _value(self, value):
+        if np.isnan(value):
+            return None
+        if self.kind == "datetime":
+            return pd.Timestamp(int(value)).isoformat()
+        return float(value)
+
+    def to_dict(self) -> dict:
+        profile = {
+            "kind": self.kind,
+            "count": self.count,
+            "null_count": self.null_count,
+            "null_proportion": round(self.null_count / self.count, 3) if self.count > 0 else None,
+            "approx_distinct": round(self.distinct.count()),
+        }
+        if self.sketch is not None:
+            has_std = self.num_values > 1 and self.kind == "numeric"
+            profile.update({
+                "min": self._value(self.min),
+                "max": self._value(self.max),
+                "mean": self._value(self.mean) if self.num_values > 0 else None,
+                "std": float(np.sqrt(self.m2 / (self.num_values - 1))) if has_std else None,
+                "approx_quantiles": {str(q): self._value(self.sketch.quantile(q)) for q in PROFILE_QUANTILES},
+            })
+        return profile
+
+
+def list_row_groups(path) -> list:
+    # (file, row group) pairs of a Parquet file or dataset directory
+    row_groups = []
+    for file in sorted(ds.dataset(path, format="parquet", partitioning="hive").files):
+        num_row_groups = pq.ParquetFile(file).metadata.num_row_groups
+        row_groups.extend((file, index) for index in range(num_row_groups))
+    return row_groups
+
+
+def profile_row_groups(row_groups: list) -> dict:
+    profiles = {}
+    for file, index in row_groups:
+        table = pq.ParquetFile(file, memory_map=True).read_row_group(index)
+        df = table.to_pandas(types_mapper=parquet_io.arrow_types_mapper)
+        for column in df.columns:
+            if column not in profiles:
+                profiles[column] = ColumnProfile(ColumnProfile.column_kind(df[column]))
+            profiles[column].update(df[column])
+    return profiles
+
+
+def profile_dataset(path, num_workers: int) -> dict:
+    """Profile every column of a Parquet file or dataset directory in a single read.
+
+    The row groups are split between num_workers processes. Each one reads its row groups one at a time, so the
+    memory of a worker is bounded by a row group and the fixed-size sketches, and the per-worker profiles are merged
+    at the end.
+
+    Args:
+        path: Parquet file or dataset directory
+        num_workers (int): Number of worker processes
+
+    Returns:
+        dict: Number of rows and the profile of every column
+    """
+    row_groups = list_row_groups(path)
+    chunks = [chunk.tolist() for chunk in np.array_split(np.arange(len(row_groups)), max(num_workers, 1))]
+    chunks = [[row_groups[i] for i in chunk] for chunk in chunks if len(chunk) > 0]
+
+    with ProcessPoolExecutor(max_workers=max(len(chunks), 1)) as executor:
+        worker_profiles = list(executor.map(profile_row_groups, chunks))
+
+    profiles = {}
+    for worker_profile in worker_profiles:
+        for column, profile in worker_profile.items():
+            if column in profiles:
+                profiles[column].merge(profile)
+            else:
+                profiles[column] = profile
+
+    num_rows = max((profile.count for profile in profiles.values()), default=0)
+    return {"num_rows": num_rows, "columns": {column: profile.to_dict() for column, profile in profiles.items()}}
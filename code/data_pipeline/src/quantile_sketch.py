@@ -0,0 +1,63 @@
+import math
+
+import numpy as np
+
+
+class QuantileSketch:
+    """Mergeable streaming quantile sketch (KLL).
+
+    Values are kept in a hierarchy of compactors, where an item at level h stands for 2^h values. When a level
+    outgrows its capacity it is sorted and every other item, starting at a random offset, is promoted to the next
+    level. Capacities shrink geometrically towards the lower levels, so the memory stays O(k) however many values
+    are added, and two sketches are merged by concatenating their levels and compacting again.
+    """
+
+    def __init__(self, k: int = 2000, seed: int = 0) -> None:
+        self.k = k
+        self.count = 0
+        self.compactors = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(2, math.ceil(self.k * (2 / 3) ** depth))
+
+    def update(self, values) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.compactors[0] = np.concatenate([self.compactors[0], values])
+        self._compress()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.empty(0))
+        for level, items in enumerate(other.compactors):
+            self.compactors[level] = np.concatenate([self.compactors[level], items])
+        self.count += other.count
+        self._compress()
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.compactors):
+            items = self.compactors[level]
+            if len(items) > self.capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays at its level so that the total weight is preserved exactly
+                keep = items[len(items) - len(items) % 2:]
+                promoted = items[self.rng.integers(2):len(items) - len(items) % 2:2]
+                self.compactors[level] = keep
+                self.compactors[level + 1] = np.concatenate([self.compactors[level + 1], promoted])
+            level += 1
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return np.nan
+        items = np.concatenate(self.compactors)
+        weights = np.concatenate([np.full(len(c), 2.0 ** level) for level, c in enumerate(self.compactors)])
+        order = np.argsort(items, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        rank = np.searchsorted(cumulative, q * cumulative[-1], side="left")
+        return float(items[order][min(rank, len(items) - 1)])
@@ -0,0 +1,91 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Parsed listings. Text is kept in Arrow strings, measures in float32 and counts in int32, the smallest integer
+# type Feast has
+PARSED_SCHEMA = pa.schema([
+    ('title', pa.string()),
+    ('price', pa.float32()),
+    ('content', pa.string()),
+    ('address', pa.string()),
+    ('street', pa.string()),
+    ('ward', pa.string()),
+    ('district', pa.string()),
+    ('city', pa.string()),
+    ('area', pa.float32()),
+    ('usable_area', pa.float32()),
+    ('num_bedrooms', pa.int32()),
+    ('num_bathrooms', pa.int32()),
+    ('legal_document', pa.string()),
+    ('date_posted', pa.timestamp('ns')),
+    ('property_id', pa.string()),
+    ('width', pa.float32()),
+    ('length', pa.float32()),
+    ('ingested_at', pa.timestamp('ns')),
+])
+
+# Low-cardinality columns, dictionary-encoded against the categories saved next to the data
+CATEGORY_COLUMNS = ['street', 'district', 'city', 'legal_document']
+CATEGORY_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+FEATURES_COLUMNS = ['title', 'address', 'content', 'street', 'district', 'city', 'num_bedrooms', 'num_bathrooms',
+                    'legal_document', 'date_posted', 'property_id', 'area', 'width', 'length', 'ingested_at']
+ENTITY_COLUMNS = ['property_id', 'date_posted', 'price']
+# The features are partitioned by the month they were posted in, e.g. month=2023-01
+FEATURES_PARTITION_KEY = 'month'
+# Start time of the ingest run that wrote a listing. Unlike date_posted, it only grows from one run to the next, so it
+# is the watermark of the materialization.
+INGESTED_AT = 'ingested_at'
+
+FEATURES_SCHEMA = pa.schema([
+    pa.field(column, CATEGORY_TYPE) if column in CATEGORY_COLUMNS else PARSED_SCHEMA.field(column)
+    for column in FEATURES_COLUMNS
+])
+ENTITY_SCHEMA = pa.schema([PARSED_SCHEMA.field(column) for column in ENTITY_COLUMNS])
+
+PANDAS_DTYPES = {
+    pa.string(): pd.StringDtype('pyarrow'),
+    pa.float32(): 'float32',
+    pa.int32(): pd.Int32Dtype(),
+    pa.timestamp('ns'): 'datetime64[ns]',
+}
+
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast the parsed columns of df to the in-memory types of PARSED_SCHEMA."""
+    dtypes = {field.name: PANDAS_DTYPES[field.type] for field in PARSED_SCHEMA if field.name in df.columns}
+    return df.astype(dtypes, copy=False)
+
+
+def update_categories(categories: dict, df: pd.DataFrame) -> dict:
+    """Add the unseen values of the category columns of df to categories.
+
+    Known values keep their position and new ones are appended in sorted order, so the codes of a value never change
+    from one run to the next.
+
+    Args:
+        categories (dict): Category column -> list of its values, as saved by previous runs
+        df (pd.DataFrame): Data with the category columns
+
+    Returns:
+        dict: The updated categories
+    """
+    updated = {}
+    for column in CATEGORY_COLUMNS:
+        known = categories.get(column, [])
+        values = pd.Series(df[column].dropna().unique(), dtype='object')
+        updated[column] = known + sorted(values[~values.isin(known)])
+    return updated
+
+
+def categorize(df: pd.DataFrame, categories: dict) -> pd.DataFrame:
+    dtypes = {column: pd.CategoricalDtype(categories[column]) for column in CATEGORY_COLUMNS if column in df.columns}
+    return df.astype(dtypes, copy=False)
+
+
+def features_table(df: pd.DataFrame) -> pa.Table:
+    """Convert categorized features to FEATURES_SCHEMA, with the month partition of every row appended."""
+    table = pa.Table.from_pandas(df, schema=FEATURES_SCHEMA, preserve_index=False)
+    month = pc.strftime(table.column('date_posted'), format='%Y-%m')
+    return table.append_column(FEATURES_PARTITION_KEY, month)
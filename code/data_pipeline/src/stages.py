@@ -0,0 +1,59 @@
+from utils import *
+from common import stage_cache
+from common.stage_cache import Stage
+
+AppPath()
+
+SRC_DIR = Path(AppPath.DATA_PIPELINE_DIR, "src")
+FEATURE_DEFINITIONS = sorted(AppPath.FEATURE_STORE_REPO.glob("*.py")) + [
+    Path(AppPath.FEATURE_STORE_REPO, "feature_store.yaml")
+]
+PARSER_CODE = [Path(SRC_DIR, file) for file in ["address_parser.py", "info_parser.py", "price_parser.py",
+                                                "quantile_sketch.py", "schema.py"]]
+
+
+def build_stages(config: Config) -> dict:
+    raw_data = [AppPath.RAW_DATASET_DIR] if config.ingest_mode == "parallel" else [AppPath.DATA_PQ]
+    # The manifest and the listing keys of the ingested files are what makes the next ingest incremental
+    ingest_state = [AppPath.INGEST_MANIFEST, AppPath.INGEST_KEYS_DIR] if config.ingest_mode == "parallel" else []
+    return {
+        "ingest": Stage(
+            "ingest",
+            inputs=[AppPath.DATA_DIR],
+            outputs=raw_data + ingest_state,
+            code=[Path(SRC_DIR, file) for file in ["ingest.py", "dedup.py", "utils.py"]] + [stage_cache.COMMON_DIR],
+            env=["INGEST_MODE", "FULL_REFRESH"],
+        ),
+        "clean": Stage(
+            "clean",
+            inputs=raw_data,
+            # The categories are read and appended to, so they are an output only
+            outputs=[AppPath.FEATURES_DIR, AppPath.ENTITY_PQ, AppPath.CATEGORIES_JSON],
+            code=[Path(SRC_DIR, file) for file in ["clean.py", "dedup.py", "utils.py"]] + PARSER_CODE
+            + [stage_cache.COMMON_DIR],
+            env=["INGEST_MODE", "CLEAN_MODE"],
+        ),
+        "exploration": Stage(
+            "exploration",
+            inputs=[AppPath.FEATURES_DIR, AppPath.ENTITY_PQ],
+            outputs=[AppPath.PROFILE_JSON],
+            code=[Path(SRC_DIR, file) for file in ["exploration.py", "profiler.py", "hyperloglog.py", "quantile_sketch.py",
+                                                   "utils.py"]],
+        ),
+        # Materialization updates the registry too, so it only has to exist
+        "feast_apply": Stage(
+            "feast_apply",
+            inputs=FEATURE_DEFINITIONS,
+            outputs=[Path(AppPath.FEATURE_STORE_REPO, "registry", "local_registry.db")],
+            verify_outputs=False,
+        ),
+    }
+
+
+def main():
+    logger = Log(AppConst.STAGES).log
+    stage_cache.main(build_stages(Config()), AppPath.STAGE_CACHE_DIR, logger)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
 import os
 import sys
+import json
+import shutil
 from pathlib import Path
 import logging
 import pandas as pd
+import pyarrow as pa
+
+# The modules shared by every subsystem live in code/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import parquet_io
 
 
 class AppConst:
@@ -10,6 +17,23 @@ class AppConst:
     INGEST = "ingest"
     CLEAN = "clean"
     EXPLORATION = "exploration"
+    STAGES = "stages"
+    MATERIALIZE = "materialize"
+    FEATURE_VIEW = "properties_fv"
+    RAW_PARTITION_KEY = "crawl"
+    # Fields of the crawled items, and the raw dataset with the deduplication key and the ingest time of every listing
+    RAW_JSON_SCHEMA = pa.schema([
+        ("title", pa.string()),
+        ("price", pa.string()),
+        ("additional_info", pa.list_(pa.string())),
+        ("content", pa.string()),
+        ("address", pa.string()),
+    ])
+    RAW_SCHEMA = pa.schema(list(RAW_JSON_SCHEMA) + [
+        pa.field("listing_key", pa.uint64()),
+        # Microseconds, the resolution Parquet files store timestamps in, so rewritten partitions keep the schema
+        pa.field("ingested_at", pa.timestamp("us")),
+    ])
     
 
 class AppPath:
@@ -23,12 +47,35 @@ class AppPath:
 
     # Files
     DATA_PQ = Path(DATA_SOURCE_DIR, "data.parquet")
-    FEATURES_PQ = Path(DATA_SOURCE_DIR, "features.parquet")
+    RAW_DATASET_DIR = Path(DATA_SOURCE_DIR, "raw_dataset")
+    INGEST_MANIFEST = Path(DATA_SOURCE_DIR, "ingest_manifest.json")
+    INGEST_KEYS_DIR = Path(DATA_SOURCE_DIR, "ingest_keys")
+    SEEN_KEYS_NPY = Path(INGEST_KEYS_DIR, "seen.npy")
+    CLEAN_STAGING_PQ = Path(DATA_SOURCE_DIR, "clean_staging.parquet")
+    FEATURES_DIR = Path(DATA_SOURCE_DIR, "features")
+    FEATURES_STAGING_DIR = Path(DATA_SOURCE_DIR, "features.tmp")
     ENTITY_PQ = Path(DATA_SOURCE_DIR, "entity.parquet")
+    CATEGORIES_JSON = Path(DATA_SOURCE_DIR, "categories.json")
+    PROFILE_JSON = Path(DATA_SOURCE_DIR, "profile.json")
+    MATERIALIZE_WATERMARKS_JSON = Path(DATA_SOURCE_DIR, "materialize_watermarks.json")
+    STAGE_CACHE_DIR = Path(DATA_SOURCE_DIR, "stage_cache", "data_pipeline")
     
     def __init__(self) -> None:
         AppPath.DATA_SOURCE_DIR.mkdir(parents=True, exist_ok=True)
-        
+
+
+class Config:
+    def __init__(self) -> None:
+        # "serial" writes a single data.parquet, "parallel" writes the partitioned raw dataset
+        self.ingest_mode = os.getenv("INGEST_MODE", "parallel")
+        self.num_workers = int(os.getenv("NUM_WORKERS", os.cpu_count()))
+        self.batch_size = int(os.getenv("BATCH_SIZE", 50_000))
+        # Ignore the ingest manifest and rebuild the raw dataset from scratch, and materialize the whole history
+        self.full_refresh = os.getenv("FULL_REFRESH", "false").lower() == "true"
+        # "memory" cleans the whole dataset at once, "parallel" parses its partitions on num_workers processes
+        # and "chunked" streams it in batches of batch_size rows, from the raw dataset of the parallel ingest only
+        self.clean_mode = os.getenv("CLEAN_MODE", "memory")
+
 
 class Log:
     log: logging.Logger = None
@@ -71,12 +118,52 @@ def inspect_current_dir():
     inspect_dir(cwd)
 
 
-def read_parquet(path) -> pd.DataFrame:
+def read_parquet(path, columns=None, filters=None) -> pd.DataFrame:
     Log().log.info(f"Stared: read_parquet {path}")
-    df = pd.read_parquet(path, engine="fastparquet")
+    df = parquet_io.read_parquet(path, columns=columns, filters=filters)
     return df
 
 
 def to_parquet(df: pd.DataFrame, path):
     Log().log.info(f"Started: to_parquet {path}")
-    df.to_parquet(path, engine="fastparquet")
+    parquet_io.to_parquet(df, path)
+
+
+def read_table(path, columns=None, filters=None) -> pd.DataFrame:
+    # Like read_parquet, with Arrow strings and nullable integers
+    Log().log.info(f"Started: read_table {path}")
+    df = parquet_io.read_parquet(path, columns=columns, filters=filters, arrow_strings=True)
+    return df
+
+
+def write_table(df: pd.DataFrame, path, schema: pa.Schema):
+    Log().log.info(f"Started: write_table {path}")
+    parquet_io.to_parquet(df, path, schema=schema, preserve_index=False)
+
+
+def write_dataset(table: pa.Table, path, partition_col: str):
+    Log().log.info(f"Started: write_dataset {path}")
+    parquet_io.write_dataset(table, path, partition_col)
+
+
+def replace_dir(source_dir, target_dir):
+    # Swap a fully written directory in, so that readers never see a partially written one
+    shutil.rmtree(target_dir, ignore_errors=True)
+    os.replace(source_dir, target_dir)
+
+
+def dump_json(dict_obj: dict, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(dict_obj, f, indent=4, ensure_ascii=False)
+
+
+def load_json(path) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data
+
+
+def load_raw_data(config) -> pd.DataFrame:
+    if config.ingest_mode == "parallel":
+        return read_table(AppPath.RAW_DATASET_DIR, columns=AppConst.RAW_SCHEMA.names)
+    return read_parquet(AppPath.DATA_PQ)
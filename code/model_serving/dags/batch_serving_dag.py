@@ -21,19 +21,19 @@ with DAG(
     feature_store_init_task = DockerOperator(
         task_id="feature_store_init_task",
         **DefaultConfig.DEFAULT_DOCKER_OPERATORS_ARGS,
-        command="/bin/bash -c 'feast -c ../../feature_repo apply'"
+        command="/bin/bash -c 'python src/stages.py feast_apply feast -c ../../feature_repo apply'"
     )
     
     data_extraction_task = DockerOperator(
         task_id="data_extraction_task",
         **DefaultConfig.DEFAULT_DOCKER_OPERATORS_ARGS,
-        command="/bin/bash -c 'cd .. && python model_serving/src/data_extraction.py'"
+        command="/bin/bash -c 'cd .. && python model_serving/src/stages.py data_extraction python model_serving/src/data_extraction.py'"
     )
     
     batch_prediction_task = DockerOperator(
         task_id="batch_prediction_task",
         **DefaultConfig.DEFAULT_DOCKER_OPERATORS_ARGS,
-        command="/bin/bash -c 'cd .. && python model_serving/src/batch_prediction.py'"
+        command="/bin/bash -c 'cd .. && python model_serving/src/stages.py batch_prediction python model_serving/src/batch_prediction.py'"
     )
     
     (feature_store_init_task >> data_extraction_task >> batch_prediction_task)
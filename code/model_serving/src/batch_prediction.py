@@ -21,13 +21,16 @@ def main():
     logger.info(f"Loaded registered_model_dict: {registered_model_dict}")
     registered_model = registered_model_dict["register_models"][0]
     model_uri = registered_model["_source"]
+    run_id = registered_model["_run_id"]
     
     mlflow.set_tracking_uri(config.mlflow_tracking_uri)
     mlflow_model = mlflow.pyfunc.load_model(model_uri=model_uri)
     logger.info(mlflow_model.__dict__)
+    category_encoder = load_category_encoder(run_id)
     
     # Load data
     batch_df = read_parquet(AppPath.BATCH_INPUT_PQ)
+    batch_df = nullable_to_float(category_encoder.transform(batch_df))
     
     # Restructure features
     model_signature = mlflow_model.metadata.signature
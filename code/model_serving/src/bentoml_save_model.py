@@ -38,6 +38,7 @@ def save_model() -> bentoml.Model:
     logger.info(f"Loaded model dict: {mlflow_model.__dict__}")
     model = mlflow_model._model_impl.xgb_model
     model_signature: ModelSignature = mlflow_model.metadata.signature
+    category_encoder = load_category_encoder(run_id)
     
     # Construct feature list
     feature_list = []
@@ -63,6 +64,7 @@ def save_model() -> bentoml.Model:
         },
         custom_objects={
             "feature_list": feature_list,
+            "category_codes": category_encoder.to_dict(),
         },
     )
     logger.info(f"Saved bentoml model dict: {bentoml_model.__dict__}")
@@ -1,3 +1,4 @@
+import time
 from typing import List, Optional, Dict, Any
 
 import bentoml
@@ -11,6 +12,7 @@ from mlflow.models.signature import ModelSignature
 from pydantic import BaseModel
 
 from utils import *
+from feature_cache import FeatureCache
 
 logger = Log(AppConst.BENTOML_SERVICE).log
 AppPath()
@@ -20,10 +22,32 @@ config = Config()
 
 bentoml_model = bentoml.xgboost.get("xgboost-reg:latest")
 feature_list = bentoml_model.custom_objects["feature_list"]
+# Models saved before the categorical features were encoded have no codes
+category_encoder = CategoryEncoder(bentoml_model.custom_objects.get("category_codes"))
 bentoml_runner = bentoml_model.to_runner()
 svc = bentoml.Service(bentoml_model.tag.name, runners=[bentoml_runner])
 fs = FeatureStore(repo_path=AppPath.FEATURE_STORE_REPO)
 
+# Model features that the online store serves, the rest are filled like in batch prediction
+online_feature_names = [feature.name for feature in fs.get_feature_view(AppConst.FEATURE_VIEW).features
+                        if feature.name in feature_list]
+online_features = [f"{AppConst.FEATURE_VIEW}:{name}" for name in online_feature_names]
+feature_cache = FeatureCache(config.feature_cache_size, config.feature_cache_ttl)
+
+feature_cache_lookups = bentoml.metrics.Counter(
+    name="feature_cache_lookups",
+    documentation="Entity lookups in the feature cache, by result",
+    labelnames=["result"],
+)
+feature_cache_hit_rate = bentoml.metrics.Gauge(
+    name="feature_cache_hit_rate",
+    documentation="Share of the entity lookups served by the feature cache since the worker started",
+)
+online_feature_fetch_seconds = bentoml.metrics.Histogram(
+    name="online_feature_fetch_seconds",
+    documentation="Latency of the batched online store reads of the entities missing from the feature cache",
+)
+
 
 def predict(request: np.ndarray) -> np.ndarray:
     logger.info(f"Started: predict")
@@ -36,7 +60,8 @@ def predict(request: np.ndarray) -> np.ndarray:
     
 class InferenceRequest(BaseModel):
     request_id: str
-    features: Dict[str, List[float]]
+    # Numbers, or the values of the categorical features such as district names
+    features: Dict[str, List[Any]]
     
 
 class InferenceResponse(BaseModel):
@@ -69,7 +94,7 @@ def inference(
         
         df = pd.DataFrame.from_dict(features)
         logger.info(df)
-        input_features = df[feature_list]
+        input_features = category_encoder.transform(df)[feature_list]
         logger.info(f"input_features: {input_features}")
         
         prediction = predict(input_features)
@@ -87,3 +112,92 @@ def inference(
     logger.info(f"response: {response}")
     
     return response
+
+
+
+class PropertyInferenceRequest(BaseModel):
+    request_id: str
+    property_ids: List[str]
+
+
+class PropertyInferenceResponse(BaseModel):
+    prediction: Optional[List[Optional[float]]]
+    error: Optional[str]
+
+
+def fetch_features(property_ids: list) -> dict:
+    """Get the online features of property_ids, from the cache, then with one batched online store read for the
+    ids missing from it.
+
+    Returns:
+        dict: Feature name -> value of every property id, values are None for properties the online store lacks
+    """
+    features, missing = feature_cache.get_many(property_ids)
+    feature_cache_lookups.labels(result="hit").inc(len(features))
+    feature_cache_lookups.labels(result="miss").inc(len(missing))
+
+    if missing:
+        start = time.perf_counter()
+        online = fs.get_online_features(
+            features=online_features,
+            entity_rows=[{"property_id": property_id} for property_id in missing],
+        ).to_dict()
+        online_feature_fetch_seconds.observe(time.perf_counter() - start)
+
+        fetched = {
+            property_id: {name: online[name][i] for name in online_feature_names}
+            for i, property_id in enumerate(missing)
+        }
+        feature_cache.put_many(fetched)
+        features.update(fetched)
+
+    feature_cache_hit_rate.set(feature_cache.hit_rate())
+    return features
+
+
+@svc.api(
+    input=JSON(pydantic_model=PropertyInferenceRequest),
+    output=JSON(pydantic_model=PropertyInferenceResponse)
+)
+def inference_by_ids(
+    request: PropertyInferenceRequest,
+    ctx: bentoml.Context
+) -> Dict[str, Any]:
+    """Run inference on properties identified by their ids, with their features read from the online store
+
+    Args:
+        request (PropertyInferenceRequest): Ids of the properties to predict the price of
+        ctx (bentoml.Context): Request context
+
+    Returns:
+        Dict[str, Any]: Prediction of every property id in request order, None for the properties the online store
+            has no features of
+    """
+    logger.info("Started: inference_by_ids")
+    response = PropertyInferenceResponse()
+    try:
+        logger.info(f"request: {request}")
+        features = fetch_features(list(dict.fromkeys(request.property_ids)))
+
+        df = pd.DataFrame([features[property_id] for property_id in request.property_ids],
+                          columns=online_feature_names)
+        is_known = df.notna().any(axis=1).to_numpy()
+        df = category_encoder.transform(df)
+        for col in feature_list:
+            if col not in df.columns:
+                df[col] = 0
+        input_features = df[feature_list].astype(np.float32)
+        logger.info(f"input_features: {input_features}")
+
+        prediction = predict(input_features)
+        response.prediction = [float(value) if known else None for value, known in zip(prediction, is_known)]
+        ctx.response.status_code = 200
+
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        response.error = str(e)
+        ctx.response.status_code = 500
+
+    logger.info(f"response: {response}")
+
+    return response
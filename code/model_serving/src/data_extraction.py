@@ -25,19 +25,22 @@ def main():
     
     # Retrieve feature data
     logger.info("Fetching feature..")
-    batch_input_df = fs.get_historical_features(
-        entity_df=entity_df,
-        features=[
+    batch_input_df = get_historical_features(
+        fs,
+        entity_df,
+        [
             "properties_fv:area",
             "properties_fv:width",
             "properties_fv:length",
             "properties_fv:num_bedrooms",
             "properties_fv:num_bathrooms",
-            # "properties_fv:district",
-            # "properties_fv:city",
-            # "properties_fv:legal_document"
-        ]
-    ).to_df()
+            "properties_fv:district",
+            "properties_fv:city",
+            "properties_fv:legal_document"
+        ],
+        config.feature_retrieval,
+        config.feature_lookback_days
+    )
     
     # Drop unecessary columns
     batch_input_df = batch_input_df.drop(columns=["date_posted"])
@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class FeatureCache:
+    """In-process LRU cache of the online features of entities, with a time to live.
+
+    Entries older than ttl seconds are treated as missing, so the features of an entity are at most ttl seconds
+    staler than the online store. When the cache is full, the least recently used entry is evicted. The cache is
+    shared between the request threads of a worker, so every operation holds a lock.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: list) -> tuple:
+        """Look up keys.
+
+        Returns:
+            tuple: Dict of the cached values by key, and the list of keys that are missing or expired
+        """
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self.entries.move_to_end(key)
+                    found[key] = entry[1]
+                else:
+                    if entry is not None:
+                        del self.entries[key]
+                    missing.append(key)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, values: dict):
+        expires_at = time.monotonic() + self.ttl
+        with self.lock:
+            for key, value in values.items():
+                self.entries[key] = (expires_at, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return self.hits / lookups if lookups > 0 else 0.0
@@ -0,0 +1,46 @@
+from utils import *
+from common import stage_cache
+from common.stage_cache import Stage
+
+AppPath()
+
+SRC_DIR = Path(AppPath.MODEL_SERVING_DIR, "src")
+FEATURE_DEFINITIONS = sorted(AppPath.FEATURE_STORE_REPO.glob("*.py")) + [
+    Path(AppPath.FEATURE_STORE_REPO, "feature_store.yaml")
+]
+
+
+def build_stages(config: Config) -> dict:
+    return {
+        # Materialization updates the registry too, so it only has to exist
+        "feast_apply": Stage(
+            "feast_apply",
+            inputs=FEATURE_DEFINITIONS,
+            outputs=[Path(AppPath.FEATURE_STORE_REPO, "registry", "local_registry.db")],
+            verify_outputs=False,
+        ),
+        "data_extraction": Stage(
+            "data_extraction",
+            inputs=[config.batch_input_file, AppPath.FEATURES_DIR] + FEATURE_DEFINITIONS,
+            outputs=[AppPath.BATCH_INPUT_PQ],
+            code=[Path(SRC_DIR, "data_extraction.py"), Path(SRC_DIR, "utils.py"), stage_cache.COMMON_DIR],
+            env=["FEATURE_RETRIEVAL"],
+        ),
+        # A registered model file points to an immutable run artifact, so it stands for the model
+        "batch_prediction": Stage(
+            "batch_prediction",
+            inputs=[config.registered_model_file, AppPath.BATCH_INPUT_PQ],
+            outputs=[AppPath.BATCH_OUTPUT_PQ],
+            code=[Path(SRC_DIR, "batch_prediction.py"), Path(SRC_DIR, "utils.py"), stage_cache.COMMON_DIR],
+            env=["MLFLOW_TRACKING_URI"],
+        ),
+    }
+
+
+def main():
+    logger = Log(AppConst.STAGES).log
+    stage_cache.main(build_stages(Config()), AppPath.STAGE_CACHE_DIR, logger)
+
+
+if __name__ == "__main__":
+    main()
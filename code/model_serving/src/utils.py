@@ -2,6 +2,7 @@ import os
 import sys
 import json
 import logging
+from datetime import timedelta
 from pathlib import Path
 
 import numpy as np
@@ -9,12 +10,22 @@ import pandas as pd
 from dotenv import load_dotenv
 load_dotenv()
 
+# The modules shared by every subsystem live in code/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import parquet_io, point_in_time
+from common.category_encoding import CategoryEncoder, ENCODER_FILE
+
 
 class AppConst:
     LOG_LEVEL = logging.DEBUG
     DATA_EXTRACTION = "data_extraction"
     BATCH_PREDICTION = "batch_prediction"
     BENTOML_SERVICE = "bentoml_service"
+    STAGES = "stages"
+    FEATURE_VIEW = "properties_fv"
+    # Partition column of the offline features, one directory per month of date_posted
+    FEATURES_PARTITION_KEY = "month"
+    MLFLOW_ENCODER_PATH_PREFIX = "encoding"
     
 
 class AppPath:
@@ -23,10 +34,12 @@ class AppPath:
     
     DATA_SOURCE_DIR = Path(ROOT_DIR, "data_sources")
     FEATURE_STORE_REPO = Path(ROOT_DIR, "feature_repo")
+    FEATURES_DIR = Path(DATA_SOURCE_DIR, "features")
     
     ARTIFACTS_DIR = Path(MODEL_SERVING_DIR, "artifacts")
     BATCH_INPUT_PQ = Path(ARTIFACTS_DIR, "batch_input.parquet")
     BATCH_OUTPUT_PQ = Path(ARTIFACTS_DIR, "batch_output.parquet")
+    STAGE_CACHE_DIR = Path(ARTIFACTS_DIR, "stage_cache")
     
     def __init__(self) -> None:
         AppPath.ARTIFACTS_DIR.mkdir(parents=True, exist_ok=True)
@@ -35,14 +48,14 @@ class AppPath:
 class Config:
     def __init__(self) -> None:
         self.feature_dict = {
-            "area": np.float64,
-            "width": np.float64,
-            "length": np.float64,
-            "num_bedrooms": np.float64,
-            "num_bathrooms": np.float64,
+            "area": np.float32,
+            "width": np.float32,
+            "length": np.float32,
+            "num_bedrooms": pd.Int32Dtype(),
+            "num_bathrooms": pd.Int32Dtype(),
             "district": object,
             "city": object,
-            "price": np.float64,
+            "price": np.float32,
             "legal_document": pd.CategoricalDtype(
                 categories=[
                     'Giấy tờ hợp lệ',
@@ -56,9 +69,19 @@ class Config:
             )
         }
         
+        # "local" joins the offline features with common.point_in_time, "feast" with the Feast offline store
+        self.feature_retrieval = os.getenv("FEATURE_RETRIEVAL", "local")
+        # The local retrieval joins no feature row more than feature_lookback_days older than its entity row, so it
+        # only reads the months of the entity window and the lookback before it. 0 leaves only the TTL of the views.
+        self.feature_lookback_days = int(os.getenv("FEATURE_LOOKBACK_DAYS", 365))
+
         self.mlflow_tracking_uri = os.getenv("MLFLOW_TRACKING_URI")
         self.batch_input_file = Path(AppPath.MODEL_SERVING_DIR, os.getenv("BATCH_INPUT_FILE"))
         self.registered_model_file = Path(AppPath.MODEL_SERVING_DIR, os.getenv("REGISTERED_MODEL_FILE"))
+
+        # Online features of recently requested properties are kept in memory for feature_cache_ttl seconds
+        self.feature_cache_size = int(os.getenv("FEATURE_CACHE_SIZE", 100_000))
+        self.feature_cache_ttl = float(os.getenv("FEATURE_CACHE_TTL", 300))
         
     
 class Log:
@@ -103,17 +126,38 @@ def inspect_current_dir():
     inspect_dir(cwd)
 
 
-def read_parquet(path) -> pd.DataFrame:
+def read_parquet(path, columns=None, filters=None) -> pd.DataFrame:
     Log().log.info(f"Stared: read_parquet {path}")
-    df = pd.read_parquet(path, engine="fastparquet")
+    df = parquet_io.read_parquet(path, columns=columns, filters=filters)
     return df
 
 
 def to_parquet(df: pd.DataFrame, path):
     Log().log.info(f"Started: to_parquet {path}")
-    df.to_parquet(path, engine="fastparquet")
+    parquet_io.to_parquet(df, path)
     
 
+def nullable_to_float(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast the nullable integer columns of df, such as the room counts, to float32 with NaN for missing values.
+
+    The models take them as floats: MLflow infers integer inputs from nullable integer columns, and pyfunc models
+    with integer inputs reject the missing values of the rows to predict.
+    """
+    columns = [column for column in df.columns
+               if pd.api.types.is_extension_array_dtype(df[column]) and pd.api.types.is_integer_dtype(df[column])]
+    return df.astype({column: np.float32 for column in columns})
+
+
+def get_historical_features(store, entity_df: pd.DataFrame, features: list, retrieval: str,
+                            lookback_days: int = 0) -> pd.DataFrame:
+    Log().log.info(f"Started: get_historical_features with {retrieval} retrieval")
+    if retrieval == "feast":
+        return store.get_historical_features(entity_df=entity_df, features=features).to_df()
+    return point_in_time.get_historical_features(store, entity_df, features,
+                                                 partition_col=AppConst.FEATURES_PARTITION_KEY,
+                                                 lookback=timedelta(days=lookback_days))
+
+
 def dump_json(dict_obj: dict, path):
     with open(path, "w", encoding="utf-8") as f:
         json.dump(dict_obj, f)
@@ -122,4 +166,22 @@ def dump_json(dict_obj: dict, path):
 def load_json(path) -> dict:
     with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
-    return data
\ No newline at end of file
+    return data
+
+
+def load_category_encoder(run_id: str) -> CategoryEncoder:
+    """Download the categorical feature codes saved with the model of an MLflow training run.
+
+    Models trained before the categorical features were encoded have no codes, they get an encoder that leaves
+    every column as it is.
+    """
+    import mlflow
+    from mlflow.tracking import MlflowClient
+
+    artifact_path = f"{AppConst.MLFLOW_ENCODER_PATH_PREFIX}/{ENCODER_FILE}"
+    if not MlflowClient().list_artifacts(run_id, AppConst.MLFLOW_ENCODER_PATH_PREFIX):
+        Log().log.warning(f"Run {run_id} has no {artifact_path}, categorical features are not encoded")
+        return CategoryEncoder()
+    path = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path=artifact_path)
+    Log().log.info(f"Loaded categorical feature codes from {artifact_path} of run {run_id}")
+    return CategoryEncoder.load(path)
@@ -29,7 +29,7 @@ if [[ -z "$cmd" ]]; then
 fi
 
 build() {
-    docker build --tag "$DOCKER_USER"/"$PROJECT"_"$IMAGE_NAME":"$IMAGE_TAG" -f deployment/Dockerfile .
+    docker build --build-context common=../common --tag "$DOCKER_USER"/"$PROJECT"_"$IMAGE_NAME":"$IMAGE_TAG" -f deployment/Dockerfile .
     docker tag "$DOCKER_USER"/"$PROJECT"_"$IMAGE_NAME":"$IMAGE_TAG" "$DOCKER_USER"/"$PROJECT"_"$IMAGE_NAME":latest
 }
 
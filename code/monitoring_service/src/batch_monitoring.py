@@ -41,9 +41,10 @@ class BatchReports:
     PREDICTION_COL = "prediction"
     
     def __init__(self) -> None:
-        # Data
-        self.reference_data = read_parquet(AppPath.REFERENCE_PQ)
-        self.production_data = read_parquet(AppPath.PRODUCTION_PQ)
+        # Data, reading only the columns the reports use
+        columns = self.NUMERICAL_COLS + self.CATEGORICAL_COLS + [self.TARGET_COL]
+        self.reference_data = read_parquet(AppPath.REFERENCE_PQ, columns=columns)
+        self.production_data = read_parquet(AppPath.PRODUCTION_PQ, columns=columns)
         
         # Column mapping
         self.column_mapping = ColumnMapping(
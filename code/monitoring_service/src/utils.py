@@ -6,6 +6,10 @@ import pandas as pd
 from dotenv import load_dotenv
 load_dotenv()
 
+# The modules shared by every subsystem live in code/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import parquet_io
+
 
 class AppConst:
     LOG_LEVEL = logging.INFO
@@ -78,12 +82,12 @@ def inspect_current_dir():
     inspect_dir(cwd)
 
 
-def read_parquet(path) -> pd.DataFrame:
+def read_parquet(path, columns=None, filters=None) -> pd.DataFrame:
     Log().log.info(f"Stared: read_parquet {path}")
-    df = pd.read_parquet(path, engine="fastparquet")
+    df = parquet_io.read_parquet(path, columns=columns, filters=filters)
     return df
 
 
 def to_parquet(df: pd.DataFrame, path):
     Log().log.info(f"Started: to_parquet {path}")
-    df.to_parquet(path, engine="fastparquet")
+    parquet_io.to_parquet(df, path)
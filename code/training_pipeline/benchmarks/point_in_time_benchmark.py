@@ -0,0 +1,167 @@
+"""Measure the local point-in-time join against the Feast file offline store on synthetic listings.
+
+The features are written as a month-partitioned dataset like the one of the data pipeline, and the entity rows are
+a window of recent listings, so the local join only reads the months the window can match. With --compare, the same
+join also runs through a temporary Feast repository and the run fails when the outputs differ.
+
+Usage: python benchmarks/point_in_time_benchmark.py --num-features 1000000 --num-entities 200000 [--compare]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(CODE_DIR)
+
+from common import parquet_io, point_in_time
+
+FEATURE_NAMES = ["area", "width", "length", "num_bedrooms", "num_bathrooms"]
+FEATURE_REFERENCES = [f"properties_fv:{name}" for name in FEATURE_NAMES]
+PARTITION_COL = "month"
+FEATURE_STORE_YAML = """project: benchmark
+provider: local
+registry: registry.db
+online_store:
+    type: sqlite
+    path: online_store.db
+offline_store:
+    type: file
+entity_key_serialization_version: 2
+"""
+
+
+def generate_features(num_rows: int, num_properties: int, num_days: int, rng: np.random.Generator) -> pd.DataFrame:
+    # Listings of num_properties properties, posted and re-posted over num_days days
+    date_posted = pd.Timestamp("2021-01-01") + pd.to_timedelta(rng.integers(0, num_days * 86400, num_rows), unit="s")
+    return pd.DataFrame({
+        "property_id": rng.integers(0, num_properties, num_rows).astype(str),
+        "date_posted": date_posted,
+        "area": rng.lognormal(4, 0.5, num_rows).astype(np.float32),
+        "width": rng.uniform(3, 10, num_rows).astype(np.float32),
+        "length": rng.uniform(8, 30, num_rows).astype(np.float32),
+        "num_bedrooms": pd.array(rng.integers(1, 7, num_rows), dtype=pd.Int32Dtype()),
+        "num_bathrooms": pd.array(rng.integers(1, 6, num_rows), dtype=pd.Int32Dtype()),
+    })
+
+
+def generate_entities(features_df: pd.DataFrame, num_rows: int, window_days: int,
+                      rng: np.random.Generator) -> pd.DataFrame:
+    # Properties looked up during the last window_days days of the features
+    end = features_df["date_posted"].max()
+    offsets = pd.to_timedelta(rng.integers(0, window_days * 86400, num_rows), unit="s")
+    return pd.DataFrame({
+        "property_id": rng.choice(features_df["property_id"].unique(), num_rows),
+        "date_posted": end - offsets,
+    })
+
+
+def write_features(features_df: pd.DataFrame, path):
+    table = pa.Table.from_pandas(features_df, preserve_index=False)
+    month = features_df["date_posted"].dt.strftime(point_in_time.PARTITION_MONTH_FORMAT)
+    parquet_io.write_dataset(table.append_column(PARTITION_COL, pa.array(month)), path, PARTITION_COL)
+
+
+def local_join(entity_df: pd.DataFrame, features_path, ttl: timedelta) -> pd.DataFrame:
+    start = entity_df["date_posted"].min() - ttl
+    features_df = point_in_time.read_features(features_path, ["property_id"], "date_posted", FEATURE_NAMES,
+                                              start=start, end=entity_df["date_posted"].max(),
+                                              partition_col=PARTITION_COL)
+    return point_in_time.join_features(entity_df, features_df, ["property_id"], "date_posted", FEATURE_NAMES,
+                                       ttl=ttl)
+
+
+def feast_store(repo_dir: str, features_path, ttl: timedelta):
+    from feast import Entity, FeatureStore, FeatureView, Field, FileSource
+    from feast.types import Float32, Int32
+
+    with open(os.path.join(repo_dir, "feature_store.yaml"), "w", encoding="utf-8") as f:
+        f.write(FEATURE_STORE_YAML)
+    entity = Entity(name="properties_entity", join_keys=["property_id"])
+    source = FileSource(name="properties_source", path=str(features_path), timestamp_field="date_posted")
+    view = FeatureView(
+        name="properties_fv",
+        entities=[entity],
+        ttl=ttl,
+        schema=[Field(name=name, dtype=Int32 if name.startswith("num_") else Float32) for name in FEATURE_NAMES],
+        source=source,
+    )
+    store = FeatureStore(repo_path=repo_dir)
+    store.apply([entity, view])
+    return store
+
+
+def normalize(df: pd.DataFrame) -> pd.DataFrame:
+    # Feast returns UTC timestamps in its own row order
+    date_posted = pd.to_datetime(df["date_posted"])
+    if date_posted.dt.tz is not None:
+        date_posted = date_posted.dt.tz_convert("UTC").dt.tz_localize(None)
+    df = df.assign(date_posted=date_posted)
+    df = df.sort_values(["property_id", "date_posted"], kind="stable").reset_index(drop=True)
+    return df[["property_id", "date_posted"] + FEATURE_NAMES].astype({name: "float64" for name in FEATURE_NAMES})
+
+
+def timed(function, *args) -> tuple:
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    ttl = timedelta(days=args.ttl_days)
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        features_path = os.path.join(temp_dir, "features")
+        features_df = generate_features(args.num_features, args.num_properties, args.num_days, rng)
+        write_features(features_df, features_path)
+        entity_df = generate_entities(features_df, args.num_entities, args.window_days, rng)
+        del features_df
+
+        local_df, results["local_seconds"] = timed(local_join, entity_df, features_path, ttl)
+        print(f"local join    {results['local_seconds']:>8.2f} s "
+              f"{args.num_entities / results['local_seconds']:>12,.0f} entity rows/s")
+
+        if args.compare:
+            store = feast_store(temp_dir, features_path, ttl)
+            feast_df, results["feast_seconds"] = timed(
+                lambda: store.get_historical_features(entity_df=entity_df, features=FEATURE_REFERENCES).to_df())
+            print(f"feast join    {results['feast_seconds']:>8.2f} s "
+                  f"{args.num_entities / results['feast_seconds']:>12,.0f} entity rows/s")
+
+            registry_df = point_in_time.get_historical_features(store, entity_df, FEATURE_REFERENCES,
+                                                                partition_col=PARTITION_COL)
+            pd.testing.assert_frame_equal(normalize(local_df), normalize(registry_df))
+            pd.testing.assert_frame_equal(normalize(local_df), normalize(feast_df), check_exact=False)
+            print("local and feast outputs are equal")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-features", type=int, default=1_000_000)
+    parser.add_argument("--num-properties", type=int, default=300_000)
+    parser.add_argument("--num-days", type=int, default=3 * 365)
+    parser.add_argument("--num-entities", type=int, default=200_000)
+    parser.add_argument("--window-days", type=int, default=30)
+    parser.add_argument("--ttl-days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=12)
+    parser.add_argument("--compare", action="store_true", help="also join with Feast and compare the outputs")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
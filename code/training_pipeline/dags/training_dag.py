@@ -21,25 +21,25 @@ with DAG(
     feature_store_init_task = DockerOperator(
         task_id="feature_store_init_task",
         **DefaultConfig.DEFAULT_DOCKER_OPERATORS_ARGS,
-        command="/bin/bash -c 'feast -c ../../feature_repo apply'"
+        command="/bin/bash -c 'python src/stages.py feast_apply feast -c ../../feature_repo apply'"
     )
     
     data_extraction_task = DockerOperator(
         task_id="data_extraction_task",
         **DefaultConfig.DEFAULT_DOCKER_OPERATORS_ARGS,
-        command="/bin/bash -c 'cd .. && python training_pipeline/src/data_extraction.py'"
+        command="/bin/bash -c 'cd .. && python training_pipeline/src/stages.py data_extraction python training_pipeline/src/data_extraction.py'"
     )
     
     data_validation_task = DockerOperator(
         task_id="data_validation_task",
         **DefaultConfig.DEFAULT_DOCKER_OPERATORS_ARGS,
-        command="/bin/bash -c 'cd src/ && python data_validation.py'"
+        command="/bin/bash -c 'cd src/ && python stages.py data_validation python data_validation.py'"
     )
     
     data_preparation_task = DockerOperator(
         task_id="data_preparation_task",
         **DefaultConfig.DEFAULT_DOCKER_OPERATORS_ARGS,
-        command="/bin/bash -c 'cd src/ && python data_preparation.py'"
+        command="/bin/bash -c 'cd src/ && python stages.py data_preparation python data_preparation.py'"
     )
     
     model_training_task = DockerOperator(
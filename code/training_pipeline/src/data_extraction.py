@@ -9,6 +9,8 @@ AppPath()
 def main():
     # Start
     logger.info("Started: Extracting data...")
+    config = Config()
+    logger.info(f"Loaded config: {config.__dict__}")
     
     # Inspect data source directory
     inspect_dir(AppPath.DATA_SOURCE_DIR)
@@ -20,23 +22,29 @@ def main():
     entity_df = read_parquet(AppPath.ENTITY_PQ)
     
     # Retrieve feature data
-    training_df = fs.get_historical_features(
-        entity_df=entity_df,
-        features=[
+    training_df = get_historical_features(
+        fs,
+        entity_df,
+        [
             "properties_fv:area",
             "properties_fv:width",
             "properties_fv:length",
             "properties_fv:num_bedrooms",
             "properties_fv:num_bathrooms",
-            # "properties_fv:district",
-            # "properties_fv:city",
-            # "properties_fv:legal_document"
-        ]
-    ).to_df()
+            "properties_fv:district",
+            "properties_fv:city",
+            "properties_fv:legal_document"
+        ],
+        config.feature_retrieval,
+        config.feature_lookback_days
+    )
     
     # Drop unecessary columns for training
     training_df = training_df.drop(["date_posted", "property_id"], axis=1)
     
+    # The local join keeps the dictionary-encoded columns as categoricals, Feast returns strings
+    training_df = training_df.astype({name: "category" for name in config.category_features})
+    
     # Log
     logger.info(f"---- Feature schema ----")
     logger.info(training_df.info())
@@ -44,7 +52,7 @@ def main():
     logger.info(f"---- Example features ----\n{training_df.head()}")
     
     # Store as file
-    to_parquet(training_df, AppPath.TRAINING_PQ)
+    to_artifact(training_df, AppPath.TRAINING_PQ)
     inspect_dir(AppPath.TRAINING_PQ.parent)
     
     # End
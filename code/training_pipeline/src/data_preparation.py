@@ -15,9 +15,8 @@ def main():
     logger.info(f"Loaded config: {config.__dict__}")
     
     # Read data
-    df = read_parquet(AppPath.TRAINING_PQ)
-    X = df.drop([config.target_col], axis=1)
-    # X = pd.get_dummies(X, prefix=['district', 'city', 'legal_document'])
+    df = read_artifact(AppPath.TRAINING_PQ)
+    X = nullable_to_float(df.drop([config.target_col], axis=1))
     y = df.loc[:, [config.target_col]]
     
     # Train test split
@@ -28,8 +27,27 @@ def main():
         random_state=config.random_seed
     )
     
+    # Hold out part of the training split to stop boosting early and to rank the tuning trials
+    X_train, X_valid, y_train, y_valid = train_test_split(
+        X_train,
+        y_train,
+        test_size=config.valid_size,
+        random_state=config.random_seed
+    )
+    
+    # Encode the categorical features with the codes learned on the training split
+    encoder = CategoryEncoder().fit(X_train, config.category_features, min_count=config.category_min_count)
+    X_train = encoder.transform(X_train)
+    X_valid = encoder.transform(X_valid)
+    X_test = encoder.transform(X_test)
+    for name, values in encoder.categories.items():
+        logger.info(f"Learned {len(values)} codes of {name}")
+    
     # Save to files
+    encoder.save(AppPath.CATEGORY_ENCODER_JSON)
     train_test_to_parquet(X_train, X_test, y_train, y_test)
+    to_artifact(X_valid, AppPath.VALID_X_PQ)
+    to_artifact(y_valid, AppPath.VALID_Y_PQ)
     
     # Inspect directory
     inspect_dir(AppPath.TRAIN_X_PQ.parent)
@@ -8,9 +8,11 @@ AppPath()
 def main():
     # Start
     logger.info("Started: Validating data...")
-    df = read_parquet(AppPath.TRAINING_PQ)
+    # An empty frame of the schema has the dtypes of the artifact, the rows are read by the data contract in chunks
+    df = read_artifact_schema(AppPath.TRAINING_PQ).empty_table().to_pandas()
     check_unexpected_features(df)
     check_expected_features(df)
+    check_data_contract(AppPath.TRAINING_PQ)
     logger.info("Finished: Validating data")
     
 
@@ -54,5 +56,40 @@ def check_expected_features(df: pd.DataFrame):
         raise Exception(errors)
     
 
+def check_data_contract(path):
+    logger.info("Started: check_data_contract")
+
+    # Load config
+    config = Config()
+    reference = None
+    if AppPath.DATA_CONTRACT_REFERENCE.exists():
+        reference = load_json(AppPath.DATA_CONTRACT_REFERENCE)
+    else:
+        logger.info("No reference profile, skipping the distribution shift rules")
+
+    # Check every rule in one pass over the chunks, only one of which is in memory at a time
+    contract = data_contract.DataContract(config.data_contract, reference)
+    report = contract.evaluate(iter_artifact(path, config.data_contract_chunk_rows),
+                               total_rows=artifact_num_rows(path))
+    dump_json(report, AppPath.DATA_CONTRACT_REPORT)
+    logger.info(f"Saved data contract report into {AppPath.DATA_CONTRACT_REPORT}")
+
+    for warning in report["warnings"]:
+        logger.warning(f"Data contract warning: {warning}")
+    if report["status"] == "failed":
+        raise Exception(report["failures"])
+
+    # The reference is pinned, so the shift is measured against the same data until it is refreshed on purpose
+    if reference is not None and not config.refresh_data_contract_reference:
+        logger.info(f"Kept the reference profile {AppPath.DATA_CONTRACT_REFERENCE}")
+        return
+
+    # The quantile bins need whole columns, so only the columns of the psi rules are read
+    psi_columns = sorted({rule["column"] for rule in config.data_contract if rule["check"] == "psi"})
+    df = read_artifact(path, columns=psi_columns)
+    dump_json(data_contract.build_reference(df, psi_columns), AppPath.DATA_CONTRACT_REFERENCE)
+    logger.info(f"Saved reference profile into {AppPath.DATA_CONTRACT_REFERENCE}")
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
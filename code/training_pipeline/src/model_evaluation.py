@@ -1,14 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import mlflow
 from mlflow.client import MlflowClient
 import numpy as np
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 
 from utils import *
+from run_logger import RunLogger
 
 logger = Log(AppConst.MODEL_EVALUATION).log
 AppPath()
 
 
+def select_runs(run_info: RunInfo, top_k: int) -> list:
+    # The top_k runs with the lowest validation loss, every run when top_k is 0 or the losses are unknown
+    if top_k <= 0 or not run_info.losses:
+        return run_info.run_ids
+    ranked = sorted(run_info.run_ids, key=lambda run_id: run_info.losses.get(run_id, float("inf")))
+    return ranked[:top_k]
+
+
+def predict(run_id: str, test_x) -> np.ndarray:
+    model = mlflow.pyfunc.load_model(
+        f"runs:/{run_id}/{AppConst.MLFLOW_MODEL_PATH_PREFIX}"
+    )
+    logger.info(f"Loaded model of run {run_id}")
+    return np.asarray(model.predict(test_x)).reshape(-1)
+
+
 def main():
     logger.info("Started: Evaluating model...")
     
@@ -21,35 +40,37 @@ def main():
     logger.info(f"Loaded config: {config.__dict__}")
     mlflow.set_tracking_uri(config.mlflow_tracking_uri)
     mlflow.set_experiment(config.experiment_name)
+    run_logger = RunLogger(config.mlflow_tracking_uri)
     
     # Load data
-    test_x = read_parquet(AppPath.TEST_X_PQ)
+    test_x = read_artifact(AppPath.TEST_X_PQ)
     logger.info(f"Loaded test features with shape {test_x.shape}")
-    test_y = read_parquet(AppPath.TEST_Y_PQ)
+    test_y = read_artifact(AppPath.TEST_Y_PQ)
     logger.info(f"Loaded test targets with shape {test_y.shape}")
     
+    # Preselect the candidates
+    run_ids = select_runs(run_info, config.evaluation_top_k)
+    logger.info(f"Evaluating {len(run_ids)} of {len(run_info.run_ids)} runs")
+    
+    # Load the models and predict the test set on a thread pool, downloads and XGBoost release the GIL
+    predictions = np.empty((len(run_ids), len(test_x)), dtype=np.float64)
+    with ThreadPoolExecutor(max_workers=config.evaluation_workers) as pool:
+        for i, pred_y in enumerate(pool.map(lambda run_id: predict(run_id, test_x), run_ids)):
+            predictions[i] = pred_y
+    
+    # Evaluation of every run at once
     eval_results = EvaluationResult({})
-    for run_id in run_info.run_ids:
-        # Load trained model
-        model = mlflow.pyfunc.load_model(
-            f"runs:/{run_id}/{AppConst.MLFLOW_MODEL_PATH_PREFIX}"
-        )
-        logger.info(f"Loaded model {model.__dict__}")
-    
-        # Evaluation
-        pred_y = model.predict(test_x)
-        test_metrics = evaluate_metrics(test_y, pred_y, prefix="test")
-    
-        # Log metadata
-        with mlflow.start_run(run_id):
-            for key, value in test_metrics.items():
-                mlflow.log_metric(key, value)
+    all_metrics = evaluate_metrics_batch(test_y.iloc[:, 0], predictions, prefix="test")
+    for run_id, test_metrics in zip(run_ids, all_metrics):
+        # Log metadata in the background
+        run_logger.log_metrics(run_id, test_metrics)
     
         # Write evaluation result to file
         eval_result = {run_id: test_metrics}
         eval_results.add_eval_result(eval_result)
         logger.info(f"Evaluation result: {eval_result}")
         
+    run_logger.flush()
     eval_results.save()
     logger.info(f"Saved evaluation result to {eval_results.path}")
     inspect_dir(eval_results.path)
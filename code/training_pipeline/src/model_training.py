@@ -11,15 +11,17 @@ from hyperopt import STATUS_OK
 
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.base import BaseEstimator
-from xgboost import XGBModel
+import xgboost as xgb
 
 from utils import *
+from run_logger import RunLogger
 
 logger = Log(AppConst.MODEL_TRAINING).log
 AppPath()
 RUN_INFO = RunInfo([])
 config = Config()
 logger.info(f"Loaded config: {config.__dict__}")
+RUN_LOGGER = RunLogger(config.mlflow_tracking_uri)
 
 
 def set_up_mlflow():
@@ -41,6 +43,10 @@ def fetch_logged_data(run_id):
         logger.info(data)
 
 
+def has_logged_model(client: MlflowClient, run_id: str) -> bool:
+    return any(f.path == AppConst.MLFLOW_MODEL_PATH_PREFIX for f in client.list_artifacts(run_id))
+
+
 class BaseTrainer:
     def __init__(self, model, params: TypedDict):
         self.trainer_name = self.__class__.__name__
@@ -49,43 +55,60 @@ class BaseTrainer:
         self.model = model
         self.trained_model = None
         self.params = params
+        self.run_id = None
 
-    def train(self, train_x, train_y):
-        with mlflow.start_run(nested=True, description="child-run") as run:
-            # Set params
-            self.model.set_params(**self.params)
-            logger.info(f"Model's parameters: {self.model.get_params(deep=True)}")
+    def train(self, train_x, train_y, valid_x=None, valid_y=None):
+        # The run name is part of the run info, so it is set here rather than in the background with the other tags
+        with mlflow.start_run(run_name=str(uuid.uuid1())[:8], nested=True, description="child-run") as run:
+            self.run_id = run.info.run_id
 
             # Train
             logger.info(f"Started training: {self.trainer_name}")
-            self.trained_model = self.model.fit(train_x, train_y)
+            self.trained_model = self.fit(train_x, train_y)
             logger.info(f"Finished training: {self.trainer_name}")
 
-            # Evaluate train metrics
-            pred_y = self.trained_model.predict(train_x)
+            # Evaluate train metrics, the predictions also give the output schema of the signature
+            pred_y = self.predict(train_x)
             train_metrics = evaluate_metrics(train_y, pred_y, prefix="train")
             loss = train_metrics['train_mse']
 
+            # With a validation split, trials are ranked on data the model was not fitted on
+            if valid_x is not None:
+                train_metrics.update(evaluate_metrics(valid_y, self.predict(valid_x), prefix="valid"))
+                loss = train_metrics['valid_mse']
+
             # Log metadata
-            signature = infer_signature(train_x, self.trained_model.predict(train_x))
+            signature = infer_signature(train_x, pred_y)
             self.log_metadata(signature, train_metrics)
 
             # Save run_id
-            run_id = run.info.run_id
-            RUN_INFO.append(run_id)
+            RUN_INFO.append(self.run_id)
 
-            # Inspect metadata
-            fetch_logged_data(run_id)
+            # Inspect metadata, once the queued logs of the run are sent
+            if config.fetch_logged_data:
+                RUN_LOGGER.flush()
+                fetch_logged_data(self.run_id)
 
         return loss
 
+    def fit(self, train_x, train_y):
+        self.model.set_params(**self.params)
+        logger.info(f"Model's parameters: {self.model.get_params(deep=True)}")
+        return self.model.fit(train_x, train_y)
+
+    def predict(self, x):
+        return self.trained_model.predict(x)
+
     def log_metadata(self, model, train_metrics):
-        mlflow.set_tag("mlflow.runName", str(uuid.uuid1())[:8])
-        mlflow.set_tag('estimator_name', model.__class__.__name__)
-        mlflow.set_tag('estimator_class', model.__class__.__module__ + "." + model.__class__.__name__)
+        # Logged in the background, see run_logger
+        RUN_LOGGER.set_tags(self.run_id, {
+            'estimator_name': model.__class__.__name__,
+            'estimator_class': model.__class__.__module__ + "." + model.__class__.__name__,
+        })
+        RUN_LOGGER.log_metrics(self.run_id, train_metrics)
 
-        for key, value in train_metrics.items():
-            mlflow.log_metric(key, value)
+        # Serving encodes the categorical features with the same codes as the training data
+        RUN_LOGGER.log_artifact(self.run_id, AppPath.CATEGORY_ENCODER_JSON, AppConst.MLFLOW_ENCODER_PATH_PREFIX)
 
 
 class SklearnTrainer(BaseTrainer):
@@ -118,58 +141,169 @@ class SklearnTrainer(BaseTrainer):
     def log_metadata(self, signature: ModelSignature, train_metrics: dict) -> None:
         super().log_metadata(self.trained_model, train_metrics)
 
-        mlflow.log_params(self.trained_model.get_params(deep=True))
-        mlflow.sklearn.log_model(
+        RUN_LOGGER.log_params(self.run_id, self.trained_model.get_params(deep=True))
+        RUN_LOGGER.log_model(
+            self.run_id,
+            mlflow.sklearn,
+            AppConst.MLFLOW_MODEL_PATH_PREFIX,
             sk_model=self.trained_model,
-            artifact_path=AppConst.MLFLOW_MODEL_PATH_PREFIX,
             signature=signature
         )
 
 
+class PruningCallback(xgb.callback.TrainingCallback):
+    """Stops boosting when the successive halving scheduler prunes the trial, see tuning.SuccessiveHalving."""
+
+    def __init__(self, scheduler, data_name: str, metric_name: str) -> None:
+        super().__init__()
+        self.scheduler = scheduler
+        self.data_name = data_name
+        self.metric_name = metric_name
+        self.pruned_at = None
+
+    def after_iteration(self, model, epoch: int, evals_log) -> bool:
+        rounds = epoch + 1
+        if rounds not in self.scheduler.rung_rounds:
+            return False
+        # The trials are compared on their best round so far, the one early stopping keeps
+        loss = min(evals_log[self.data_name][self.metric_name])
+        if self.scheduler.should_stop(rounds, loss):
+            self.pruned_at = rounds
+            return True
+        return False
+
+
 class XGBTrainer(BaseTrainer):
-    def __init__(self, model: XGBModel, params: dict):
-        super().__init__(model, params)
+    """Trains a booster with xgb.train on a DMatrix that is built once and shared by the trials, see build_dmatrix.
+
+    With dvalid, boosting stops early once the validation loss stops improving, and the booster keeps its best round.
+    With a scheduler as well, boosting also stops when the trial falls behind the other trials of the search.
+    """
+
+    def __init__(self, dtrain: xgb.DMatrix, params: dict, dvalid: xgb.DMatrix = None, scheduler=None):
+        super().__init__(None, params)
+        self.dtrain = dtrain
+        self.dvalid = dvalid
+        self.scheduler = scheduler
+        self.pruned_at = None
+
+    def fit(self, train_x, train_y) -> xgb.Booster:
+        # train_x and train_y are already quantized in dtrain
+        self.booster_params = dict(config.xgb_params, **self.params)
+        logger.info(f"Model's parameters: {self.booster_params}")
+
+        evals = []
+        callbacks = []
+        pruning = None
+        if self.dvalid is not None:
+            evals.append((self.dvalid, "valid"))
+            callbacks.append(
+                xgb.callback.EarlyStopping(config.early_stopping_rounds, data_name="valid", save_best=True)
+            )
+            if self.scheduler is not None:
+                pruning = PruningCallback(self.scheduler, "valid", self.booster_params["eval_metric"])
+                callbacks.append(pruning)
+
+        booster = xgb.train(self.booster_params, self.dtrain, num_boost_round=config.num_boost_round, evals=evals,
+                            callbacks=callbacks, verbose_eval=False)
+        if pruning is not None:
+            self.pruned_at = pruning.pruned_at
+        return booster
+
+    def predict(self, x):
+        return self.trained_model.inplace_predict(x)
 
     def log_metadata(self, signature: ModelSignature, train_metrics: dict) -> None:
         super().log_metadata(self.trained_model, train_metrics)
 
-        mlflow.log_params(self.trained_model.get_params(deep=True))
-        mlflow.xgboost.log_model(
+        RUN_LOGGER.log_params(self.run_id, dict(self.booster_params, num_boost_round=config.num_boost_round))
+        RUN_LOGGER.set_tags(self.run_id, {"num_boosted_rounds": self.trained_model.num_boosted_rounds()})
+        if self.pruned_at is not None:
+            # Pruned trials are not candidates for evaluation, so their boosters are not uploaded
+            RUN_LOGGER.set_tags(self.run_id, {"pruned_at_round": self.pruned_at})
+            return
+
+        RUN_LOGGER.log_model(
+            self.run_id,
+            mlflow.xgboost,
+            AppConst.MLFLOW_MODEL_PATH_PREFIX,
             xgb_model=self.trained_model,
-            artifact_path=AppConst.MLFLOW_MODEL_PATH_PREFIX,
             signature=signature
         )
 
 
-if __name__ == "__main__":
-    from xgboost import XGBRegressor
-    from hyperopt import fmin, tpe, Trials
+def build_dmatrix(x, y, ref: xgb.DMatrix = None) -> xgb.DMatrix:
+    """Convert and quantize data once, for every trial of a search. Validation data takes the bins of ref."""
+    return xgb.QuantileDMatrix(x, label=y, max_bin=config.xgb_params["max_bin"], ref=ref)
+
 
+# Data and scheduler of a tuning worker, set once by init_tuning_worker
+TUNING_STATE = {}
+
+
+def init_tuning_worker(parent_run_id: str, scheduler):
+    # The trials of the worker are logged as child runs of the search run
     set_up_mlflow()
+    mlflow.start_run(run_id=parent_run_id)
+    TUNING_STATE["train"] = load_data()
+    TUNING_STATE["valid"] = load_valid_data()
+    TUNING_STATE["dtrain"] = build_dmatrix(*TUNING_STATE["train"])
+    TUNING_STATE["dvalid"] = build_dmatrix(*TUNING_STATE["valid"], ref=TUNING_STATE["dtrain"])
+    TUNING_STATE["scheduler"] = scheduler
 
-    X_train, y_train = load_data()
 
-    search_space = config.search_space
+def objective(params: dict) -> dict:
+    trainer = XGBTrainer(TUNING_STATE["dtrain"], params, dvalid=TUNING_STATE["dvalid"],
+                         scheduler=TUNING_STATE["scheduler"])
+    loss = trainer.train(*TUNING_STATE["train"], *TUNING_STATE["valid"])
+    return {"loss": loss, "status": STATUS_OK, "run_id": RUN_INFO.run_ids[-1], "pruned_at": trainer.pruned_at}
 
-    trials = Trials()
 
-    def objective(search_space):
-        model = XGBRegressor()
-        trainer = XGBTrainer(model, search_space)
-        loss = trainer.train(X_train, y_train)
-        return loss
+if __name__ == "__main__":
+    import multiprocessing
+    import tuning
 
-    with mlflow.start_run(run_name='xgboost_models'):
-        best = fmin(
-            fn=objective,
-            space=search_space,
-            algo=tpe.suggest,
-            trials=trials,
-            max_evals=50,
-            rstate=np.random.default_rng(config.random_seed)
+    set_up_mlflow()
+
+    # Split the cores between the trials running at once
+    nthread = max(1, config.tuning_cpus // config.tuning_workers)
+    search_space = dict(config.search_space, nthread=nthread)
+    logger.info(f"Tuning with {config.tuning_workers} workers of {nthread} threads")
+
+    with mlflow.start_run(run_name='xgboost_models') as run, multiprocessing.get_context("spawn").Manager() as manager:
+        scheduler = None
+        if config.asha_min_rounds > 0:
+            scheduler = tuning.SuccessiveHalving(manager, config.asha_min_rounds, config.num_boost_round,
+                                                 config.asha_reduction_factor)
+            logger.info(f"Comparing the trials after {scheduler.rung_rounds} boosting rounds")
+
+        trials = tuning.run_search(
+            objective,
+            search_space,
+            max_evals=config.tuning_max_evals,
+            workers=config.tuning_workers,
+            rstate=np.random.default_rng(config.random_seed),
+            initializer=init_tuning_worker,
+            initargs=(run.info.run_id, scheduler),
         )
+    logger.info(f"Best trial: {trials.best_trial['result']}")
 
-    # Save run_ids
+    # Save the run_ids of the trials that were not pruned, the candidates for evaluation. A worker raises the errors of
+    # its background logging when it exits, where they are only printed, so a candidate must have uploaded its model.
+    client = MlflowClient()
+    for trial in trials.trials:
+        result = trial["result"]
+        if result["pruned_at"] is not None:
+            continue
+        if not has_logged_model(client, result["run_id"]):
+            logger.error(f"Run '{result['run_id']}' has no logged model, it is not a candidate for evaluation")
+            continue
+        RUN_INFO.append(result["run_id"], result["loss"])
+    logger.info(f"{len(RUN_INFO.run_ids)} of {len(trials.trials)} trials boosted until they stopped improving")
+    if not RUN_INFO.run_ids:
+        raise Exception("No trial logged a model to evaluate")
+    # The workers sent their logs before exiting, this flushes the ones of the search run
+    RUN_LOGGER.flush()
     RUN_INFO.save()
     logger.info(f"Saved run info into {RUN_INFO.path}")
     inspect_dir(RUN_INFO.path)
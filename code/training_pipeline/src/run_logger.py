@@ -0,0 +1,111 @@
+"""MLflow logging from a background thread, with params, metrics and tags sent in batches.
+
+Each fluent mlflow.log_* call is a blocking request to the tracking server. RunLogger queues the calls instead. A
+worker thread sends all the params, metrics and tags queued for a run in log_batch requests within the server
+limits, then saves and uploads the artifacts queued after them, in the order they were queued. flush waits for
+everything queued so far, and runs again when the process exits.
+"""
+import queue
+import tempfile
+import threading
+import time
+from multiprocessing.util import Finalize
+from pathlib import Path
+
+from mlflow.entities import Metric, Param, RunTag
+from mlflow.models import Model
+from mlflow.tracking import MlflowClient
+from mlflow.utils.validation import MAX_ENTITIES_PER_BATCH, MAX_METRICS_PER_BATCH, MAX_PARAMS_TAGS_PER_BATCH
+
+from utils import *
+
+
+class RunLogger:
+    def __init__(self, tracking_uri: str = None) -> None:
+        self.client = MlflowClient(tracking_uri)
+        self.tasks = queue.Queue()
+        # Run id -> params, metrics and tags waiting for a log_batch request
+        self.pending = {}
+        self.errors = []
+        self.thread = threading.Thread(target=self._work, name="run-logger", daemon=True)
+        self.thread.start()
+        # Pool workers run the finalizer when they stop, before the interpreter shuts down and can no longer
+        # start the subprocesses that saving a model needs
+        Finalize(self, self.flush, exitpriority=10)
+
+    def log_params(self, run_id: str, params: dict):
+        self.tasks.put((run_id, "params", [Param(key, str(value)) for key, value in params.items()]))
+
+    def log_metrics(self, run_id: str, metrics: dict, step: int = 0):
+        timestamp = int(time.time() * 1000)
+        metrics = [Metric(key, float(value), timestamp, step) for key, value in metrics.items()]
+        self.tasks.put((run_id, "metrics", metrics))
+
+    def set_tags(self, run_id: str, tags: dict):
+        # Reserved tags such as mlflow.runName update the run info, which a file store rewrites from the copy it read
+        # when the request was made, so a request sent after the run ended would mark it as running again
+        reserved = [key for key in tags if key.startswith("mlflow.")]
+        if reserved:
+            raise ValueError(f"Reserved tags {reserved} must be set with the run, not in the background")
+        self.tasks.put((run_id, "tags", [RunTag(key, str(value)) for key, value in tags.items()]))
+
+    def log_artifact(self, run_id: str, local_path, artifact_path: str = None):
+        self.tasks.put((run_id, "call", lambda: self.client.log_artifact(run_id, str(local_path), artifact_path)))
+
+    def log_model(self, run_id: str, flavor, artifact_path: str, **kwargs):
+        """Save a model with flavor.save_model and upload it to artifact_path of the run, like flavor.log_model."""
+        def save_and_upload():
+            with tempfile.TemporaryDirectory() as temp_dir:
+                local_path = Path(temp_dir, "model")
+                mlflow_model = Model(artifact_path=artifact_path, run_id=run_id)
+                flavor.save_model(path=local_path, mlflow_model=mlflow_model, **kwargs)
+                self.client.log_artifacts(run_id, str(local_path), artifact_path)
+            self.client._record_logged_model(run_id, mlflow_model)
+
+        self.tasks.put((run_id, "call", save_and_upload))
+
+    def flush(self):
+        """Wait until everything queued so far is logged, and raise the errors of the background requests."""
+        self.tasks.join()
+        if self.errors:
+            errors, self.errors = self.errors, []
+            raise Exception(errors)
+
+    def _work(self):
+        while True:
+            # Take every task queued meanwhile, so the entities of a run go out together
+            tasks = [self.tasks.get()]
+            while not self.tasks.empty():
+                tasks.append(self.tasks.get())
+
+            for run_id, kind, payload in tasks:
+                if kind == "call":
+                    # Artifacts go after the entities queued before them
+                    self._try(self._send, run_id)
+                    self._try(payload)
+                else:
+                    self.pending.setdefault(run_id, {"params": [], "metrics": [], "tags": []})[kind].extend(payload)
+            for run_id in list(self.pending):
+                self._try(self._send, run_id)
+
+            for _ in tasks:
+                self.tasks.task_done()
+
+    def _send(self, run_id: str):
+        entities = self.pending.pop(run_id, None)
+        if entities is None:
+            return
+        params, metrics, tags = entities["params"], entities["metrics"], entities["tags"]
+        while params or metrics or tags:
+            batch_params, params = params[:MAX_PARAMS_TAGS_PER_BATCH], params[MAX_PARAMS_TAGS_PER_BATCH:]
+            batch_tags, tags = tags[:MAX_PARAMS_TAGS_PER_BATCH], tags[MAX_PARAMS_TAGS_PER_BATCH:]
+            num_metrics = min(MAX_METRICS_PER_BATCH, MAX_ENTITIES_PER_BATCH - len(batch_params) - len(batch_tags))
+            batch_metrics, metrics = metrics[:num_metrics], metrics[num_metrics:]
+            self.client.log_batch(run_id, metrics=batch_metrics, params=batch_params, tags=batch_tags)
+
+    def _try(self, function, *args):
+        try:
+            function(*args)
+        except Exception as e:
+            Log().log.error(f"Failed to log to MLflow: {e}")
+            self.errors.append(str(e))
@@ -0,0 +1,52 @@
+from utils import *
+from common import stage_cache
+from common.stage_cache import Stage
+
+AppPath()
+
+SRC_DIR = Path(AppPath.TRAINING_PIPELINE_DIR, "src")
+FEATURE_DEFINITIONS = sorted(AppPath.FEATURE_STORE_REPO.glob("*.py")) + [
+    Path(AppPath.FEATURE_STORE_REPO, "feature_store.yaml")
+]
+
+# Training and the stages after it depend on the MLflow tracking server, so they always run
+STAGES = {
+    # Materialization updates the registry too, so it only has to exist
+    "feast_apply": Stage(
+        "feast_apply",
+        inputs=FEATURE_DEFINITIONS,
+        outputs=[Path(AppPath.FEATURE_STORE_REPO, "registry", "local_registry.db")],
+        verify_outputs=False,
+    ),
+    "data_extraction": Stage(
+        "data_extraction",
+        inputs=[AppPath.ENTITY_PQ, AppPath.FEATURES_DIR] + FEATURE_DEFINITIONS,
+        outputs=[AppPath.TRAINING_PQ],
+        code=[Path(SRC_DIR, "data_extraction.py"), Path(SRC_DIR, "utils.py"), stage_cache.COMMON_DIR],
+        env=["FEATURE_RETRIEVAL"],
+    ),
+    "data_validation": Stage(
+        "data_validation",
+        # The reference profile is only written by the first run and by the runs that refresh it
+        inputs=[AppPath.TRAINING_PQ, AppPath.DATA_CONTRACT_REFERENCE],
+        outputs=[AppPath.DATA_CONTRACT_REPORT],
+        code=[Path(SRC_DIR, "data_validation.py"), Path(SRC_DIR, "utils.py"), stage_cache.COMMON_DIR],
+        env=["REFRESH_DATA_CONTRACT_REFERENCE"],
+    ),
+    "data_preparation": Stage(
+        "data_preparation",
+        inputs=[AppPath.TRAINING_PQ],
+        outputs=[AppPath.TRAIN_X_PQ, AppPath.TRAIN_Y_PQ, AppPath.VALID_X_PQ, AppPath.VALID_Y_PQ, AppPath.TEST_X_PQ,
+                 AppPath.TEST_Y_PQ, AppPath.CATEGORY_ENCODER_JSON],
+        code=[Path(SRC_DIR, "data_preparation.py"), Path(SRC_DIR, "utils.py"), stage_cache.COMMON_DIR],
+    ),
+}
+
+
+def main():
+    logger = Log(AppConst.STAGES).log
+    stage_cache.main(STAGES, AppPath.STAGE_CACHE_DIR, logger)
+
+
+if __name__ == "__main__":
+    main()
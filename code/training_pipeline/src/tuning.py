@@ -0,0 +1,104 @@
+"""Hyperparameter search with TPE, running several trials at once on a local process pool.
+
+hyperopt.fmin with a plain Trials object evaluates one trial at a time. Here up to `workers` trials run together, and
+whenever one finishes, its loss is recorded and TPE suggests the next point from the trials so far. As with fmin on
+MongoTrials or SparkTrials, TPE counts the trials still running as losses of infinity, so it does not suggest the
+same region twice while they run.
+
+With a SuccessiveHalving scheduler, the trials also stop boosting early when they fall behind the other trials at
+the same number of rounds, so most of the budget goes to the promising configurations.
+"""
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from hyperopt import JOB_STATE_DONE, JOB_STATE_RUNNING, Trials, space_eval, tpe
+from hyperopt.base import Domain, spec_from_misc
+from hyperopt.utils import coarse_utcnow
+
+from utils import *
+
+
+class SuccessiveHalving:
+    """Asynchronous successive halving (ASHA) of the boosting rounds of the trials.
+
+    The trials are compared at rungs of min_rounds, min_rounds * reduction_factor, ... boosting rounds, up to
+    max_rounds. A trial reaching a rung keeps boosting when its validation loss is among the best 1/reduction_factor
+    of the losses recorded at that rung so far, and stops otherwise. Nothing waits for a rung to fill up, so the
+    workers never idle. The losses live in a multiprocessing manager, shared by the workers of the pool.
+    """
+
+    def __init__(self, manager, min_rounds: int, max_rounds: int, reduction_factor: int) -> None:
+        self.reduction_factor = reduction_factor
+        self.rung_rounds = []
+        rounds = min_rounds
+        while rounds < max_rounds:
+            self.rung_rounds.append(rounds)
+            rounds *= reduction_factor
+        self.rungs = [manager.list() for _ in self.rung_rounds]
+        self.lock = manager.Lock()
+
+    def should_stop(self, rounds: int, loss: float) -> bool:
+        """Record the validation loss of a trial after rounds boosting rounds, and tell whether it should stop."""
+        if rounds not in self.rung_rounds:
+            return False
+        rung = self.rungs[self.rung_rounds.index(rounds)]
+        with self.lock:
+            rung.append(loss)
+            losses = sorted(rung)
+        # With fewer than reduction_factor losses at the rung, only the best one so far goes on
+        cutoff = losses[max(len(losses) // self.reduction_factor - 1, 0)]
+        return loss > cutoff
+
+
+def run_search(objective, space, max_evals: int, workers: int, rstate: np.random.Generator, initializer=None,
+               initargs=()) -> Trials:
+    """Minimize objective over space with TPE, evaluating up to workers trials in parallel.
+
+    The workers are spawned rather than forked, so they do not inherit the OpenMP state of the driver, and they
+    keep running for the whole search, so initializer can load the training data once per worker.
+
+    Args:
+        objective (callable): Module-level function of a sampled point, returning a hyperopt result dict with
+            "loss" and "status"
+        space: hyperopt search space
+        max_evals (int): Number of trials
+        workers (int): Number of trials running at once
+        rstate (np.random.Generator): Random state of the suggestions
+        initializer (callable, optional): Called in every worker before its first trial
+        initargs (tuple, optional): Arguments of initializer
+
+    Returns:
+        Trials: The finished trials, with the results returned by objective
+    """
+    trials = Trials()
+    domain = Domain(objective, space)
+    running = {}
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=initializer,
+                             initargs=initargs) as pool:
+        while len(trials.trials) < max_evals or running:
+            # Keep every worker busy with a new suggestion
+            while len(running) < workers and len(trials.trials) < max_evals:
+                new_ids = trials.new_trial_ids(1)
+                docs = tpe.suggest(new_ids, domain, trials, rstate.integers(2 ** 31 - 1))
+                for doc in docs:
+                    doc["state"] = JOB_STATE_RUNNING
+                    doc["book_time"] = coarse_utcnow()
+                trials.insert_trial_docs(docs)
+                trials.refresh()
+
+                doc = trials.trials[-1]
+                params = space_eval(space, spec_from_misc(doc["misc"]))
+                running[pool.submit(objective, params)] = doc
+
+            # Record the trials that finished, a failed trial fails the search as with fmin
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                doc = running.pop(future)
+                doc["result"] = future.result()
+                doc["state"] = JOB_STATE_DONE
+                doc["refresh_time"] = coarse_utcnow()
+                Log().log.info(f"Finished trial {doc['tid'] + 1}/{max_evals} with loss {doc['result'].get('loss')}")
+            trials.refresh()
+    return trials
@@ -2,10 +2,12 @@ import os
 import json
 import logging
 import sys
+from datetime import timedelta
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 
 from hyperopt import hp
@@ -15,6 +17,11 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# The modules shared by every subsystem live in code/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import data_contract, feather_io, parquet_io, point_in_time
+from common.category_encoding import CategoryEncoder, ENCODER_FILE
+
 
 class AppConst:
     LOG_LEVEL = logging.DEBUG
@@ -24,7 +31,11 @@ class AppConst:
     MODEL_TRAINING = "model_training"
     MODEL_EVALUATION = "model_evaluation"
     MODEL_VALIDATION = "model_validation"
+    STAGES = "stages"
+    # Partition column of the offline features, one directory per month of date_posted
+    FEATURES_PARTITION_KEY = "month"
     MLFLOW_MODEL_PATH_PREFIX = "model"
+    MLFLOW_ENCODER_PATH_PREFIX = "encoding"
 
 
 class AppPath:
@@ -36,16 +47,27 @@ class AppPath:
     DATA_SOURCE_DIR = Path(ROOT_DIR, "data_sources")
     FEATURE_STORE_REPO = Path(ROOT_DIR, "feature_repo")
     ENTITY_PQ = Path(DATA_SOURCE_DIR, "entity.parquet")
+    FEATURES_DIR = Path(DATA_SOURCE_DIR, "features")
 
     ARTIFACTS_DIR = Path(TRAINING_PIPELINE_DIR, "artifacts")
-    TRAINING_PQ = Path(ARTIFACTS_DIR, "train_data.parquet")
-    TRAIN_X_PQ = Path(ARTIFACTS_DIR, "train_x.parquet")
-    TRAIN_Y_PQ = Path(ARTIFACTS_DIR, "train_y.parquet")
-    TEST_X_PQ = Path(ARTIFACTS_DIR, "test_x.parquet")
-    TEST_Y_PQ = Path(ARTIFACTS_DIR, "test_y.parquet")
+    # The data passed between the stages is written as Parquet, or as Arrow IPC with ARTIFACT_FORMAT=feather
+    ARTIFACT_SUFFIX = {"parquet": ".parquet", "feather": ".feather"}[os.getenv("ARTIFACT_FORMAT", "parquet")]
+    TRAINING_PQ = Path(ARTIFACTS_DIR, "train_data" + ARTIFACT_SUFFIX)
+    TRAIN_X_PQ = Path(ARTIFACTS_DIR, "train_x" + ARTIFACT_SUFFIX)
+    TRAIN_Y_PQ = Path(ARTIFACTS_DIR, "train_y" + ARTIFACT_SUFFIX)
+    TEST_X_PQ = Path(ARTIFACTS_DIR, "test_x" + ARTIFACT_SUFFIX)
+    TEST_Y_PQ = Path(ARTIFACTS_DIR, "test_y" + ARTIFACT_SUFFIX)
+    VALID_X_PQ = Path(ARTIFACTS_DIR, "valid_x" + ARTIFACT_SUFFIX)
+    VALID_Y_PQ = Path(ARTIFACTS_DIR, "valid_y" + ARTIFACT_SUFFIX)
+    CATEGORY_ENCODER_JSON = Path(ARTIFACTS_DIR, ENCODER_FILE)
+    DATA_CONTRACT_REPORT = Path(ARTIFACTS_DIR, "data_contract_report.json")
+    # Profile of the training data the distribution shift rules compare with. The first validation that passes writes
+    # it, and it is kept until a validation with REFRESH_DATA_CONTRACT_REFERENCE, so a gradual drift adds up
+    DATA_CONTRACT_REFERENCE = Path(ARTIFACTS_DIR, "data_contract_reference.json")
     RUN_INFO = Path(ARTIFACTS_DIR, "run_info.json")
     EVALUATION_RESULT = Path(ARTIFACTS_DIR, "evaluation.json")
     REGISTERED_MODEL_VERSION = Path(ARTIFACTS_DIR, "registered_model_version.json")
+    STAGE_CACHE_DIR = Path(ARTIFACTS_DIR, "stage_cache")
 
     def __init__(self) -> None:
         AppPath.ARTIFACTS_DIR.mkdir(parents=True, exist_ok=True)
@@ -54,33 +76,68 @@ class AppPath:
 class Config:
     def __init__(self) -> None:
         self.feature_dict = {
-            "area": np.float64,
-            "width": np.float64,
-            "length": np.float64,
-            "num_bedrooms": np.float64,
-            "num_bathrooms": np.float64,
-            # "district": object,
-            # "city": object,
-            "price": np.float64,
-            # "legal_document": pd.CategoricalDtype(
-            #     categories=[
-            #         'Giấy tờ hợp lệ',
-            #         'Sổ hồng',
-            #         'Sổ đỏ',
-            #         'Hợp đồng mua bán',
-            #         'Không xác định',
-            #         'Giấy tờ viết tay'
-            #     ],
-            #     ordered=False
-            # )
+            "area": np.float32,
+            "width": np.float32,
+            "length": np.float32,
+            "num_bedrooms": pd.Int32Dtype(),
+            "num_bathrooms": pd.Int32Dtype(),
+            "district": "category",
+            "city": "category",
+            "price": np.float32,
+            "legal_document": "category",
         }
 
         self.random_seed = 12
         self.test_size = 0.2
+        # Share of the training split held out for validation
+        self.valid_size = 0.2
         self.target_col = "price"
 
+        # Categorical features, encoded to integer codes learned on the training split. Values seen fewer than
+        # category_min_count times share the code of unknown values.
+        self.category_features = ["district", "city", "legal_document"]
+        self.category_min_count = 10
+
+        # Rules checked on the training data by data_validation, see common.data_contract. Failed rules with
+        # "blocking": False are only reported.
+        self.data_contract = [
+            {"column": self.target_col, "check": "null_rate", "max": 0},
+            {"column": self.target_col, "check": "range", "min": 0},
+            {"column": "area", "check": "range", "min": 0},
+            {"column": "width", "check": "range", "min": 0},
+            {"column": "length", "check": "range", "min": 0},
+            {"column": "num_bedrooms", "check": "range", "min": 0, "max": 100},
+            {"column": "num_bathrooms", "check": "range", "min": 0, "max": 100},
+            {"column": "area", "check": "null_rate", "max": 0.5, "blocking": False},
+            {"column": "district", "check": "null_rate", "max": 0.5, "blocking": False},
+            {"column": "district", "check": "cardinality", "min": 1, "max": 1000},
+            {"column": "city", "check": "cardinality", "min": 1, "max": 100},
+            {"column": "legal_document", "check": "cardinality", "max": 50},
+            {"column": self.target_col, "check": "psi", "max": 0.25, "blocking": False},
+            {"column": "area", "check": "psi", "max": 0.25, "blocking": False},
+            {"column": "district", "check": "psi", "max": 0.25, "blocking": False},
+            {"column": "city", "check": "psi", "max": 0.25, "blocking": False},
+        ]
+        # Rows per chunk of the data contract evaluation
+        self.data_contract_chunk_rows = int(os.getenv("DATA_CONTRACT_CHUNK_ROWS", 1_000_000))
+        # Replace the reference profile of the distribution shift rules with the data of this validation, if it passes
+        self.refresh_data_contract_reference = os.getenv("REFRESH_DATA_CONTRACT_REFERENCE", "false").lower() == "true"
+
+        # "local" joins the offline features with common.point_in_time, "feast" with the Feast offline store
+        self.feature_retrieval = os.getenv("FEATURE_RETRIEVAL", "local")
+        # The local retrieval joins no feature row more than feature_lookback_days older than its entity row, so it
+        # only reads the months of the entity window and the lookback before it. 0 leaves only the TTL of the views.
+        self.feature_lookback_days = int(os.getenv("FEATURE_LOOKBACK_DAYS", 365))
+
         self.mlflow_tracking_uri = os.getenv("MLFLOW_TRACKING_URI")
         self.experiment_name = "real_estate"
+        # Read the logged data of every trial back from the tracking server, which waits for its logs to be sent
+        self.fetch_logged_data = os.getenv("FETCH_LOGGED_DATA", "false").lower() == "true"
+
+        # Only the evaluation_top_k runs with the lowest validation loss are evaluated, all of them with 0.
+        # evaluation_workers models are loaded and scored at once.
+        self.evaluation_top_k = int(os.getenv("EVALUATION_TOP_K", 5))
+        self.evaluation_workers = int(os.getenv("EVALUATION_WORKERS", 4))
 
         self.search_space = {
             'max_depth': scope.int(hp.quniform('max_depth', 3, 10, 1)),
@@ -88,8 +145,28 @@ class Config:
             'eta': hp.uniform('eta', 0.01, 0.1),
             'gamma': hp.uniform('gamma', 0, 10),
             'subsample': hp.uniform('subsample', 0.1, 1),
-            'random_state': self.random_seed
+            'seed': self.random_seed
+        }
+        # Fixed parameters of the boosters. The hist tree method trains on the quantized DMatrix built once per
+        # search.
+        self.xgb_params = {
+            "objective": "reg:squarederror",
+            "eval_metric": "rmse",
+            "tree_method": "hist",
+            "max_bin": 256,
         }
+        # Boosting stops after early_stopping_rounds rounds without improvement on the validation split
+        self.num_boost_round = 1000
+        self.early_stopping_rounds = 20
+        # Successive halving: trials are compared after asha_min_rounds rounds, then after every
+        # asha_reduction_factor times more, and only the best 1/asha_reduction_factor of them keep boosting. 0 rounds
+        # turns it off.
+        self.asha_min_rounds = int(os.getenv("ASHA_MIN_ROUNDS", 30))
+        self.asha_reduction_factor = int(os.getenv("ASHA_REDUCTION_FACTOR", 3))
+        # tuning_workers trials run at once, sharing tuning_cpus cores
+        self.tuning_max_evals = int(os.getenv("TUNING_MAX_EVALS", 50))
+        self.tuning_workers = int(os.getenv("TUNING_WORKERS", min(4, os.cpu_count())))
+        self.tuning_cpus = int(os.getenv("TUNING_CPUS", os.cpu_count()))
         
         self.test_mae_threshold = float(os.getenv("TEST_MAE_THRESHOLD"))
         self.registered_model_name = os.environ.get("REGISTERED_MODEL_NAME")
@@ -113,21 +190,25 @@ class Log:
 
 
 class RunInfo:
-    def __init__(self, run_ids: list[str]) -> None:
+    def __init__(self, run_ids: list[str], losses: dict = None) -> None:
         self.path = AppPath.RUN_INFO
         self.run_ids = run_ids
+        # Validation loss of the runs, used to preselect the runs to evaluate
+        self.losses = losses or {}
 
     def save(self):
-        run_info = {"run_ids": self.run_ids}
+        run_info = {"run_ids": self.run_ids, "losses": self.losses}
         dump_json(run_info, self.path)
 
-    def append(self, run_id):
+    def append(self, run_id, loss=None):
         self.run_ids.append(run_id)
+        if loss is not None:
+            self.losses[run_id] = float(loss)
 
     @staticmethod
     def load(path):
         data = load_json(path)
-        run_info = RunInfo(data["run_ids"])
+        run_info = RunInfo(data["run_ids"], data.get("losses"))
 
         return run_info
 
@@ -175,23 +256,79 @@ def inspect_current_dir():
     inspect_dir(cwd)
 
 
-def read_parquet(path) -> pd.DataFrame:
+def read_parquet(path, columns=None, filters=None) -> pd.DataFrame:
     Log().log.info(f"Stared: read_parquet {path}")
-    df = pd.read_parquet(path, engine="fastparquet")
+    df = parquet_io.read_parquet(path, columns=columns, filters=filters)
     return df
 
 
 def to_parquet(df: pd.DataFrame, path):
     Log().log.info(f"Started: to_parquet {path}")
-    df.to_parquet(path, engine="fastparquet")
+    parquet_io.to_parquet(df, path)
+
+
+def read_artifact(path, columns=None) -> pd.DataFrame:
+    # Arrow IPC artifacts are memory-mapped, see common.feather_io
+    if Path(path).suffix == ".feather":
+        Log().log.info(f"Started: read_feather {path}")
+        return feather_io.read_feather(path, columns=columns)
+    return read_parquet(path, columns=columns)
+
+
+def artifact_io(path):
+    return feather_io if Path(path).suffix == ".feather" else parquet_io
+
+
+def read_artifact_schema(path) -> pa.Schema:
+    return artifact_io(path).read_schema(path)
+
+
+def artifact_num_rows(path) -> int:
+    return artifact_io(path).num_rows(path)
+
+
+def iter_artifact(path, chunk_rows: int, columns=None):
+    """DataFrames of chunk_rows rows of an artifact, with the dtypes of read_artifact, read one at a time."""
+    Log().log.info(f"Started: iter_artifact {path} in chunks of {chunk_rows} rows")
+    for batch in artifact_io(path).iter_batches(path, chunk_rows, columns=columns):
+        yield batch.to_pandas()
+
+
+def to_artifact(df: pd.DataFrame, path):
+    if Path(path).suffix == ".feather":
+        Log().log.info(f"Started: to_feather {path}")
+        feather_io.to_feather(df, path)
+        return
+    to_parquet(df, path)
+
+
+def get_historical_features(store, entity_df: pd.DataFrame, features: list, retrieval: str,
+                            lookback_days: int = 0) -> pd.DataFrame:
+    Log().log.info(f"Started: get_historical_features with {retrieval} retrieval")
+    if retrieval == "feast":
+        return store.get_historical_features(entity_df=entity_df, features=features).to_df()
+    return point_in_time.get_historical_features(store, entity_df, features,
+                                                 partition_col=AppConst.FEATURES_PARTITION_KEY,
+                                                 lookback=timedelta(days=lookback_days))
+
+
+def nullable_to_float(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast the nullable integer columns of df, such as the room counts, to float32 with NaN for missing values.
+
+    The models take them as floats: MLflow infers integer inputs from nullable integer columns, and pyfunc models
+    with integer inputs reject the missing values of the rows to predict.
+    """
+    columns = [column for column in df.columns
+               if pd.api.types.is_extension_array_dtype(df[column]) and pd.api.types.is_integer_dtype(df[column])]
+    return df.astype({column: np.float32 for column in columns})
 
 
 def train_test_to_parquet(X_train, X_test, y_train, y_test):
     Log().log.info(f"Started: train_test_to_parquet")
-    to_parquet(X_train, AppPath.TRAIN_X_PQ)
-    to_parquet(X_test, AppPath.TEST_X_PQ)
-    to_parquet(y_train, AppPath.TRAIN_Y_PQ)
-    to_parquet(y_test, AppPath.TEST_Y_PQ)
+    to_artifact(X_train, AppPath.TRAIN_X_PQ)
+    to_artifact(X_test, AppPath.TEST_X_PQ)
+    to_artifact(y_train, AppPath.TRAIN_Y_PQ)
+    to_artifact(y_test, AppPath.TEST_Y_PQ)
 
 
 def dump_json(dict_obj: dict, path):
@@ -217,12 +354,42 @@ def evaluate_metrics(actual, predict, prefix="train") -> dict:
     return metrics
 
 
+def evaluate_metrics_batch(actual, predictions: np.ndarray, prefix="test") -> list:
+    """The metrics of evaluate_metrics for every row of predictions, a (runs x rows) matrix, in one pass.
+
+    Returns:
+        list: One dict of metrics per run, with Python floats
+    """
+    Log().log.info(f"Started: evaluate_metrics_batch [{prefix}] of {len(predictions)} runs")
+    actual = np.asarray(actual, dtype=np.float64).reshape(1, -1)
+    errors = np.asarray(predictions, dtype=np.float64) - actual
+    squared_errors = np.square(errors)
+    mse = squared_errors.mean(axis=1)
+    mae = np.abs(errors).mean(axis=1)
+    r2 = 1 - squared_errors.sum(axis=1) / np.square(actual - actual.mean()).sum()
+    rmse = np.sqrt(mse)
+    return [
+        {f"{prefix}_r2_score": float(r2[i]), f"{prefix}_mae": float(mae[i]), f"{prefix}_mse": float(mse[i]),
+         f"{prefix}_rmse": float(rmse[i])}
+        for i in range(len(errors))
+    ]
+
+
 def load_data():
-    train_x = read_parquet(AppPath.TRAIN_X_PQ)
+    train_x = read_artifact(AppPath.TRAIN_X_PQ)
     Log().log.info(f"Loaded training features with shape {train_x.shape}")
-    train_y = read_parquet(AppPath.TRAIN_Y_PQ)
+    train_y = read_artifact(AppPath.TRAIN_Y_PQ)
     Log().log.info(f"Loaded training targets with shape {train_y.shape}")
 
     assert len(train_x.shape) == len(train_y.shape), "Lengths of train_x and train_y should be equal"
 
     return train_x, train_y
+
+
+def load_valid_data():
+    valid_x = read_artifact(AppPath.VALID_X_PQ)
+    Log().log.info(f"Loaded validation features with shape {valid_x.shape}")
+    valid_y = read_artifact(AppPath.VALID_Y_PQ)
+    Log().log.info(f"Loaded validation targets with shape {valid_y.shape}")
+
+    return valid_x, valid_y
@@ -1,10 +1,11 @@
 from feast import FileSource
 
-properties_parquet_file = "../data_sources/features.parquet"
+# Directory of Parquet files partitioned by the month of date_posted, e.g. features/month=2023-01/part-0.parquet
+properties_dataset_dir = "../data_sources/features"
 
 properties_source = FileSource(
     name="properties_source",
-    path=properties_parquet_file,
+    path=properties_dataset_dir,
     timestamp_field="date_posted"
 )
 
@@ -1,7 +1,7 @@
 from datetime import timedelta
 
 from feast import FeatureView, Field
-from feast.types import Float64, String
+from feast.types import Float32, Int32, String
 
 import pandas as pd
 
@@ -13,11 +13,11 @@ properties_fv = FeatureView(
     entities=[properties_entity],
     ttl=timedelta(days=36500),
     schema=[
-        Field(name="area", dtype=Float64, description="Area of the property"),
-        Field(name="width", dtype=Float64, description="Width of the property"),
-        Field(name="length", dtype=Float64, description="Length of the property"),
-        Field(name="num_bedrooms", dtype=Float64, description="Number of bedrooms in the property"),
-        Field(name="num_bathrooms", dtype=Float64, description="Number of bathrooms in the property"),
+        Field(name="area", dtype=Float32, description="Area of the property"),
+        Field(name="width", dtype=Float32, description="Width of the property"),
+        Field(name="length", dtype=Float32, description="Length of the property"),
+        Field(name="num_bedrooms", dtype=Int32, description="Number of bedrooms in the property"),
+        Field(name="num_bathrooms", dtype=Int32, description="Number of bathrooms in the property"),
         Field(name="district", dtype=String, description="The property located district name"),
         Field(name="city", dtype=String, description="The property located city name"),
         Field(name="legal_document", dtype=String, description="The legal document of the property"),